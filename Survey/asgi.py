@@ -0,0 +1,20 @@
+"""
+ASGI config for Survey project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Django 2.2 has no ASGI support, so the WSGI application is wrapped by surveyAPI.asgi.ASGIHandler,
+which serves cached public survey responses on the event loop and runs other requests in a thread pool.
+Run it with any ASGI server, e.g. ``uvicorn Survey.asgi:application``.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Survey.settings')
+
+django_application = get_wsgi_application()
+
+from surveyAPI.asgi import ASGIHandler  # noqa: E402 (needs configured settings)
+
+application = ASGIHandler(django_application)
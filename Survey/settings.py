@@ -35,13 +35,16 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'admin',
-    'surveyAPI',
+    'admin.apps.AdminConfig',
+    'surveyAPI.apps.SurveyapiConfig',
     'rest_framework',
     'rest_framework.authtoken'
 ]
 
 MIDDLEWARE = [
+    'surveyAPI.instrumentation.InstrumentationMiddleware',
+    'surveyAPI.compression.CompressionMiddleware',
+    'surveyAPI.routing.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,6 +90,11 @@ DATABASES = {
     }
 }
 
+# Completed surveys go to the shard of their user (see SURVEY_SHARDING), other reads of GET, HEAD and OPTIONS
+# requests go to the replicas (round-robin), everything else to 'default'.
+# Add replica aliases to DATABASES and list them in SURVEY_DATABASE_ROUTING["REPLICAS"]
+DATABASE_ROUTERS = ['surveyAPI.sharding.ShardRouter', 'surveyAPI.routing.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -127,9 +135,100 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 REST_FRAMEWORK = {
+    # TokenAuthentication that caches token users for SURVEY_TOKEN_CACHE_TIMEOUT seconds (see admin/authentication.py)
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
-    )
+        'admin.authentication.CachedTokenAuthentication',
+    ),
+    # Fast JSON renderer and parser (see surveyAPI/renderers.py) use orjson if it is installed,
+    # replace them with rest_framework.renderers.JSONRenderer and rest_framework.parsers.JSONParser to opt out
+    'DEFAULT_RENDERER_CLASSES': (
+        'surveyAPI.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'surveyAPI.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 APPEND_SLASH = False
+
+# Cache of serialized surveys (see surveyAPI/cache.py). Keys include survey versions read from the database,
+# so a change made by any process is seen by all of them at once, with or without the shared tier.
+# BACKEND is an alias from CACHES used as a shared tier behind the in-process LRU tier, None disables it
+SURVEY_CACHE = {
+    "LOCAL_SIZE": 256,
+    "BACKEND": None,
+    "TIMEOUT": 60 * 60,
+}
+
+# Seconds a token user is cached by admin.authentication.CachedTokenAuthentication, 0 disables the cache.
+# Token and user changes drop the entry at once in this process (and in the shared cache, if SURVEY_CACHE["BACKEND"]
+# is set), other processes without a shared cache see them after at most this time
+SURVEY_TOKEN_CACHE_TIMEOUT = 60
+
+# Maximum number of completions accepted by POST /api/surveys/completions
+SURVEY_BATCH_MAX_SIZE = 1000
+
+# If True, POST /api/surveys/<id> only validates answers and queues them (202 with a receipt),
+# the queue is written by the "process_completions" management command
+SURVEY_ASYNC_COMPLETION = False
+
+# Default and maximum page sizes of /api/surveys/ and /api/completed-surveys/<user id>
+SURVEY_PAGE_SIZE = 100
+SURVEY_MAX_PAGE_SIZE = 1000
+
+# If True, read-only survey and completed survey payloads are built by plain functions
+# (see surveyAPI/representations.py) instead of DRF serializers. The output is the same
+SURVEY_FAST_SERIALIZERS = True
+
+# Response compression (see surveyAPI/compression.py). Survey list pages and surveys are kept in the cache
+# already gzip- (and brotli-, if the "brotli" package is installed) compressed and sent as is to clients
+# that accept it. Other responses of at least MIN_SIZE bytes are compressed on the fly by the middleware
+SURVEY_COMPRESSION = {
+    "ENABLED": True,
+    "MIN_SIZE": 1024,
+    "GZIP_LEVEL": 6,
+    "BROTLI_QUALITY": 5,
+}
+
+# Read replicas (aliases from DATABASES) used by surveyAPI.routing.ReplicaRouter, empty list disables them.
+# For READ_YOUR_WRITES seconds after a survey change reads go to 'default' (so replica lag cannot get into the cache),
+# as do reads of a user's completed surveys after their completion. Set SURVEY_CACHE["BACKEND"] with several
+# processes, so that all of them see these marks
+SURVEY_DATABASE_ROUTING = {
+    "REPLICAS": [],
+    "READ_YOUR_WRITES": 5,
+}
+
+# Aliases from DATABASES that store completed surveys (UserAnswersHolder and UserAnswer), chosen by a hash
+# of user_ID (see surveyAPI/sharding.py). Empty list keeps them in 'default'. Every shard needs all migrations.
+# On MySQL set auto_increment_increment to the number of shards and a distinct auto_increment_offset on each,
+# so that completion ids are unique across shards. Results are recounted on WORKERS threads (one per shard if None)
+SURVEY_SHARDING = {
+    "SHARDS": [],
+    "WORKERS": None,
+}
+
+# ASGI entry point Survey/asgi.py (see surveyAPI/asgi.py). Survey list pages and surveys are served from
+# the memory of the process on the event loop while their version is unchanged (FAST_PATH, at most CACHE_SIZE
+# responses), other requests run the WSGI application on WORKERS threads, which also bounds database connections.
+# The version of a kept response is read from the database on a worker thread at most once per VERSION_TTL seconds,
+# so changes made by other processes are served after at most this time (0 checks it on every request)
+SURVEY_ASGI = {
+    "WORKERS": 16,
+    "FAST_PATH": True,
+    "CACHE_SIZE": 1024,
+    "VERSION_TTL": 1,
+}
+
+# Per-endpoint request stats (see surveyAPI/instrumentation.py), exposed by /api/admin/stats/ and
+# "manage.py request_stats". When disabled the middleware removes itself at startup.
+# Requests slower than SLOW_REQUEST_MS are logged to "surveyAPI.instrumentation" with their SQL
+SURVEY_INSTRUMENTATION = {
+    "ENABLED": False,
+    "SLOW_REQUEST_MS": 500,
+    "SAMPLE_SIZE": 1000,
+    "PUBLISH_INTERVAL": 10,
+}
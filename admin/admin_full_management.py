@@ -1,26 +1,61 @@
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.generics import get_object_or_404
-from rest_framework import viewsets
-from rest_framework.status import HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN, HTTP_400_BAD_REQUEST
+from rest_framework.status import HTTP_400_BAD_REQUEST
 
+from surveyAPI.versions import touch_survey
 from surveyAPI.models import Survey, Question, QuestionAnswer
+from surveyAPI.export import EXPORT_FORMATS, export_responses
+from surveyAPI.instrumentation import serializer_timer
+from surveyAPI.pagination import paginate_queryset
+from surveyAPI.queries import with_questions, with_question_answers
+from surveyAPI.results import get_survey_results
 from surveyAPI.serializers import SurveySerializer, QuestionSerializer, QuestionAnswerSerializer,\
     QuestionAnswerSerializerWithSpecifiedQuestion, QuestionSerializerWithSpecifiedSurvey
+from surveyAPI.transfer import export_surveys, import_surveys
+
+from .permissions import AdminViewSet
 
 from abc import ABC, abstractmethod
 
 
+def lookup_field(model, lookup):
+    """
+    :param model: модель, к которой применяется фильтр
+    :param lookup: фильтр в формате QuerySet.filter (например, "question__survey" или "start_date__gte")
+    :return: поле модели, значение которого сравнивается в фильтре
+    """
+    field = None
+    for part in lookup.split("__"):
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            break
+        if field.is_relation:
+            model = field.related_model
+    return field
+
+
 class FullManagementView(ABC):
     """Абстрактный класс FullManagementView
 
     Описывает все необходимые методы, для осуществления полного контроля над базой данных.
-    Для использования необходимо создать класс-наследник, переопределяющий target, target_serializer и target_string
+    Для использования необходимо создать класс-наследник, переопределяющий target, target_serializer и target_string.
+    Наследники также наследуют AdminViewSet, который проверяет права доступа до вызова методов
 
     Necessary properties:
         target: target model for control
         target_serializer: serializer for target model
         target_string: string that represents target model
+
+    Optional properties:
+        list_filters: query parameters of list, {parameter: lookup}
+        ordering_fields: fields allowed in the ordering query parameter of list
     """
+    list_filters = {}
+    ordering_fields = ("id",)
 
     @property
     @abstractmethod
@@ -37,22 +72,98 @@ class FullManagementView(ABC):
     def target_string(self):
         pass
 
+    @abstractmethod
+    def get_survey_id(self, obj):
+        """
+        Возвращает id опроса, к которому относится объект. Используется для инвалидации кэша
+        :param obj: объект типа target
+        :return: id опроса
+        """
+        pass
+
+    def prepare_objects(self, objects, fields=None):
+        """
+        Подготавливает список объектов к сериализации (например, подгружает вложенные объекты).
+        Переопределяется наследниками, сериализующими вложенные структуры
+        :param objects: QuerySet объектов типа target
+        :param fields: сериализуемые поля. Если None, все поля target_serializer
+        :return: QuerySet, готовый к сериализации через target_serializer
+        """
+        return objects
+
+    def filter_objects(self, request, objects):
+        """
+        Применяет к objects фильтры из list_filters, переданные в параметрах запроса
+        :raises: ValidationError (HTTP 400), если значение фильтра некорректно
+        :param request: запрос
+        :param objects: QuerySet объектов типа target
+        :return: отфильтрованный QuerySet
+        """
+        for param, lookup in self.list_filters.items():
+            value = request.query_params.get(param, None)
+            if value is None:
+                continue
+            try:
+                value = lookup_field(self.target, lookup).to_python(value)
+            except DjangoValidationError:
+                raise ValidationError("Incorrect {}!".format(param))
+            objects = objects.filter(**{lookup: value})
+        return objects
+
+    def get_ordering(self, request):
+        """
+        :raises: ValidationError (HTTP 400), если поле не входит в ordering_fields
+        :param request: запрос
+        :return: поле сортировки из параметра ordering ("-" перед полем - по убыванию), по умолчанию id
+        """
+        ordering = request.query_params.get("ordering", "id")
+        if (ordering[1:] if ordering.startswith("-") else ordering) not in self.ordering_fields:
+            raise ValidationError("Incorrect ordering!")
+        return ordering
+
+    def get_fields(self, request):
+        """
+        :raises: ValidationError (HTTP 400), если среди полей есть отсутствующие в target_serializer
+        :param request: запрос
+        :return: список полей из параметра fields (через запятую) или None, если нужны все поля
+        """
+        fields = request.query_params.get("fields", None)
+        if not fields:
+            return None
+        fields = fields.split(",")
+        if not set(fields) <= set(self.target_serializer().fields):
+            raise ValidationError("Incorrect fields!")
+        return fields
+
     def list(self, request, objects=None):
         """
-        Сериализует список всех объектов типа target при objects=None,
-        иначе сериализует список всех объектов из objects.
+        Сериализует страницу объектов типа target при objects=None, иначе страницу объектов из objects.
+        Фильтрация, сортировка и пагинация выполняются в базе данных, поэтому время ответа зависит
+        от размера страницы, а не от количества объектов.
+        Параметры запроса: фильтры из list_filters, ordering - поле из ordering_fields, fields - сериализуемые
+        поля через запятую (незапрошенные поля не читаются из базы данных, вложенные объекты не подгружаются),
+        limit - размер страницы, cursor - значение next из предыдущей страницы
+        :raises: ValidationError (HTTP 400), если параметры некорректны
         :param request: запрос
         :param objects: список объектов. None, если требуется получить все объекты типа target
-        :return: ответ на запрос, содержащий сериализованный список объектов
+        :return: ответ на запрос, содержащий сериализованный список объектов и курсор следующей страницы
         """
-        if not request.user.is_authenticated:
-            return Response({"You are not authorized!"}, status=HTTP_401_UNAUTHORIZED)
-        if not request.user.is_superuser and not request.user.is_staff:
-            return Response({"You are not allowed to add new surveys!"}, status=HTTP_403_FORBIDDEN)
         if objects is None:
             objects = self.target.objects.all()
-        serializer = self.target_serializer(objects, many=True)
-        return Response({self.target_string.lower() + "s": serializer.data})
+        ordering = self.get_ordering(request)
+        fields = self.get_fields(request)
+        objects = self.filter_objects(request, objects)
+        serializer = self.target_serializer(many=True)
+        if fields is not None:
+            for name in set(serializer.child.fields) - set(fields):
+                serializer.child.fields.pop(name)
+            columns = {field.name for field in self.target._meta.concrete_fields}
+            objects = objects.only(*(columns & {*fields, ordering.lstrip("-")}))
+        objects, next_cursor = paginate_queryset(self.prepare_objects(objects, fields), request, ordering)
+        serializer.instance = objects
+        with serializer_timer():
+            data = serializer.data
+        return Response({self.target_string.lower() + "s": data, "next": next_cursor})
 
     def retrieve(self, request, pk, objects=None):
         """
@@ -63,15 +174,12 @@ class FullManagementView(ABC):
         :param objects: список, в котором происходит поиск. Если None, поиск идет по всем объектам
         :return: ответ на запрос, содержащий сериализованный объект
         """
-        if not request.user.is_authenticated:
-            return Response({"You are not authorized!"}, status=HTTP_401_UNAUTHORIZED)
-        if not request.user.is_superuser and not request.user.is_staff:
-            return Response({"You are not allowed to add new surveys!"}, status=HTTP_403_FORBIDDEN)
         if objects is None:
             objects = self.target.objects.all()
-        obj = get_object_or_404(objects, pk=pk)
-        serializer = self.target_serializer(instance=obj)
-        return Response({self.target_string.lower(): serializer.data})
+        obj = get_object_or_404(self.prepare_objects(objects), pk=pk)
+        with serializer_timer():
+            data = self.target_serializer(instance=obj).data
+        return Response({self.target_string.lower(): data})
 
     def create(self, request, serializer=None):
         """
@@ -80,10 +188,6 @@ class FullManagementView(ABC):
         :param serializer: необходимый сериализатор. Если None, то используется target_serializer
         :return: ответ на запрос, содержащий информацию о ходе выполнения действия
         """
-        if not request.user.is_authenticated:
-            return Response({"You are not authorized!"}, status=HTTP_401_UNAUTHORIZED)
-        if not request.user.is_superuser and not request.user.is_staff:
-            return Response({"You are not allowed to add new surveys!"}, status=HTTP_403_FORBIDDEN)
         if serializer is None:
             serializer = self.target_serializer
         data = request.data.get(self.target_string.lower(), None)
@@ -95,16 +199,13 @@ class FullManagementView(ABC):
 
     def update(self, request, pk, objects=None):
         """
-        Обновляет поля объекта с id равным pk присланной информацией
+        Обновляет поля объекта с id равным pk присланной информацией.
+        Если сериализатор сообщает о сделанных изменениях (changes), они возвращаются в ответе
         :param request: запрос
         :param pk: id объекта
         :param objects: список, в котором происходит поиск объекта. Если None, поиск идет по всем объектам
         :return: ответ на запрос, содержащий информацию о ходе выполнения действия
         """
-        if not request.user.is_authenticated:
-            return Response({"You are not authorized!"}, status=HTTP_401_UNAUTHORIZED)
-        if not request.user.is_superuser and not request.user.is_staff:
-            return Response({"You are not allowed to add new surveys!"}, status=HTTP_403_FORBIDDEN)
         if objects is None:
             objects = self.target.objects.all()
         obj = get_object_or_404(objects, pk=pk)
@@ -112,7 +213,10 @@ class FullManagementView(ABC):
         serializer = self.target_serializer(instance=obj, data=data, partial=True)
         if serializer.is_valid(raise_exception=True):
             obj = serializer.save()
-            return Response({self.target_string.capitalize() + " ({}) was updated".format(obj.id)})
+            message = self.target_string.capitalize() + " ({}) was updated".format(obj.id)
+            if hasattr(serializer, "changes"):
+                return Response({"detail": message, "changes": serializer.changes})
+            return Response({message})
         return Response({"Incorrect data!"}, status=HTTP_400_BAD_REQUEST)
 
     def remove(self, request, pk, objects=None):
@@ -123,18 +227,16 @@ class FullManagementView(ABC):
         :param objects: список, в котором происходит поиск объекта. Если None, поиск идет по всем объектам
         :return: ответ на запрос, содержащий информацию о ходе выполнения действия
         """
-        if not request.user.is_authenticated:
-            return Response({"You are not authorized!"}, status=HTTP_401_UNAUTHORIZED)
-        if not request.user.is_superuser and not request.user.is_staff:
-            return Response({"You are not allowed to add new surveys!"}, status=HTTP_403_FORBIDDEN)
         if objects is None:
             objects = self.target.objects.all()
         obj = get_object_or_404(objects, pk=pk)
+        survey_id = self.get_survey_id(obj)
         obj.delete()
+        touch_survey(survey_id)
         return Response({self.target_string.capitalize() + " ({}) was deleted".format(pk)})
 
 
-class SurveyView(viewsets.ViewSet, FullManagementView):
+class SurveyView(AdminViewSet, FullManagementView):
     """
 
     """
@@ -147,13 +249,86 @@ class SurveyView(viewsets.ViewSet, FullManagementView):
     def target_serializer(self):
         return SurveySerializer
 
+    list_filters = {
+        "title": "title__istartswith",
+        "start_date_from": "start_date__gte",
+        "start_date_to": "start_date__lte",
+        "end_date_from": "end_date__gte",
+        "end_date_to": "end_date__lte",
+    }
+    ordering_fields = ("id", "title", "start_date", "end_date")
+
     @property
     def target_string(self):
         return "survey"
 
+    def get_survey_id(self, obj):
+        return obj.id
+
+    def prepare_objects(self, objects, fields=None):
+        if fields is not None and "questions" not in fields:
+            return objects
+        return with_questions(objects)
+
     def retrieve(self, request, survey_pk, objects=None):
         return super().retrieve(request, survey_pk)
 
+    @staticmethod
+    def results(request, survey_pk):
+        """
+        Возвращает результаты опроса: количество прохождений, количество ответов на каждый вопрос
+        и количество и процент выборов каждого варианта ответа
+        :param request: запрос
+        :param survey_pk: id опроса
+        :return: ответ на запрос, содержащий результаты опроса
+        """
+        survey = get_object_or_404(Survey.objects.all(), pk=survey_pk)
+        return Response({"results": get_survey_results(survey)})
+
+    @staticmethod
+    def export(request, survey_pk):
+        """
+        Выгружает ответы на опрос потоком (память сервера не зависит от количества прохождений).
+        Параметр запроса type - формат выгрузки: csv (по умолчанию) или ndjson
+        :param request: запрос
+        :param survey_pk: id опроса
+        :return: потоковый ответ, содержащий по строке на каждое прохождение опроса
+        """
+        survey = get_object_or_404(Survey.objects.all(), pk=survey_pk)
+        export_format = request.query_params.get("type", "csv")
+        if export_format not in EXPORT_FORMATS:
+            return Response({"Export type should be one of: " + ", ".join(EXPORT_FORMATS)}, status=HTTP_400_BAD_REQUEST)
+        content_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+        response = StreamingHttpResponse(export_responses(survey.id, export_format), content_type=content_type)
+        response["Content-Disposition"] = 'attachment; filename="survey_{}.{}"'.format(survey.id, export_format)
+        return response
+
+    def export_all(self, request):
+        """
+        Выгружает опросы потоком в формате JSONL: строка на опрос в формате Examples/create_survey.json,
+        которую принимает import_all. Параметры запроса - фильтры из list_filters
+        :raises: ValidationError (HTTP 400), если значение фильтра некорректно
+        :param request: запрос
+        :return: потоковый ответ, содержащий по строке на каждый опрос
+        """
+        surveys = self.filter_objects(request, Survey.objects.all())
+        response = StreamingHttpResponse(export_surveys(surveys), content_type="application/x-ndjson")
+        response["Content-Disposition"] = 'attachment; filename="surveys.jsonl"'
+        return response
+
+    @staticmethod
+    def import_all(request):
+        """
+        Импортирует опросы из тела запроса в формате JSONL (см. export_all), читая его потоком.
+        Опросы проверяются и сохраняются порциями, некорректные строки пропускаются (см. transfer.import_surveys)
+        :param request: запрос
+        :return: ответ на запрос, содержащий количество созданных опросов, ошибки по номерам строк
+        и скорость импорта. HTTP 400, если не создано ни одного опроса
+        """
+        report = import_surveys(request.stream or ())
+        status = 201 if report["imported"] else HTTP_400_BAD_REQUEST
+        return Response(report, status=status)
+
     def create(self, request, serializer=None):
         return super().create(request)
 
@@ -164,7 +339,14 @@ class SurveyView(viewsets.ViewSet, FullManagementView):
         return super().remove(request, survey_pk)
 
 
-class QuestionView(viewsets.ViewSet, FullManagementView):
+class QuestionView(AdminViewSet, FullManagementView):
+    list_filters = {
+        "survey": "survey",
+        "question_type": "question_type",
+        "text": "text__istartswith",
+    }
+    ordering_fields = ("id", "survey", "text")
+
     @property
     def target(self):
         return Question
@@ -177,6 +359,14 @@ class QuestionView(viewsets.ViewSet, FullManagementView):
     def target_string(self):
         return "question"
 
+    def get_survey_id(self, obj):
+        return obj.survey_id
+
+    def prepare_objects(self, objects, fields=None):
+        if fields is not None and "question_answers" not in fields:
+            return objects
+        return with_question_answers(objects)
+
     @staticmethod
     def get_objects(survey_pk):
         if survey_pk is None:
@@ -203,7 +393,14 @@ class QuestionView(viewsets.ViewSet, FullManagementView):
         return super().remove(request, question_pk, self.get_objects(survey_pk))
 
 
-class QuestionAnswerView(viewsets.ViewSet, FullManagementView):
+class QuestionAnswerView(AdminViewSet, FullManagementView):
+    list_filters = {
+        "survey": "question__survey",
+        "question": "question",
+        "text": "text__istartswith",
+    }
+    ordering_fields = ("id", "question", "text")
+
     @property
     def target(self):
         return QuestionAnswer
@@ -216,6 +413,9 @@ class QuestionAnswerView(viewsets.ViewSet, FullManagementView):
     def target_string(self):
         return "question_answer"
 
+    def get_survey_id(self, obj):
+        return obj.question.survey_id
+
     @staticmethod
     def get_objects(survey_pk=None, question_pk=None):
         if survey_pk is None and question_pk is None:
@@ -1,5 +1,15 @@
 from django.apps import AppConfig
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
 
 
 class AdminConfig(AppConfig):
     name = 'admin'
+
+    def ready(self):
+        from rest_framework.authtoken.models import Token
+        from .authentication import token_changed, user_changed
+
+        post_save.connect(token_changed, sender=Token, dispatch_uid="admin.authentication.token_saved")
+        post_delete.connect(token_changed, sender=Token, dispatch_uid="admin.authentication.token_deleted")
+        post_save.connect(user_changed, sender=get_user_model(), dispatch_uid="admin.authentication.user_saved")
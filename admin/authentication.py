@@ -0,0 +1,57 @@
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from surveyAPI import cache
+
+import copy
+import hashlib
+import time
+
+
+def token_key(key):
+    return "auth:token:{}".format(hashlib.sha256(key.encode()).hexdigest())
+
+
+def invalidate_token(key):
+    """
+    Удаляет закэшированного пользователя токена. Процессы без общего кэша увидят изменение
+    не позднее чем через settings.SURVEY_TOKEN_CACHE_TIMEOUT секунд
+    :param key: токен
+    """
+    cache.delete(token_key(key))
+
+
+def token_changed(sender, instance, **kwargs):
+    """
+    Обработчик post_save и post_delete для Token
+    """
+    invalidate_token(instance.key)
+
+
+def user_changed(sender, instance, **kwargs):
+    """
+    Обработчик post_save для пользователя: права или активность пользователя могли измениться
+    """
+    for key in Token.objects.all().filter(user_id=instance.pk).values_list("key", flat=True):
+        invalidate_token(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, кэширующая пользователя токена на settings.SURVEY_TOKEN_CACHE_TIMEOUT секунд,
+    поэтому повторные запросы с тем же токеном не обращаются к базе данных.
+    Запись удаляется при изменении или удалении токена и при изменении пользователя (см. AdminConfig.ready).
+    Неверные токены не кэшируются
+    """
+    def authenticate_credentials(self, key):
+        cache_key = token_key(key)
+        entry = cache.get(cache_key)
+        if entry is not None and entry[0] > time.time():
+            _, user, token = entry
+            return copy.copy(user), token
+        user, token = super().authenticate_credentials(key)
+        timeout = settings.SURVEY_TOKEN_CACHE_TIMEOUT
+        if timeout:
+            cache.set(cache_key, (time.time() + timeout, user, token), timeout)
+        return user, token
@@ -0,0 +1,27 @@
+from rest_framework import viewsets
+from rest_framework.exceptions import NotAuthenticated, PermissionDenied
+from rest_framework.permissions import BasePermission
+
+
+class IsStaffOrSuperuser(BasePermission):
+    """
+    Разрешает доступ только аутентифицированным сотрудникам и суперпользователям
+    """
+    message = "You are not allowed to add new surveys!"
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and (user.is_superuser or user.is_staff))
+
+
+class AdminViewSet(viewsets.ViewSet):
+    """
+    ViewSet администраторского API. Проверяет права через IsStaffOrSuperuser до вызова метода
+    и отвечает на отказ как прежде: 401 "You are not authorized!" или 403 "You are not allowed to add new surveys!"
+    """
+    permission_classes = (IsStaffOrSuperuser,)
+
+    def permission_denied(self, request, message=None, code=None):
+        if not request.user.is_authenticated:
+            raise NotAuthenticated(["You are not authorized!"])
+        raise PermissionDenied([message])
@@ -0,0 +1,397 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from surveyAPI import cache
+from surveyAPI.instrumentation import registry
+from surveyAPI.models import Survey, UserAnswer
+from surveyAPI.tests import create_survey, answers_payload
+
+from unittest import mock
+import csv
+import io
+import json
+import os
+import tempfile
+import time
+
+
+class AdminTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("admin", password="password", is_staff=True)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.create(user=self.user).key)
+
+    def count_queries(self, path):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+
+class AdminReadQueriesTest(AdminTestCase):
+    def setUp(self):
+        super().setUp()
+        # Пользователь токена кэшируется первым запросом, дальше считаются только запросы самого эндпоинта
+        self.client.get("/api/admin/surveys/")
+
+    def test_surveys_list_query_count_does_not_depend_on_survey_size(self):
+        create_survey(questions_count=1, choices_count=1)
+        small = self.count_queries("/api/admin/surveys/")
+        for _ in range(5):
+            create_survey(questions_count=5, choices_count=4)
+        self.assertEqual(self.count_queries("/api/admin/surveys/"), small)
+
+    def test_questions_list_query_count_does_not_depend_on_question_count(self):
+        survey = create_survey(questions_count=1, choices_count=1)
+        small = self.count_queries("/api/admin/surveys/{}/questions/".format(survey.id))
+        survey = create_survey(questions_count=10, choices_count=5)
+        self.assertEqual(self.count_queries("/api/admin/surveys/{}/questions/".format(survey.id)), small)
+
+
+class AdminCacheInvalidationTest(AdminTestCase):
+    def test_remove_invalidates_cached_survey(self):
+        survey = create_survey()
+        question = survey.questions.filter(question_type="SC").first()
+        self.assertEqual(self.client.get("/api/surveys/{}".format(survey.id)).status_code, 200)
+
+        self.client.delete("/api/admin/questions/{}".format(question.id))
+        questions = self.client.get("/api/surveys/{}".format(survey.id)).data["survey"]["questions"]
+        self.assertNotIn(question.id, [question["id"] for question in questions])
+
+        self.client.delete("/api/admin/surveys/{}".format(survey.id))
+        self.assertEqual(self.client.get("/api/surveys/{}".format(survey.id)).status_code, 404)
+        self.assertEqual(self.client.get("/api/surveys/").data["surveys"], [])
+
+    def test_create_question_answer_invalidates_cached_survey(self):
+        survey = create_survey()
+        question = survey.questions.filter(question_type="SC").first()
+        self.client.get("/api/surveys/{}".format(survey.id))
+
+        self.client.post("/api/admin/questions/{}/questions-answers/".format(question.id),
+                         {"question_answer": {"text": "Added"}}, format="json")
+        questions = self.client.get("/api/surveys/{}".format(survey.id)).data["survey"]["questions"]
+        choices = [choice["text"] for question in questions for choice in question["question_answers"]]
+        self.assertIn("Added", choices)
+
+
+class SurveyResultsTest(AdminTestCase):
+    def test_results(self):
+        survey = create_survey(questions_count=1, choices_count=2)
+        for user_id in range(4):
+            payload = answers_payload(survey, user_id)
+            if user_id == 0:
+                for answer in payload["user_answers"]["answers"]:
+                    if answer["answer"] == "Choice 0":
+                        answer["answer"] = "Choice 1"
+            self.client.post("/api/surveys/{}".format(survey.id), payload, format="json")
+
+        with self.assertNumQueries(6):
+            results = self.client.get("/api/admin/surveys/{}/results".format(survey.id)).data["results"]
+        self.assertEqual(results["respondents"], 4)
+        by_type = {question["question_type"]: question for question in results["questions"]}
+        self.assertEqual(by_type["PT"]["count"], 4)
+        self.assertEqual(by_type["PT"]["choices"], [])
+        self.assertEqual([(choice["count"], choice["percentage"]) for choice in by_type["SC"]["choices"]],
+                         [(3, 75.0), (1, 25.0)])
+        self.assertEqual([choice["count"] for choice in by_type["MC"]["choices"]], [3, 4])
+
+    def test_results_require_staff(self):
+        survey = create_survey()
+        self.assertEqual(APIClient().get("/api/admin/surveys/{}/results".format(survey.id)).status_code, 401)
+        self.assertEqual(self.client.get("/api/admin/surveys/0/results").status_code, 404)
+
+
+class ExportTest(AdminTestCase):
+    def setUp(self):
+        super().setUp()
+        self.survey = create_survey(questions_count=1, choices_count=2)
+        for user_id in (5, 6):
+            self.client.post("/api/surveys/{}".format(self.survey.id), answers_payload(self.survey, user_id),
+                             format="json")
+
+    def export(self, export_type=None):
+        params = {"type": export_type} if export_type else {}
+        response = self.client.get("/api/admin/surveys/{}/export".format(self.survey.id), params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_export(self):
+        rows = list(csv.reader(io.StringIO(self.export())))
+        questions = list(self.survey.questions.order_by("id"))
+        self.assertEqual(rows[0], ["id", "user_ID"] + ["{}: {}".format(question.id, question.text)
+                                                       for question in questions])
+        self.assertEqual([row[1] for row in rows[1:]], ["5", "6"])
+        self.assertEqual(rows[1][2:], ["text", "Choice 0", "Choice 0; Choice 1"])
+
+    def test_ndjson_export(self):
+        lines = [json.loads(line) for line in self.export("ndjson").splitlines()]
+        self.assertEqual([line["user_ID"] for line in lines], [5, 6])
+        self.assertEqual(sorted(lines[0]["answers"].values(), key=str), ["Choice 0", ["Choice 0", "Choice 1"], "text"])
+
+    def test_incorrect_export_type(self):
+        response = self.client.get("/api/admin/surveys/{}/export".format(self.survey.id), {"type": "xml"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ReconcilingUpdateTest(AdminTestCase):
+    def survey_payload(self, survey):
+        return {"survey": {"questions": [
+            {"id": question.id, "text": question.text, "question_type": question.question_type,
+             "question_answers": [{"id": choice.id, "text": choice.text}
+                                  for choice in question.question_answers.order_by("id")]}
+            for question in survey.questions.order_by("id")
+        ]}}
+
+    def put(self, path, payload):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.put(path, payload, format="json")
+        writes = [query["sql"] for query in context.captured_queries
+                  if query["sql"].split()[0] in ("INSERT", "UPDATE", "DELETE")]
+        return response, writes
+
+    def test_editing_one_choice_updates_one_row(self):
+        survey = create_survey(questions_count=30, choices_count=4)
+        payload = self.survey_payload(survey)
+        payload["survey"]["questions"][1]["question_answers"][0]["text"] = "Fixed typo"
+
+        response, writes = self.put("/api/admin/surveys/{}".format(survey.id), payload)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([sql for sql in writes if "surveyAPI_questionanswer" in sql]), 1)
+        self.assertEqual(len(writes), 2)
+        self.assertEqual(Survey.objects.get(pk=survey.id).version, survey.version + 1)
+        self.assertEqual(response.data["changes"]["question_answers"], {"created": 0, "updated": 1, "deleted": 0})
+        self.assertEqual(response.data["changes"]["questions"], {"created": 0, "updated": 0, "deleted": 0})
+
+    def test_unchanged_payload_writes_nothing_and_keeps_cache(self):
+        survey = create_survey()
+        self.client.get("/api/surveys/{}".format(survey.id))
+
+        response, writes = self.put("/api/admin/surveys/{}".format(survey.id), self.survey_payload(survey))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(writes, [])
+        self.assertEqual(Survey.objects.get(pk=survey.id).version, survey.version)
+        with self.assertNumQueries(1):
+            self.client.get("/api/surveys/{}".format(survey.id))
+
+    def test_existing_answers_survive_update(self):
+        survey = create_survey()
+        self.client.post("/api/surveys/{}/complete".format(survey.id), answers_payload(survey), format="json")
+        answers_count = UserAnswer.objects.filter(user_answers_holder__survey=survey).count()
+        payload = self.survey_payload(survey)
+        payload["survey"]["title"] = "New title"
+        payload["survey"]["questions"][0]["text"] = "New text"
+
+        response = self.client.put("/api/admin/surveys/{}".format(survey.id), payload, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["changes"]["fields"], ["title"])
+        self.assertEqual(UserAnswer.objects.filter(user_answers_holder__survey=survey).count(), answers_count)
+
+    def test_create_and_delete(self):
+        survey = create_survey(questions_count=1, choices_count=3)
+        payload = self.survey_payload(survey)
+        removed = payload["survey"]["questions"].pop()
+        payload["survey"]["questions"][1]["question_answers"].pop()
+        payload["survey"]["questions"][1]["question_answers"].append({"text": "New choice"})
+        payload["survey"]["questions"].append({"text": "New question", "question_type": "SC",
+                                               "question_answers": [{"text": "A"}, {"text": "B"}]})
+
+        response = self.client.put("/api/admin/surveys/{}".format(survey.id), payload, format="json")
+        self.assertEqual(response.data["changes"]["questions"], {"created": 1, "updated": 0, "deleted": 1})
+        self.assertEqual(response.data["changes"]["question_answers"], {"created": 3, "updated": 0, "deleted": 1})
+        self.assertFalse(survey.questions.filter(id=removed["id"]).exists())
+        self.assertEqual(list(survey.questions.get(text="New question").question_answers
+                              .order_by("id").values_list("text", flat=True)), ["A", "B"])
+        questions = self.client.get("/api/surveys/{}".format(survey.id)).data["survey"]["questions"]
+        self.assertIn("New question", [question["text"] for question in questions])
+
+    def test_unknown_ids_are_rejected(self):
+        survey = create_survey(questions_count=1)
+        other = create_survey(questions_count=1)
+        payload = self.survey_payload(survey)
+        payload["survey"]["questions"][0]["id"] = other.questions.first().id
+
+        response = self.client.put("/api/admin/surveys/{}".format(survey.id), payload, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(survey.questions.count(), 3)
+
+        payload = self.survey_payload(survey)
+        payload["survey"]["questions"][1]["question_answers"][0]["id"] = \
+            other.questions.filter(question_type="SC").first().question_answers.first().id
+        response = self.client.put("/api/admin/surveys/{}".format(survey.id), payload, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_question_changed_to_plain_text_loses_choices(self):
+        survey = create_survey(questions_count=1, choices_count=3)
+        question = survey.questions.filter(question_type="SC").first()
+
+        response = self.client.put("/api/admin/questions/{}".format(question.id),
+                                   {"question": {"question_type": "PT"}}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["changes"]["question_answers"]["deleted"], 3)
+        self.assertFalse(question.question_answers.exists())
+
+
+@override_settings(SURVEY_INSTRUMENTATION={"ENABLED": True})
+class StatsTest(AdminTestCase):
+    def test_stats(self):
+        registry.reset()
+        self.addCleanup(registry.reset)
+        survey = create_survey()
+        self.client.get("/api/admin/surveys/{}".format(survey.id))
+        endpoints = {row["endpoint"]: row for row in self.client.get("/api/admin/stats/").data["endpoints"]}
+        self.assertEqual(endpoints["GET /api/admin/surveys/<int:survey_pk>"]["count"], 1)
+
+        self.client.delete("/api/admin/stats/")
+        self.assertEqual(set(registry.snapshot()), {"DELETE /api/admin/stats/"})
+
+        self.client.credentials()
+        self.assertEqual(self.client.get("/api/admin/stats/").status_code, 401)
+
+
+class AdminListTest(AdminTestCase):
+    def setUp(self):
+        super().setUp()
+        self.surveys = [create_survey(questions_count=1) for _ in range(3)]
+        for survey, title in zip(self.surveys, ("Beta", "alpha", "Gamma")):
+            survey.title = title
+            survey.save()
+
+    def get(self, path, status=200):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, status)
+        return response.json()
+
+    def collect(self, path, key):
+        objects, cursor = [], None
+        while True:
+            data = self.get(path + ("&cursor=" + cursor if cursor else ""))
+            objects += data[key]
+            cursor = data["next"]
+            if cursor is None:
+                return objects
+
+    def test_ordering_and_pagination(self):
+        titles = [survey["title"] for survey in self.collect("/api/admin/surveys/?ordering=title&limit=1", "surveys")]
+        self.assertEqual(titles, ["Beta", "Gamma", "alpha"])
+        titles = [survey["title"] for survey in self.collect("/api/admin/surveys/?ordering=-title&limit=2", "surveys")]
+        self.assertEqual(titles, ["alpha", "Gamma", "Beta"])
+        ids = [question["id"] for question in self.collect("/api/admin/questions/?ordering=survey&limit=2", "questions")]
+        self.assertEqual(len(ids), 9)
+        self.assertEqual(ids, sorted(ids))
+
+    def test_filters(self):
+        self.assertEqual([survey["title"] for survey in self.get("/api/admin/surveys/?title=ALP")["surveys"]], ["alpha"])
+        survey = self.surveys[1]
+        questions = self.get("/api/admin/questions/?survey={}&question_type=SC".format(survey.id))["questions"]
+        self.assertEqual([question["id"] for question in questions],
+                         list(survey.questions.filter(question_type="SC").values_list("id", flat=True)))
+        question_answers = self.get("/api/admin/questions-answers/?survey={}&text=choice%201".format(survey.id))
+        self.assertEqual(len(question_answers["question_answers"]), 2)
+        end_date = str(survey.end_date)
+        self.assertEqual(len(self.get("/api/admin/surveys/?end_date_from=" + end_date)["surveys"]), 3)
+        self.assertEqual(self.get("/api/admin/surveys/?end_date_to=2000-01-01")["surveys"], [])
+
+    def test_fields(self):
+        self.get("/api/admin/stats/")
+        with CaptureQueriesContext(connection) as context:
+            surveys = self.get("/api/admin/surveys/?fields=id,title")["surveys"]
+        self.assertEqual(surveys[0], {"id": self.surveys[0].id, "title": "Beta"})
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertNotIn("description", context.captured_queries[0]["sql"])
+        questions = self.get("/api/admin/questions/?fields=text,question_answers&limit=1")["questions"]
+        self.assertEqual(set(questions[0]), {"text", "question_answers"})
+
+    def test_incorrect_parameters(self):
+        for query, message in (("ordering=description", "Incorrect ordering!"),
+                               ("fields=id,password", "Incorrect fields!"),
+                               ("start_date_from=yesterday", "Incorrect start_date_from!"),
+                               ("ordering=title&cursor=MTIz", "Incorrect cursor!")):
+            self.assertEqual(self.get("/api/admin/surveys/?" + query, 400), [message])
+        self.assertEqual(self.get("/api/admin/questions/?survey=first", 400), ["Incorrect survey!"])
+
+
+class BulkTransferTest(AdminTestCase):
+    def export(self, path="/api/admin/surveys/export"):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_export_import_round_trip(self):
+        create_survey()
+        create_survey(questions_count=0).questions.create(text="Вопрос", question_type="PT")
+        exported = self.export()
+        self.assertEqual(len(exported.splitlines()), 2)
+        self.assertEqual(len(self.export("/api/admin/surveys/export?title=none").splitlines()), 0)
+
+        Survey.objects.all().delete()
+        with mock.patch("surveyAPI.transfer.touch_survey") as touch:
+            response = self.client.post("/api/admin/surveys/import", exported, content_type="application/x-ndjson")
+        self.assertEqual((response.status_code, response.data["imported"], response.data["failed"]), (201, 2, []))
+        touch.assert_called_once_with(None)
+        self.assertEqual(self.export(), exported)
+        self.assertEqual(self.client.get("/api/surveys/").status_code, 200)
+
+    def test_incorrect_lines_are_reported(self):
+        create_survey()
+        line = self.export()
+        body = line + "\n" + "not json\n" + json.dumps({"survey": {"title": "No end date", "questions": []}}) + "\n"
+        response = self.client.post("/api/admin/surveys/import", body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["imported"], 1)
+        self.assertEqual([error["line"] for error in response.data["failed"]], [3, 4])
+        self.assertIn("end_date", response.data["failed"][1]["errors"])
+
+        response = self.client.post("/api/admin/surveys/import", "[]\n", content_type="application/x-ndjson")
+        self.assertEqual((response.status_code, response.data["failed"]), (400, [{"line": 1, "errors": ["Incorrect data!"]}]))
+
+    def test_commands(self):
+        create_survey()
+        exported = self.export()
+        output = io.StringIO()
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False, encoding="utf-8") as surveys:
+            surveys.write(exported * 3)
+        self.addCleanup(os.remove, surveys.name)
+        call_command("import_surveys", surveys.name, "--chunk-size", "2", stdout=output, stderr=io.StringIO())
+        self.assertIn("Imported 3 surveys", output.getvalue())
+        output = io.StringIO()
+        call_command("export_surveys", stdout=output)
+        self.assertEqual(output.getvalue(), exported * 4)
+
+
+class CachedTokenAuthenticationTest(AdminTestCase):
+    def test_warm_admin_request_makes_no_queries(self):
+        self.client.get("/api/admin/stats/")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/api/admin/stats/").status_code, 200)
+
+    def test_token_delete_and_user_change_invalidate_cache(self):
+        self.assertEqual(self.client.get("/api/admin/stats/").status_code, 200)
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.get("/api/admin/stats/").status_code, 403)
+
+        Token.objects.filter(user=self.user).delete()
+        self.assertEqual(self.client.get("/api/admin/stats/").status_code, 401)
+
+    def test_cached_entry_expires(self):
+        self.client.get("/api/admin/stats/")
+        with override_settings(SURVEY_TOKEN_CACHE_TIMEOUT=0):
+            User.objects.filter(pk=self.user.pk).update(is_active=False)
+            with mock.patch("admin.authentication.time.time", return_value=time.time() + 61):
+                self.assertEqual(self.client.get("/api/admin/stats/").status_code, 401)
+
+    def test_permission_errors_keep_their_format(self):
+        response = APIClient().get("/api/admin/surveys/")
+        self.assertEqual((response.status_code, response.json()), (401, ["You are not authorized!"]))
+        user = User.objects.create_user("user", password="password")
+        client = APIClient(HTTP_AUTHORIZATION="Token " + Token.objects.create(user=user).key)
+        for path in ("/api/admin/surveys/", "/api/admin/stats/", "/api/admin/surveys/0/questions/"):
+            response = client.get(path)
+            self.assertEqual((response.status_code, response.json()), (403, ["You are not allowed to add new surveys!"]))
+        self.assertEqual(client.get("/api/surveys/").status_code, 200)
@@ -1,6 +1,7 @@
 from django.urls import path, include
 
 from .admin_full_management import SurveyView, QuestionView, QuestionAnswerView
+from .views import StatsView
 from rest_framework.authtoken.views import obtain_auth_token
 
 GENERAL_METHODS = {"get": "list", "post": "create"}
@@ -19,11 +20,16 @@ questions_urlpatterns = [
 
 urlpatterns = [
     path("surveys/", SurveyView.as_view(GENERAL_METHODS)),
+    path("surveys/export", SurveyView.as_view({"get": "export_all"})),
+    path("surveys/import", SurveyView.as_view({"post": "import_all"})),
     path("surveys/<int:survey_pk>", SurveyView.as_view(SPECIFIED_METHODS)),
+    path("surveys/<int:survey_pk>/results", SurveyView.as_view({"get": "results"})),
+    path("surveys/<int:survey_pk>/export", SurveyView.as_view({"get": "export"})),
     path("surveys/<int:survey_pk>/", include(questions_urlpatterns)),
     path("surveys/<int:survey_pk>/", include(questions_answers_urlpatterns)),
 
     path("", include(questions_urlpatterns)),
     path("", include(questions_answers_urlpatterns)),
+    path("stats/", StatsView.as_view({"get": "list", "delete": "reset"})),
     path("login/", obtain_auth_token)
 ]
\ No newline at end of file
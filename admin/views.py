@@ -0,0 +1,30 @@
+from rest_framework.response import Response
+
+from surveyAPI.instrumentation import get_setting, get_stats, registry
+
+from .permissions import AdminViewSet
+
+
+class StatsView(AdminViewSet):
+    """
+    Статистика обработки запросов, собираемая surveyAPI.instrumentation.InstrumentationMiddleware
+    """
+    @staticmethod
+    def list(request):
+        """
+        Возвращает перцентили времени обработки, количества и времени запросов к базе данных,
+        размера ответа и времени сериализации по каждому эндпоинту
+        :param request: запрос
+        :return: ответ на запрос, содержащий статистику, упорядоченную по p99 времени обработки
+        """
+        return Response({"enabled": get_setting("ENABLED"), "endpoints": get_stats()})
+
+    @staticmethod
+    def reset(request):
+        """
+        Удаляет накопленную статистику
+        :param request: запрос
+        :return: ответ на запрос, содержащий информацию о ходе выполнения действия
+        """
+        registry.reset()
+        return Response({"Stats were reset"})
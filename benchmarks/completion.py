@@ -0,0 +1,98 @@
+"""
+Сравнение старого (по одному INSERT на ответ в режиме autocommit) и текущего (bulk insert в одной
+транзакции) сохранения прохождения опроса на SQLite.
+Запуск: python -m benchmarks.completion [--questions 100] [--repeat 50]
+"""
+import argparse
+
+from .utils import setup, measure, print_table
+
+
+def legacy_create(validated_data):
+    """
+    Копия UserAnswersHolderCreationSerializer.create до перехода на bulk insert
+    """
+    from surveyAPI.models import Survey, Question, QuestionAnswer, UserAnswersHolder, UserAnswer
+
+    survey = Survey.objects.all().get(pk=validated_data.get("survey").id)
+    questions = Question.objects.all().filter(survey=survey)
+    given_answers = validated_data.pop("answers")
+
+    for question in questions:
+        if not any(given_answer["question"] == question for given_answer in given_answers):
+            raise AttributeError("All questions should be completed!")
+    for given_answer in given_answers:
+        if given_answer["question"].question_type != "PT":
+            available_answers = QuestionAnswer.objects.all().filter(question=given_answer["question"])
+            if not any(available_answer.text == given_answer["answer"] for available_answer in available_answers):
+                raise ValueError("Choice questions should be chosen correctly!")
+
+    user_answers_holder = UserAnswersHolder.objects.create(**validated_data)
+    for question in questions:
+        multiply_choices_answers = []
+        for given_answer in given_answers:
+            if given_answer["question"] == question:
+                if question.question_type == "MC" and given_answer["answer"] in multiply_choices_answers:
+                    continue
+                UserAnswer.objects.create(user_answers_holder=user_answers_holder, **given_answer)
+                multiply_choices_answers.append(given_answer["answer"])
+                if question.question_type != "MC":
+                    break
+    return user_answers_holder
+
+
+def create_survey(questions_count):
+    from surveyAPI.models import Survey, Question, QuestionAnswer
+    from datetime import datetime, timedelta
+
+    survey = Survey.objects.create(title="Benchmark", end_date=datetime.now().date() + timedelta(days=1))
+    answers = []
+    for i in range(questions_count):
+        question_type = ("PT", "SC", "MC")[i % 3]
+        question = Question.objects.create(survey=survey, text="Question {}".format(i), question_type=question_type)
+        if question_type == "PT":
+            answers.append((question, "text"))
+            continue
+        for j in range(4):
+            choice = QuestionAnswer.objects.create(question=question, text="Choice {}".format(j))
+            if j == 0 or question_type == "MC":
+                answers.append((question, choice.text))
+    return survey, answers
+
+
+def run(questions_count, repeat):
+    from surveyAPI.serializers import UserAnswersHolderCreationSerializer
+
+    survey, answers = create_survey(questions_count)
+
+    def legacy():
+        legacy_create({"survey": survey, "user_ID": 1,
+                       "answers": [{"question": question, "answer": answer} for question, answer in answers]})
+
+    def current():
+        serializer = UserAnswersHolderCreationSerializer(data={
+            "survey": survey.id, "user_ID": 1,
+            "answers": [{"question": question.id, "answer": answer} for question, answer in answers]
+        })
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+    rows = []
+    for name, func in (("per-row autocommit", legacy), ("bulk in transaction", current)):
+        row = measure(func, repeat)
+        row.update({"variant": name, "answers": len(answers)})
+        rows.append(row)
+    print_table(rows, ["variant", "answers", "statements", "ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    setup()
+    run(args.questions, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Сравнение пропускной способности WSGI и ASGI (Survey/asgi.py) при большом количестве одновременных медленных клиентов.
+WSGI-развертывание моделируется пулом из --workers потоков: поток занят запросом, пока клиент не получит ответ.
+ASGI-приложение получает те же запросы в цикле событий с тем же числом потоков для WSGI-части.
+Медленный клиент получает тело ответа за --client-delay миллисекунд.
+База данных - временный файл SQLite (соединения разных потоков должны видеть одни и те же данные).
+Запуск: python -m benchmarks.concurrency [--clients 200] [--workers 8] [--client-delay 50] [--requests 5]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from .utils import setup, print_table
+
+
+def run_wsgi(application, path, args):
+    """
+    :return: пара (время выполнения всех запросов, список задержек запросов, включая ожидание свободного потока)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from django.test.client import RequestFactory
+
+    path, _, query = path.partition("?")
+    environ = RequestFactory().get(path, QUERY_STRING=query, HTTP_ACCEPT_ENCODING="gzip").environ
+
+    def handle():
+        result = application(dict(environ), lambda status, headers, exc_info=None: None)
+        try:
+            for _ in result:
+                pass
+            time.sleep(args.client_delay / 1000)
+        finally:
+            result.close()
+
+    with ThreadPoolExecutor(args.workers) as server, ThreadPoolExecutor(args.clients) as clients:
+        def client():
+            latencies = []
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                server.submit(handle).result()
+                latencies.append(time.perf_counter() - start)
+            return latencies
+
+        start = time.perf_counter()
+        latencies = [latency for future in [clients.submit(client) for _ in range(args.clients)]
+                     for latency in future.result()]
+        return time.perf_counter() - start, latencies
+
+
+def run_asgi(application, path, args):
+    """
+    :return: пара (время выполнения всех запросов, список задержек запросов)
+    """
+    path, _, query = path.partition("?")
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": query.encode(),
+             "headers": [(b"accept-encoding", b"gzip")]}
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and not message.get("more_body", False):
+            await asyncio.sleep(args.client_delay / 1000)
+
+    async def client():
+        latencies = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            await application(dict(scope), receive, send)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    async def clients():
+        return await asyncio.gather(*(client() for _ in range(args.clients)))
+
+    start = time.perf_counter()
+    latencies = [latency for client_latencies in asyncio.run(clients()) for latency in client_latencies]
+    return time.perf_counter() - start, latencies
+
+
+def run(args):
+    from django.core.wsgi import get_wsgi_application
+    from surveyAPI.asgi import ASGIHandler
+    from surveyAPI.synthetic import generate
+
+    structure = generate(args.surveys, args.questions, 4, args.completions, seed=0)
+    survey_id = sorted(structure)[-1]
+    scenarios = (
+        ("survey retrieve", "/api/surveys/{}".format(survey_id)),
+        ("survey list", "/api/surveys/?limit=10"),
+        ("completed surveys list", "/api/completed-surveys/1"),
+    )
+
+    wsgi = get_wsgi_application()
+    asgi = ASGIHandler(wsgi, args.workers)
+    rows = []
+    for name, path in scenarios:
+        for deployment, func, application in (("wsgi", run_wsgi, wsgi), ("asgi", run_asgi, asgi)):
+            elapsed, latencies = func(application, path, args)
+            latencies.sort()
+            rows.append({"scenario": name, "deployment": deployment, "rps": len(latencies) / elapsed,
+                         "p50_ms": latencies[len(latencies) // 2] * 1000,
+                         "p99_ms": latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] * 1000})
+    asgi.executor.shutdown()
+    print_table(rows, ["scenario", "deployment", "rps", "p50_ms", "p99_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=200, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=5, help="Requests per client")
+    parser.add_argument("--workers", type=int, default=8, help="WSGI threads")
+    parser.add_argument("--client-delay", type=float, default=50, help="Milliseconds a client takes to read a response")
+    parser.add_argument("--surveys", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--completions", type=int, default=1000)
+    args = parser.parse_args()
+
+    database = None
+    if "BENCHMARK_DATABASE" not in os.environ:
+        database = tempfile.NamedTemporaryFile(suffix=".sqlite3", delete=False)
+        database.close()
+        os.environ["BENCHMARK_DATABASE"] = database.name
+    try:
+        setup()
+        run(args)
+    finally:
+        if database is not None:
+            os.remove(database.name)
+
+
+if __name__ == "__main__":
+    main()
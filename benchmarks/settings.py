@@ -0,0 +1,22 @@
+"""
+Settings for running benchmarks (and, if needed, tests) on SQLite instead of MySQL.
+Usage: python -m benchmarks.<benchmark> or python manage.py test --settings=benchmarks.settings
+"""
+import os
+
+from Survey.settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('BENCHMARK_DATABASE', ':memory:'),
+    }
+}
+
+# A replica alias mirroring 'default' in tests, used by the read replica routing tests
+# (it gets reads only when listed in SURVEY_DATABASE_ROUTING["REPLICAS"])
+DATABASES['replica'] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+
+# Completion shards used by the sharding tests (only when listed in SURVEY_SHARDING["SHARDS"])
+DATABASES['shard1'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+DATABASES['shard2'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
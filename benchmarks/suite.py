@@ -0,0 +1,181 @@
+"""
+Набор бенчмарков горячих эндпоинтов на SQLite: список и получение опроса (с холодным и прогретым кэшем),
+прохождение опроса, список пройденных опросов, аутентификация администратора и CRUD администратора. Запросы проходят через
+весь стек Django (тестовый клиент), данные создаются surveyAPI.synthetic.
+Результаты сохраняются в JSON, чтобы сравнивать запуски на разных коммитах.
+Запуск: python -m benchmarks.suite [--output results.json] [--compare previous.json] [--repeat 50]
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+
+from .utils import setup, measure, print_table
+
+
+def git_commit():
+    try:
+        output = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL)
+        return output.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_clients():
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from rest_framework.authtoken.models import Token
+
+    user = User.objects.create_user("benchmark", password="benchmark", is_staff=True)
+    token = Token.objects.create(user=user)
+    return Client(), Client(HTTP_AUTHORIZATION="Token " + token.key)
+
+
+def request(client, method, path, payload=None, expected=200, **headers):
+    """
+    :param headers: дополнительные заголовки запроса в формате WSGI (например, HTTP_ACCEPT_ENCODING)
+    :return: функция без аргументов, выполняющая запрос и проверяющая код ответа
+    """
+    def func():
+        if payload is None:
+            response = getattr(client, method)(path, **headers)
+        else:
+            response = getattr(client, method)(path, json.dumps(payload(), ensure_ascii=False),
+                                               content_type="application/json", **headers)
+        if response.status_code != expected:
+            raise AssertionError("{} {}: {} != {}".format(method.upper(), path, response.status_code, expected))
+    return func
+
+
+def cold(func):
+    from surveyAPI import cache
+
+    def wrapper():
+        cache.clear()
+        func()
+    return wrapper
+
+
+def scenarios(structure, args):
+    """
+    :return: список пар (название, функция без аргументов)
+    """
+    from itertools import count
+
+    client, admin_client = make_clients()
+    survey_id = sorted(structure)[-1]
+    users = count(args.completions + 1)
+
+    def completion():
+        answers = []
+        for question_id, question_type, choices in structure[survey_id]:
+            answers.append({"question": question_id, "answer": choices[0][1] if choices else "text"})
+        return {"user_answers": {"user_ID": next(users), "answers": answers}}
+
+    def new_survey():
+        questions = [{"text": "Question {}".format(i), "question_type": "SC",
+                      "question_answers": [{"text": "Choice {}".format(j)} for j in range(args.choices)]}
+                     for i in range(args.questions)]
+        return {"survey": {"title": "Benchmark", "end_date": "2100-01-01", "description": "Benchmark survey",
+                           "questions": questions}}
+
+    def survey_title():
+        return {"survey": {"title": "Benchmark {}".format(next(users))}}
+
+    surveys_file = "".join(json.dumps(new_survey(), ensure_ascii=False) + "\n" for _ in range(10))
+
+    def import_surveys():
+        response = admin_client.post("/api/admin/surveys/import", surveys_file, content_type="application/x-ndjson")
+        if response.status_code != 201:
+            raise AssertionError("POST /api/admin/surveys/import: {} != 201".format(response.status_code))
+
+    admin_survey = "/api/admin/surveys/{}".format(survey_id)
+    return [
+        ("survey list (cold)", cold(request(client, "get", "/api/surveys/"))),
+        ("survey list (warm)", request(client, "get", "/api/surveys/")),
+        ("survey list (warm, gzip)", request(client, "get", "/api/surveys/", HTTP_ACCEPT_ENCODING="gzip")),
+        ("survey retrieve (cold)", cold(request(client, "get", "/api/surveys/{}".format(survey_id)))),
+        ("survey retrieve (warm)", request(client, "get", "/api/surveys/{}".format(survey_id))),
+        ("survey retrieve (warm, gzip)", request(client, "get", "/api/surveys/{}".format(survey_id),
+                                                 HTTP_ACCEPT_ENCODING="gzip")),
+        ("complete survey", request(client, "post", "/api/surveys/{}".format(survey_id), completion, 201)),
+        ("completed surveys list", request(client, "get", "/api/completed-surveys/1")),
+        ("completed surveys list (expanded)", request(client, "get", "/api/completed-surveys/1?expand=survey")),
+        ("admin token check (stats)", request(admin_client, "get", "/api/admin/stats/")),
+        ("admin survey list", request(admin_client, "get", "/api/admin/surveys/")),
+        ("admin survey retrieve", request(admin_client, "get", admin_survey)),
+        ("admin survey create", request(admin_client, "post", "/api/admin/surveys/", new_survey, 201)),
+        ("admin survey update", request(admin_client, "put", admin_survey, survey_title)),
+        ("admin survey import (10 surveys)", import_surveys),
+    ]
+
+
+def run(args):
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    from surveyAPI.synthetic import generate
+    import django
+
+    setup_test_environment()
+    structure = generate(args.surveys, args.questions, args.choices, args.completions, args.users, seed=args.seed)
+
+    results = []
+    for name, func in scenarios(structure, args):
+        func()
+        row = measure(func, args.repeat)
+        row.update({"name": name, "ops_per_sec": 1000 / row["ms"] if row["ms"] else 0})
+        results.append(row)
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "params": {key: getattr(args, key) for key in ("surveys", "questions", "choices", "completions", "users",
+                                                       "seed", "repeat")},
+        "results": results,
+    }
+
+
+def compare(report, previous):
+    """
+    Добавляет к результатам отношение времени к предыдущему запуску (меньше 1 - быстрее)
+    """
+    previous_results = {row["name"]: row for row in previous["results"]}
+    for row in report["results"]:
+        if row["name"] in previous_results and previous_results[row["name"]]["ms"]:
+            row["vs_previous"] = row["ms"] / previous_results[row["name"]]["ms"]
+            row["statements_before"] = previous_results[row["name"]]["statements"]
+        else:
+            row["vs_previous"] = row["statements_before"] = "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--surveys", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--choices", type=int, default=4)
+    parser.add_argument("--completions", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    args = parser.parse_args()
+    setup()
+    report = run(args)
+
+    columns = ["name", "statements", "ms", "ops_per_sec"]
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as previous:
+            compare(report, json.load(previous))
+        columns += ["statements_before", "vs_previous"]
+    print_table(report["results"], columns)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2)
+        print("Results were written to " + args.output, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
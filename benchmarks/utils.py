@@ -0,0 +1,53 @@
+import os
+import time
+
+
+def setup():
+    """
+    Настраивает Django для работы с базой данных SQLite из benchmarks.settings и применяет миграции
+    """
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+
+
+def measure(func, repeat=1):
+    """
+    Замеряет время выполнения и количество SQL-запросов функции
+    :param func: функция без аргументов
+    :param repeat: количество запусков
+    :return: словарь со средним временем (в миллисекундах) и средним количеством запросов на запуск
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as context:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        elapsed = time.perf_counter() - start
+    return {
+        "ms": elapsed * 1000 / repeat,
+        "statements": len(context.captured_queries) / repeat,
+    }
+
+
+def print_table(rows, columns):
+    """
+    Печатает результаты бенчмарка в виде таблицы
+    :param rows: список словарей
+    :param columns: список выводимых ключей
+    """
+    widths = [max(len(column), *(len(format_value(row[column])) for row in rows)) for column in columns]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(format_value(row[column]).ljust(width) for column, width in zip(columns, widths)))
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return "{:.2f}".format(value)
+    return str(value)
@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete
 
 
 class SurveyapiConfig(AppConfig):
     name = 'surveyAPI'
+
+    def ready(self):
+        from .models import Survey, Question
+        from .sharding import delete_completions
+
+        post_delete.connect(delete_completions, sender=Survey, dispatch_uid="surveyAPI.sharding.survey")
+        post_delete.connect(delete_completions, sender=Question, dispatch_uid="surveyAPI.sharding.question")
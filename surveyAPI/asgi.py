@@ -0,0 +1,258 @@
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.http import parse_etags
+
+from . import cache, instrumentation
+from .compression import negotiate
+from .payloads import today
+from .versions import get_list_version, get_survey_versions
+
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from urllib.parse import parse_qsl
+import asyncio
+import io
+import re
+import sys
+import time
+
+DEFAULT_SURVEY_ASGI = {
+    "WORKERS": 16,
+    "FAST_PATH": True,
+    "CACHE_SIZE": 1024,
+    "VERSION_TTL": 1,
+}
+
+# Маршруты, ответы которых можно отдавать из памяти: (путь, эндпоинт для статистики, допустимые параметры запроса)
+FAST_ROUTES = (
+    (re.compile(r"^/api/surveys/$"), "GET /api/surveys/", ("limit", "cursor")),
+    (re.compile(r"^/api/surveys/(\d+)$"), "GET /api/surveys/<int:pk>", ()),
+)
+FAST_ACCEPT = ("", "*/*", "application/json")
+# Заголовки, с которыми отдается ответ 304 (как у django.utils.cache.get_conditional_response)
+NOT_MODIFIED_HEADERS = (b"etag", b"last-modified", b"vary", b"cache-control", b"expires")
+
+
+def get_setting(name):
+    return getattr(settings, "SURVEY_ASGI", {}).get(name, DEFAULT_SURVEY_ASGI[name])
+
+
+def get_headers(scope):
+    """
+    :return: словарь заголовков запроса (имена в нижнем регистре, повторяющиеся заголовки объединены через запятую)
+    """
+    headers = {}
+    for name, value in scope["headers"]:
+        name, value = name.decode("latin1").lower(), value.decode("latin1")
+        headers[name] = headers[name] + "," + value if name in headers else value
+    return headers
+
+
+def build_environ(scope, body):
+    """
+    Строит окружение WSGI для HTTP-запроса ASGI
+    :param scope: scope запроса
+    :param body: тело запроса в байтах
+    :return: словарь environ
+    """
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin1"),
+        "PATH_INFO": scope["path"].encode().decode("latin1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"], environ["REMOTE_PORT"] = scope["client"][0], str(scope["client"][1])
+    for name, value in get_headers(scope).items():
+        if name in ("content-type", "content-length"):
+            environ[name.upper().replace("-", "_")] = value
+        else:
+            environ["HTTP_" + name.upper().replace("-", "_")] = value
+    # Тело уже прочитано целиком, поэтому длина известна и для запросов с Transfer-Encoding: chunked
+    environ["CONTENT_LENGTH"] = str(len(body))
+    return environ
+
+
+def fast_path(scope):
+    """
+    Проверяет, можно ли отдать ответ на запрос из памяти: GET или HEAD списка опросов или опроса
+    в компактном JSON, без авторизации и без условных заголовков, кроме If-None-Match
+    :param scope: scope запроса
+    :return: (ключ ответа, эндпоинт, id опроса или None для списка) или None
+    """
+    if scope["method"] not in ("GET", "HEAD") or not get_setting("FAST_PATH"):
+        return None
+    for pattern, endpoint, params in FAST_ROUTES:
+        match = pattern.match(scope["path"])
+        if match is not None:
+            break
+    else:
+        return None
+    query = parse_qsl(scope.get("query_string", b"").decode("latin1"), keep_blank_values=True)
+    if any(name not in params for name, _ in query) or len({name for name, _ in query}) < len(query):
+        return None
+    headers = get_headers(scope)
+    if headers.get("accept", "") not in FAST_ACCEPT or "authorization" in headers or \
+            any(name in headers for name in ("if-modified-since", "if-match", "if-unmodified-since", "range")):
+        return None
+    encoding = negotiate(SimpleNamespace(META={"HTTP_ACCEPT_ENCODING": headers.get("accept-encoding", "")}))
+    survey_id = int(match.group(1)) if match.groups() else None
+    return (scope["path"], tuple(sorted(query)), encoding), endpoint, survey_id
+
+
+def data_version(survey_id):
+    """
+    Читает версию данных из базы данных одним запросом, поэтому выполняется в пуле потоков
+    :param survey_id: id опроса или None для списка опросов
+    :return: версия данных ответа: меняется при изменении опроса в любом процессе (см. versions.touch_survey)
+    и каждый день, так как опросы истекают без изменений в базе данных
+    """
+    close_old_connections()
+    if survey_id is None:
+        version = get_list_version()
+    else:
+        version = get_survey_versions([survey_id]).get(survey_id)
+    return version, today()
+
+
+class ASGIHandler:
+    """
+    ASGI-приложение поверх WSGI-приложения Django (Django 2.2 не поддерживает ASGI).
+    Сохраняет в памяти процесса ответы 200 на GET списка опросов и опроса (см. fast_path) вместе с версией
+    их данных и отдает их в цикле событий, пока версия не изменилась. Версия читается из базы данных
+    (см. data_version) в пуле потоков не чаще раза в VERSION_TTL секунд на ответ, остальные запросы не занимают
+    потоков: изменение опроса в другом процессе становится видно не позднее чем через VERSION_TTL секунд.
+    Ответы на запросы пройденных опросов зависят от данных пользователя в его шарде, дешевой версии у них нет,
+    поэтому они, как и остальные запросы, выполняются WSGI-приложением.
+    Остальные запросы выполняются WSGI-приложением в пуле из WORKERS потоков (их число ограничивает
+    и число соединений с базой данных). Тело запроса читается до передачи в пул, тело обычного ответа
+    отправляется после освобождения потока, поэтому медленные клиенты не занимают потоки.
+    Потоковые ответы (например, выгрузки) отправляются из потока, выполняющего запрос
+    """
+    def __init__(self, wsgi_application, workers=None):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(workers or get_setting("WORKERS"), thread_name_prefix="asgi-wsgi")
+        self.responses = cache.LRUCache(get_setting("CACHE_SIZE"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            raise ValueError("Only HTTP connections are supported, got {}".format(scope["type"]))
+
+        fast = fast_path(scope)
+        version = None
+        if fast is not None:
+            key, endpoint, survey_id = fast
+            entry = self.responses.get(key)
+            if entry is not None and entry[0][1] == today() and \
+                    time.monotonic() - entry[1] < get_setting("VERSION_TTL"):
+                await self.send_cached(scope, send, entry, endpoint)
+                return
+            version = await asyncio.get_event_loop().run_in_executor(self.executor, data_version, survey_id)
+            if entry is not None and entry[0] == version:
+                entry = (version, time.monotonic()) + entry[2:]
+                self.responses.set(key, entry)
+                await self.send_cached(scope, send, entry, endpoint)
+                return
+
+        body = await read_body(receive)
+        status, headers, content = await self.call_wsgi(scope, body, send)
+        if content is None:
+            return
+        if fast is not None and scope["method"] == "GET" and status == 200 and \
+                any(name == b"etag" for name, _ in headers) and all(name != b"set-cookie" for name, _ in headers):
+            self.responses.set(fast[0], (version, time.monotonic(), headers, content))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else content})
+
+    async def call_wsgi(self, scope, body, send):
+        """
+        Выполняет запрос WSGI-приложением в пуле потоков
+        :return: (статус, заголовки, тело). Тело None, если ответ потоковый и уже отправлен
+        """
+        loop = asyncio.get_event_loop()
+        environ = build_environ(scope, body)
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = [(name.lower().encode("latin1"), value.encode("latin1")) for name, value in headers]
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def run():
+            result = self.wsgi_application(environ, start_response)
+            try:
+                if not getattr(result, "streaming", True):
+                    return b"".join(result)
+                send_from_thread({"type": "http.response.start", "status": started["status"],
+                                  "headers": started["headers"]})
+                for chunk in result:
+                    if chunk and scope["method"] != "HEAD":
+                        send_from_thread({"type": "http.response.body", "body": chunk, "more_body": True})
+                send_from_thread({"type": "http.response.body", "body": b""})
+                return None
+            finally:
+                # Django закрывает соединения с базами данных в request_finished, в том же потоке
+                if hasattr(result, "close"):
+                    result.close()
+
+        content = await loop.run_in_executor(self.executor, run)
+        return started["status"], started["headers"], content
+
+    @staticmethod
+    async def send_cached(scope, send, entry, endpoint):
+        start = time.perf_counter()
+        _, _, headers, content = entry
+        if_none_match = get_headers(scope).get("if-none-match", None)
+        etag = next(value for name, value in headers if name == b"etag").decode("latin1")
+        tags = {strip_weak(tag) for tag in parse_etags(if_none_match or "")}
+        if "*" in tags or strip_weak(etag) in tags:
+            status, content = 304, b""
+            headers = [(name, value) for name, value in headers if name in NOT_MODIFIED_HEADERS]
+        else:
+            status = 200
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else content})
+        if instrumentation.get_setting("ENABLED"):
+            instrumentation.registry.record(endpoint, ((time.perf_counter() - start) * 1000, 0, 0, len(content), 0))
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def strip_weak(etag):
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+async def read_body(receive):
+    body = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        body.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(body)
@@ -0,0 +1,129 @@
+from django.conf import settings
+from django.core.cache import caches
+
+from collections import OrderedDict
+from threading import Lock
+
+DEFAULT_SURVEY_CACHE = {
+    "LOCAL_SIZE": 256,
+    "BACKEND": None,
+    "TIMEOUT": 60 * 60,
+}
+
+
+class LRUCache:
+    """
+    Потокобезопасный кэш ограниченного размера, вытесняющий давно не использованные записи
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                return default
+            return self._entries[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def get_setting(name):
+    return getattr(settings, "SURVEY_CACHE", {}).get(name, DEFAULT_SURVEY_CACHE[name])
+
+
+def shared_cache():
+    """
+    Возвращает общий для всех процессов кэш (из settings.CACHES) или None, если он не настроен
+    """
+    alias = get_setting("BACKEND")
+    if alias is None:
+        return None
+    return caches[alias]
+
+
+local_cache = LRUCache(get_setting("LOCAL_SIZE"))
+
+
+def get(key):
+    """
+    Ищет значение сначала в кэше процесса, затем в общем кэше
+    :param key: ключ, включающий версию данных
+    :return: закэшированное значение или None
+    """
+    value = local_cache.get(key)
+    if value is not None:
+        return value
+    backend = shared_cache()
+    if backend is None:
+        return None
+    value = backend.get(key)
+    if value is not None:
+        local_cache.set(key, value)
+    return value
+
+
+def set(key, value, timeout=None):
+    """
+    Сохраняет значение в оба уровня кэша
+    :param key: ключ, включающий версию данных
+    :param value: значение
+    :param timeout: время жизни в общем кэше в секундах. Если None, settings.SURVEY_CACHE["TIMEOUT"].
+    Кэш процесса записи по времени не удаляет, значения с коротким временем жизни должны хранить срок сами
+    """
+    backend = shared_cache()
+    if backend is not None:
+        backend.set(key, value, timeout or get_setting("TIMEOUT"))
+    local_cache.set(key, value)
+
+
+def delete(key):
+    """
+    Удаляет значение из обоих уровней кэша. Кэши других процессов не затрагиваются
+    :param key: ключ
+    """
+    backend = shared_cache()
+    if backend is not None:
+        backend.delete(key)
+    local_cache.delete(key)
+
+
+def get_or_render(key, render):
+    """
+    Ищет значение в кэше. Если значение не найдено, вычисляет его и сохраняет в оба уровня
+    :param key: ключ, включающий версию данных
+    :param render: функция без аргументов, вычисляющая значение
+    :return: закэшированное или вычисленное значение
+    """
+    value = get(key)
+    if value is None:
+        value = render()
+        if value is not None:
+            set(key, value)
+    return value
+
+
+def clear():
+    """
+    Очищает кэш процесса. Общий кэш не затрагивается
+    """
+    local_cache.clear()
@@ -0,0 +1,48 @@
+from .queries import active_surveys
+from .serializers import CompletionSerializer
+from .snapshots import get_completion_context
+from .storage import prepare_completion, save_completions
+
+
+def complete_surveys(items):
+    """
+    Проверяет и сохраняет пакет прохождений опросов (возможно, разных).
+    Актуальные опросы загружаются одним запросом, индексы проверки и снимки берутся из кэша один раз на опрос,
+    корректные прохождения сохраняются вместе
+    :param items: список словарей в формате user_answers с обязательным ключом survey
+    :return: список результатов в порядке items: {"status": 201, "id": id} или {"status": 400/404, "errors": ...}
+    """
+    results = [None] * len(items)
+    validated = []
+    for position, item in enumerate(items):
+        serializer = CompletionSerializer(data=item)
+        if not serializer.is_valid():
+            results[position] = {"status": 400, "errors": serializer.errors}
+            continue
+        validated.append((position, serializer.validated_data))
+
+    survey_ids = {data["survey"] for _, data in validated}
+    active_survey_ids = set(active_surveys().filter(pk__in=survey_ids).values_list("id", flat=True))
+
+    validation_indexes = {}
+    snapshot_hashes = {}
+    completions = []
+    for position, data in validated:
+        survey_id = data["survey"]
+        if survey_id not in active_survey_ids:
+            results[position] = {"status": 404, "errors": ["Survey ({}) was not found".format(survey_id)]}
+            continue
+        if survey_id not in validation_indexes:
+            validation_indexes[survey_id], snapshot_hashes[survey_id] = get_completion_context(survey_id)
+        try:
+            completion = prepare_completion(validation_indexes[survey_id], survey_id, data["user_ID"], data["answers"],
+                                            snapshot_hashes[survey_id])
+        except (AttributeError, ValueError) as e:
+            results[position] = {"status": 400, "errors": [str(e)]}
+            continue
+        completions.append((position, completion))
+
+    save_completions([completion for _, completion in completions])
+    for position, completion in completions:
+        results[position] = {"status": 201, "id": completion.user_answers_holder.id}
+    return results
@@ -0,0 +1,178 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+
+from . import cache
+from .versions import conditional_response, set_validators
+
+import gzip
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_SURVEY_COMPRESSION = {
+    "ENABLED": True,
+    "MIN_SIZE": 1024,
+    "GZIP_LEVEL": 6,
+    "BROTLI_QUALITY": 5,
+}
+
+
+def get_setting(name):
+    return getattr(settings, "SURVEY_COMPRESSION", {}).get(name, DEFAULT_SURVEY_COMPRESSION[name])
+
+
+def available_encodings():
+    """
+    :return: поддерживаемые кодировки в порядке предпочтения
+    """
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def accepted_encodings(request):
+    """
+    Разбирает заголовок Accept-Encoding
+    :param request: запрос
+    :return: словарь кодировка -> вес (q)
+    """
+    accepted = {}
+    for item in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def negotiate(request, encodings=None):
+    """
+    Выбирает кодировку ответа по заголовку Accept-Encoding
+    :param request: запрос
+    :param encodings: допустимые кодировки в порядке предпочтения. Если None, все поддерживаемые
+    :return: кодировка с наибольшим весом или "identity", если сжатие отключено или клиент его не принимает
+    """
+    if not get_setting("ENABLED"):
+        return "identity"
+    accepted = accepted_encodings(request)
+    best, best_quality = "identity", 0.0
+    for encoding in encodings or available_encodings():
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=get_setting("BROTLI_QUALITY"))
+    return gzip.compress(data, compresslevel=get_setting("GZIP_LEVEL"), mtime=0)
+
+
+def encode(body):
+    """
+    Сжимает тело ответа всеми поддерживаемыми кодировками
+    :param body: тело ответа в байтах
+    :return: словарь кодировка -> тело. Сжатые варианты есть, только если тело не меньше MIN_SIZE
+    и сжатие уменьшает его размер
+    """
+    bodies = {"identity": body}
+    if len(body) >= get_setting("MIN_SIZE"):
+        for encoding in available_encodings():
+            compressed = compress(body, encoding)
+            if len(compressed) < len(body):
+                bodies[encoding] = compressed
+    return bodies
+
+
+def encoded_etag(etag, encoding):
+    """
+    :return: ETag сжатого варианта ресурса (у разных кодировок разные ETag, так как тела различаются)
+    """
+    return etag if encoding == "identity" else '{}-{}"'.format(etag[:-1], encoding)
+
+
+def cached_response(request, etag, render, last_modified=None):
+    """
+    Отдает JSON-ответ клиенту, принимающему сжатие, из кэша: тело кодируется и сжимается один раз
+    для каждой версии ресурса и хранится под ключом, построенным по его ETag.
+    Условный запрос проверяется по ETag выбранной кодировки
+    :param request: запрос
+    :param etag: ETag ресурса (см. versions.survey_etag и versions.surveys_page_etag)
+    :param render: функция без аргументов, возвращающая данные ответа
+    :param last_modified: время последнего изменения ресурса или None
+    :return: ответ или None, если клиент не принимает сжатие или выбран не компактный JSON
+    """
+    renderer = request.accepted_renderer
+    if renderer.format != "json" or renderer.get_indent(request.accepted_media_type, {}) is not None:
+        return None
+    encoding = negotiate(request)
+    if encoding == "identity":
+        return None
+    response = conditional_response(request, encoded_etag(etag, encoding), last_modified)
+    if response is None:
+        bodies = cache.get_or_render("response:{}".format(etag.strip('"')),
+                                     lambda: encode(renderer.render(render(), request.accepted_media_type)))
+        body = bodies.get(encoding)
+        if body is None:
+            response = HttpResponse(bodies["identity"], content_type=renderer.media_type)
+        else:
+            response = HttpResponse(body, content_type=renderer.media_type)
+            response["Content-Encoding"] = encoding
+        set_validators(response, encoded_etag(etag, encoding), last_modified)
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+class CompressionMiddleware:
+    """
+    Сжимает ответы, не меньшие MIN_SIZE, если клиент это принимает. Потоковые ответы сжимаются gzip по частям.
+    Ответы, уже имеющие Content-Encoding (например, из cached_response), не изменяются.
+    Как и у django.middleware.gzip.GZipMiddleware, ETag сжатого ответа становится слабым
+    """
+    def __init__(self, get_response):
+        if not get_setting("ENABLED"):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header("Content-Encoding"):
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        if response.streaming:
+            if negotiate(request, ("gzip",)) != "gzip":
+                return response
+            response.streaming_content = compress_sequence(response.streaming_content)
+            del response["Content-Length"]
+            encoding = "gzip"
+        else:
+            if len(response.content) < get_setting("MIN_SIZE"):
+                return response
+            encoding = negotiate(request)
+            if encoding == "identity":
+                return response
+            compressed = compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response["Content-Length"] = str(len(compressed))
+
+        if response.has_header("ETag"):
+            response["ETag"] = re.sub(r'^"', 'W/"', response["ETag"])
+        response["Content-Encoding"] = encoding
+        return response
@@ -0,0 +1,94 @@
+from .models import Question, UserAnswer
+from .queries import iter_completed_survey_chunks
+from .sharding import shard_aliases
+from .snapshots import AnswerTexts
+
+from collections import defaultdict
+import csv
+import json
+
+EXPORT_FORMATS = ("csv", "ndjson")
+MULTIPLY_CHOICE_SEPARATOR = "; "
+
+
+class LineBuffer:
+    """
+    Псевдо-файл для csv.writer, возвращающий записанную строку вместо ее сохранения
+    """
+    @staticmethod
+    def write(value):
+        return value
+
+
+def iter_responses(survey_id, chunk_size=1000):
+    """
+    Перебирает прохождения опроса вместе с ответами, читая их порциями из шардов по очереди
+    :param survey_id: id опроса
+    :param chunk_size: количество прохождений в порции
+    :return: генератор троек (id прохождения, id пользователя, словарь id вопроса -> список ответов)
+    """
+    for alias in shard_aliases():
+        for chunk in iter_completed_survey_chunks(survey_id, chunk_size, alias):
+            answers = defaultdict(lambda: defaultdict(list))
+            snapshots = {holder_id: snapshot_hash for holder_id, _, snapshot_hash in chunk}
+            texts = AnswerTexts(snapshots.values())
+            rows = UserAnswer.objects.using(alias).filter(user_answers_holder_id__in=list(snapshots))\
+                .order_by("id").values_list("user_answers_holder_id", "question_id", "choice_id", "answer")
+            for holder_id, question_id, choice_id, answer in rows.iterator():
+                answers[holder_id][question_id].append(texts.get(snapshots[holder_id], choice_id, answer))
+            for holder_id, user_id, _ in chunk:
+                yield holder_id, user_id, answers[holder_id]
+
+
+def get_questions(survey_id):
+    return list(Question.objects.all().filter(survey_id=survey_id).order_by("id")
+                .values_list("id", "text", "question_type"))
+
+
+def export_csv(survey_id, chunk_size=1000):
+    """
+    Выгружает ответы на опрос в формате CSV: строка на прохождение, столбец на вопрос.
+    Ответы на вопросы типа MC объединяются через MULTIPLY_CHOICE_SEPARATOR
+    :param survey_id: id опроса
+    :param chunk_size: количество прохождений, читаемых за один запрос
+    :return: генератор строк CSV
+    """
+    questions = get_questions(survey_id)
+    writer = csv.writer(LineBuffer())
+    yield writer.writerow(["id", "user_ID"] + ["{}: {}".format(question_id, text) for question_id, text, _ in questions])
+    for holder_id, user_id, answers in iter_responses(survey_id, chunk_size):
+        yield writer.writerow([holder_id, user_id] + [MULTIPLY_CHOICE_SEPARATOR.join(answers.get(question_id, []))
+                                                      for question_id, _, _ in questions])
+
+
+def export_ndjson(survey_id, chunk_size=1000):
+    """
+    Выгружает ответы на опрос в формате NDJSON: JSON-объект на прохождение.
+    Ответы на вопросы типа MC выгружаются списком, на остальные - строкой
+    :param survey_id: id опроса
+    :param chunk_size: количество прохождений, читаемых за один запрос
+    :return: генератор строк NDJSON
+    """
+    questions = get_questions(survey_id)
+    for holder_id, user_id, answers in iter_responses(survey_id, chunk_size):
+        row = {}
+        for question_id, _, question_type in questions:
+            given_answers = answers.get(question_id, [])
+            if question_type == "MC":
+                row[str(question_id)] = given_answers
+            else:
+                row[str(question_id)] = given_answers[0] if given_answers else None
+        yield json.dumps({"id": holder_id, "user_ID": user_id, "answers": row}, ensure_ascii=False) + "\n"
+
+
+def export_responses(survey_id, export_format="csv", chunk_size=1000):
+    """
+    Выгружает ответы на опрос в заданном формате
+    :param survey_id: id опроса
+    :param export_format: один из EXPORT_FORMATS
+    :param chunk_size: количество прохождений, читаемых за один запрос
+    :return: генератор строк
+    """
+    if export_format == "ndjson":
+        return export_ndjson(survey_id, chunk_size)
+    return export_csv(survey_id, chunk_size)
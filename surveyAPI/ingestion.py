@@ -0,0 +1,107 @@
+from django.db import DatabaseError, connection, transaction
+
+from .models import PendingCompletion
+from .snapshots import get_completion_context
+from .storage import prepare_completion, save_completions
+from .validation import get_validation_index
+
+import json
+
+
+def enqueue_completion(validated_data):
+    """
+    Проверяет прохождение опроса и ставит его в очередь на запись вместо немедленного сохранения
+    :raises: AttributeError, ValueError, если ответы некорректны (см. SurveyValidationIndex.check_answers)
+    :param validated_data: проверенные UserAnswersHolderCreationSerializer данные
+    :return: объект типа PendingCompletion
+    """
+    survey_id = validated_data["survey"].id
+    validation_index = get_validation_index(survey_id)
+    validation_index.check_answers(validated_data["answers"])
+    answers = [{"question": question_id, "answer": answer}
+               for question_id, answer, _ in validation_index.build_answers(validated_data["answers"])]
+    return PendingCompletion.objects.create(survey_id=survey_id, user_ID=validated_data["user_ID"],
+                                            answers=json.dumps(answers, ensure_ascii=False))
+
+
+def drain(batch_size=100):
+    """
+    Записывает одну порцию прохождений из очереди: все корректные прохождения сохраняются
+    одной транзакцией, некорректные (например, если опрос изменился) помечаются как FAILED.
+    Если порция не сохраняется из-за ошибки базы данных, прохождения сохраняются по одному (см. save_separately).
+    Строки очереди блокируются, поэтому несколько воркеров могут работать одновременно
+    :param batch_size: максимальный размер порции
+    :return: количество обработанных прохождений
+    """
+    with transaction.atomic():
+        pending = PendingCompletion.objects.all().filter(status="QUEUED").order_by("id")
+        if connection.features.has_select_for_update:
+            pending = pending.select_for_update(skip_locked=connection.features.has_select_for_update_skip_locked)
+        pending = list(pending[:batch_size])
+
+        validation_indexes = {}
+        snapshot_hashes = {}
+        completions = []
+        for pending_completion in pending:
+            survey_id = pending_completion.survey_id
+            if survey_id not in validation_indexes:
+                validation_indexes[survey_id], snapshot_hashes[survey_id] = get_completion_context(survey_id)
+            try:
+                completion = prepare_completion(validation_indexes[survey_id], survey_id, pending_completion.user_ID,
+                                                json.loads(pending_completion.answers), snapshot_hashes[survey_id])
+            except (AttributeError, ValueError) as e:
+                pending_completion.status = "FAILED"
+                pending_completion.error = str(e)
+                continue
+            pending_completion.status = "DONE"
+            completions.append((pending_completion, completion))
+
+        try:
+            with transaction.atomic():
+                save_completions([completion for _, completion in completions])
+        except DatabaseError:
+            completions = save_separately(completions)
+        for pending_completion, completion in completions:
+            pending_completion.user_answers_holder = completion.user_answers_holder
+        PendingCompletion.objects.bulk_update(pending, ["status", "error", "user_answers_holder"])
+    return len(pending)
+
+
+def save_separately(completions):
+    """
+    Сохраняет прохождения по одному, каждое в своей точке сохранения. Вызывается, если порция
+    не сохранилась целиком: прохождения, запись которых завершается ошибкой базы данных, помечаются
+    как FAILED, чтобы не блокировать очередь, остальные сохраняются
+    :param completions: список пар (объект типа PendingCompletion, объект типа storage.Completion)
+    :return: список сохраненных пар
+    """
+    max_length = PendingCompletion._meta.get_field("error").max_length
+    saved = []
+    for pending_completion, completion in completions:
+        # id, назначенные при неудачной записи порции, откатились вместе с ней
+        completion.user_answers_holder.pk = None
+        for answer in completion.answers:
+            answer.pk = None
+        try:
+            with transaction.atomic():
+                save_completions([completion])
+        except DatabaseError as e:
+            pending_completion.status = "FAILED"
+            pending_completion.error = str(e)[:max_length]
+            continue
+        saved.append((pending_completion, completion))
+    return saved
+
+
+def drain_all(batch_size=100):
+    """
+    Записывает порции прохождений, пока очередь не опустеет
+    :param batch_size: максимальный размер порции
+    :return: количество обработанных прохождений
+    """
+    total = 0
+    while True:
+        processed = drain(batch_size)
+        total += processed
+        if processed < batch_size:
+            return total
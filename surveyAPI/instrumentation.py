@@ -0,0 +1,223 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import cache
+
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock, local
+import logging
+import os
+import socket
+import time
+
+DEFAULT_SURVEY_INSTRUMENTATION = {
+    "ENABLED": False,
+    "SLOW_REQUEST_MS": 500,
+    "SAMPLE_SIZE": 1000,
+    "PUBLISH_INTERVAL": 10,
+}
+
+PROCESSES_KEY = "instrumentation:processes"
+METRICS = ("wall_ms", "queries", "db_ms", "size", "serializer_ms")
+PERCENTILES = (50, 90, 99)
+
+logger = logging.getLogger("surveyAPI.instrumentation")
+
+
+def get_setting(name):
+    return getattr(settings, "SURVEY_INSTRUMENTATION", {}).get(name, DEFAULT_SURVEY_INSTRUMENTATION[name])
+
+
+class RequestMetrics:
+    """
+    Метрики одного запроса, собираемые во время его обработки
+    """
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.sql = []
+
+    def __call__(self, execute, sql, params, many, context):
+        """
+        Обертка выполнения запросов к базе данных (см. connection.execute_wrapper)
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += duration
+            self.sql.append((duration, sql))
+
+
+current = local()
+
+
+@contextmanager
+def serializer_timer():
+    """
+    Учитывает время выполнения блока как время сериализации текущего запроса.
+    Если инструментирование выключено, только проверяет атрибут thread-local
+    """
+    metrics = getattr(current, "metrics", None)
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_time += time.perf_counter() - start
+
+
+class StatsRegistry:
+    """
+    Потокобезопасное хранилище последних SAMPLE_SIZE измерений каждого эндпоинта в памяти процесса.
+    Раз в PUBLISH_INTERVAL секунд копия публикуется в общий кэш (если он настроен),
+    чтобы статистику всех процессов можно было собрать из любого из них
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.endpoints = {}
+        self.published_at = 0.0
+        self.key = "instrumentation:{}:{}".format(socket.gethostname(), os.getpid())
+
+    def record(self, endpoint, sample):
+        with self.lock:
+            if endpoint not in self.endpoints:
+                self.endpoints[endpoint] = {"count": 0, "samples": deque(maxlen=get_setting("SAMPLE_SIZE"))}
+            self.endpoints[endpoint]["count"] += 1
+            self.endpoints[endpoint]["samples"].append(sample)
+        if time.monotonic() - self.published_at >= get_setting("PUBLISH_INTERVAL"):
+            self.publish()
+
+    def snapshot(self):
+        with self.lock:
+            return {endpoint: {"count": stats["count"], "samples": list(stats["samples"])}
+                    for endpoint, stats in self.endpoints.items()}
+
+    def publish(self):
+        self.published_at = time.monotonic()
+        shared = cache.shared_cache()
+        if shared is None:
+            return
+        shared.set(self.key, self.snapshot(), None)
+        processes = shared.get(PROCESSES_KEY) or []
+        if self.key not in processes:
+            shared.set(PROCESSES_KEY, processes + [self.key], None)
+
+    def reset(self):
+        with self.lock:
+            self.endpoints = {}
+        shared = cache.shared_cache()
+        if shared is not None:
+            shared.delete_many((shared.get(PROCESSES_KEY) or []) + [PROCESSES_KEY])
+
+
+registry = StatsRegistry()
+
+
+class InstrumentationMiddleware:
+    """
+    Измеряет для каждого запроса время обработки, количество и время запросов к базе данных,
+    размер ответа и время сериализации, накапливая их по эндпоинтам (метод и шаблон url).
+    Запросы дольше SLOW_REQUEST_MS записываются в лог вместе с выполненным SQL.
+    Если settings.SURVEY_INSTRUMENTATION["ENABLED"] не True, Django исключает middleware из цепочки
+    """
+    def __init__(self, get_response):
+        if not get_setting("ENABLED"):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        current.metrics = metrics
+        start = time.perf_counter()
+        try:
+            with wrap_connections(metrics):
+                response = self.get_response(request)
+        finally:
+            current.metrics = None
+        wall_time = time.perf_counter() - start
+
+        endpoint = get_endpoint(request)
+        size = 0 if response.streaming else len(response.content)
+        registry.record(endpoint, (wall_time * 1000, metrics.queries, metrics.db_time * 1000, size,
+                                   metrics.serializer_time * 1000))
+        if wall_time * 1000 >= get_setting("SLOW_REQUEST_MS"):
+            log_slow_request(request, endpoint, wall_time, metrics)
+        return response
+
+
+@contextmanager
+def wrap_connections(metrics):
+    wrappers = [connection.execute_wrapper(metrics) for connection in connections.all()]
+    for wrapper in wrappers:
+        wrapper.__enter__()
+    try:
+        yield
+    finally:
+        for wrapper in reversed(wrappers):
+            wrapper.__exit__(None, None, None)
+
+
+def get_endpoint(request):
+    resolver_match = getattr(request, "resolver_match", None)
+    route = resolver_match.route if resolver_match is not None else "<unresolved>"
+    return "{} /{}".format(request.method, route)
+
+
+def log_slow_request(request, endpoint, wall_time, metrics):
+    statements = "\n".join("  {:.1f} ms: {}".format(duration * 1000, sql) for duration, sql in metrics.sql)
+    logger.warning("Slow request %s (%s): %.1f ms, %d queries in %.1f ms\n%s", endpoint, request.get_full_path(),
+                   wall_time * 1000, metrics.queries, metrics.db_time * 1000, statements)
+
+
+def percentile(values, rank):
+    """
+    :param values: отсортированный список
+    :param rank: процентиль от 0 до 100
+    :return: значение по методу ближайшего ранга
+    """
+    if not values:
+        return 0
+    return values[max(0, min(len(values) - 1, int(round(rank / 100 * len(values))) - 1))]
+
+
+def collect_snapshots():
+    """
+    :return: список снимков статистики: текущего процесса и опубликованных в общий кэш другими процессами
+    """
+    snapshots = [registry.snapshot()]
+    shared = cache.shared_cache()
+    if shared is not None:
+        keys = [key for key in shared.get(PROCESSES_KEY) or [] if key != registry.key]
+        snapshots.extend(shared.get_many(keys).values())
+    return snapshots
+
+
+def get_stats():
+    """
+    Собирает перцентили метрик по эндпоинтам из статистики всех процессов
+    :return: список словарей (endpoint, count, и для каждой метрики p50, p90, p99, max), упорядоченный по p99 времени
+    """
+    merged = {}
+    for snapshot in collect_snapshots():
+        for endpoint, stats in snapshot.items():
+            entry = merged.setdefault(endpoint, {"count": 0, "samples": []})
+            entry["count"] += stats["count"]
+            entry["samples"].extend(stats["samples"])
+
+    result = []
+    for endpoint, stats in merged.items():
+        row = {"endpoint": endpoint, "count": stats["count"]}
+        for position, metric in enumerate(METRICS):
+            values = sorted(sample[position] for sample in stats["samples"])
+            row[metric] = {"p{}".format(rank): round(percentile(values, rank), 2) for rank in PERCENTILES}
+            row[metric]["max"] = round(values[-1], 2) if values else 0
+        result.append(row)
+    return sorted(result, key=lambda row: row["wall_ms"]["p99"], reverse=True)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from surveyAPI.export import EXPORT_FORMATS, export_responses
+from surveyAPI.models import Survey
+
+
+class Command(BaseCommand):
+    help = "Streams responses of a survey as CSV (a row per completion, a column per question) or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("survey", type=int, help="Survey id")
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+        parser.add_argument("--output", help="Output file (stdout if not given)")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Completions read per query")
+
+    def handle(self, *args, **options):
+        if not Survey.objects.all().filter(pk=options["survey"]).exists():
+            raise CommandError("Survey ({}) was not found".format(options["survey"]))
+        lines = export_responses(options["survey"], options["format"], options["chunk_size"])
+        if options["output"] is None:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+        with open(options["output"], "w", encoding="utf-8", newline="") as output:
+            for line in lines:
+                output.write(line)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from surveyAPI.models import Survey
+from surveyAPI.transfer import export_surveys
+
+import time
+
+
+class Command(BaseCommand):
+    help = "Streams surveys with their questions and choices as JSONL accepted by import_surveys"
+
+    def add_arguments(self, parser):
+        parser.add_argument("surveys", type=int, nargs="*", help="Survey ids (all surveys if not given)")
+        parser.add_argument("--output", help="Output file (stdout if not given)")
+        parser.add_argument("--chunk-size", type=int, default=100, help="Surveys read per query")
+
+    def handle(self, *args, **options):
+        surveys = Survey.objects.all()
+        if options["surveys"]:
+            surveys = surveys.filter(id__in=options["surveys"])
+        lines = export_surveys(surveys, options["chunk_size"])
+        if options["output"] is None:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+        start = time.perf_counter()
+        exported = 0
+        with open(options["output"], "w", encoding="utf-8") as output:
+            for line in lines:
+                output.write(line)
+                exported += 1
+        elapsed = time.perf_counter() - start
+        self.stdout.write("Exported {} surveys in {:.1f} s ({:.1f} surveys/s)".format(
+            exported, elapsed, exported / elapsed if elapsed else 0))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from surveyAPI.synthetic import generate
+
+import time
+
+
+class Command(BaseCommand):
+    help = "Fills the database with synthetic surveys (questions of all types in turn: PT, SC, MC) " \
+           "and completions with random valid answers. The same seed on an empty database gives the same data"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--surveys", type=int, default=10, help="Number of surveys")
+        parser.add_argument("--questions", type=int, default=10, help="Questions per survey")
+        parser.add_argument("--choices", type=int, default=4, help="Choices per SC and MC question")
+        parser.add_argument("--completions", type=int, default=1000, help="Total number of completions")
+        parser.add_argument("--users", type=int, help="Number of distinct users (equal to completions if not given)")
+        parser.add_argument("--expired", type=float, default=0.0, help="Fraction of expired surveys")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Completions written per transaction")
+
+    def handle(self, *args, **options):
+        if options["surveys"] < 1 and options["completions"]:
+            raise CommandError("Completions need at least one survey")
+        if options["choices"] < 1 and options["questions"] > 1:
+            raise CommandError("SC and MC questions need at least one choice")
+        if not 0 <= options["expired"] <= 1:
+            raise CommandError("Expired fraction should be between 0 and 1")
+
+        start = time.perf_counter()
+
+        def progress(written):
+            if options["verbosity"] > 1:
+                self.stdout.write("{} completions written ({:.1f} s)".format(written, time.perf_counter() - start))
+
+        generate(options["surveys"], options["questions"], options["choices"], options["completions"],
+                 options["users"], options["expired"], options["seed"], options["chunk_size"], progress)
+        self.stdout.write("Generated {} surveys and {} completions in {:.1f} s".format(
+            options["surveys"], options["completions"], time.perf_counter() - start))
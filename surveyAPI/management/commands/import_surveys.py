@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from surveyAPI.transfer import import_surveys
+
+
+class Command(BaseCommand):
+    help = "Imports surveys from a JSONL file (one {\"survey\": {...}} object per line, see Examples/create_survey.json " \
+           "and export_surveys). Surveys are validated and inserted in chunks, a transaction per chunk; " \
+           "incorrect lines are skipped and reported"
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="JSONL file with surveys")
+        parser.add_argument("--chunk-size", type=int, default=100, help="Surveys validated and inserted per transaction")
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("Chunk size should be positive")
+
+        def progress(imported):
+            if options["verbosity"] > 1:
+                self.stdout.write("{} surveys imported".format(imported))
+
+        try:
+            with open(options["file"], encoding="utf-8") as surveys:
+                report = import_surveys(surveys, options["chunk_size"], progress)
+        except OSError as e:
+            raise CommandError("Cannot read surveys: {}".format(e))
+        for error in report["failed"]:
+            self.stderr.write("Line {}: {}".format(error["line"], error["errors"]))
+        self.stdout.write("Imported {} surveys in {:.1f} s ({} surveys/s), {} lines failed".format(
+            report["imported"], report["elapsed"], report["surveys_per_second"], len(report["failed"])))
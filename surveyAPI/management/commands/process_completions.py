@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from surveyAPI.ingestion import drain, drain_all
+
+import time
+
+
+class Command(BaseCommand):
+    help = "Writes survey completions accepted in asynchronous mode (SURVEY_ASYNC_COMPLETION) to the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100, help="Completions written per transaction")
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds to wait when the queue is empty")
+        parser.add_argument("--once", action="store_true", help="Drain the queue and exit")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            processed = drain_all(options["batch_size"])
+            self.stdout.write("Processed {} completions".format(processed))
+            return
+
+        while True:
+            processed = drain(options["batch_size"])
+            if processed:
+                self.stdout.write("Processed {} completions".format(processed))
+            else:
+                time.sleep(options["interval"])
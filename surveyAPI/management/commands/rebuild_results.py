@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from surveyAPI.models import Survey
+from surveyAPI.results import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = "Recomputes survey result counters from saved answers. " \
+           "Completions saved while the command runs may be missed, so run it when surveys are not being completed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("surveys", nargs="*", type=int, help="Survey ids (all surveys if not given)")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Completions read per query")
+
+    def handle(self, *args, **options):
+        survey_ids = options["surveys"] or Survey.objects.all().order_by("id").values_list("id", flat=True)
+        for survey_id in survey_ids:
+            rebuild_counters(survey_id, options["chunk_size"])
+            self.stdout.write("Rebuilt results of survey ({})".format(survey_id))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from surveyAPI.replay import InProcessTransport, HttpTransport, load_requests, replay, summarize
+
+import json
+
+COLUMNS = ["route", "count", "rps", "p50_ms", "p90_ms", "p99_ms", "max_ms", "errors", "error_rate"]
+
+
+class Command(BaseCommand):
+    help = "Replays recorded requests from a JSONL file (one {\"method\", \"path\", \"headers\", \"body\", " \
+           "\"expected\"} object per line, see Examples/traffic.jsonl) and reports throughput, latency " \
+           "percentiles and error rate per route. Requests go to the WSGI app in-process unless --url is given. " \
+           "In-process replay with concurrency uses a connection per thread, so it needs a database shared " \
+           "between connections (not in-memory SQLite)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="JSONL file with recorded requests")
+        parser.add_argument("--url", help="Base URL of a running instance, e.g. http://localhost:8000")
+        parser.add_argument("--concurrency", type=int, default=1, help="Number of concurrent clients")
+        parser.add_argument("--repeat", type=int, default=1, help="Number of passes over the file")
+        parser.add_argument("--timeout", type=float, default=30, help="HTTP timeout in seconds")
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1 or options["repeat"] < 1:
+            raise CommandError("Concurrency and repeat should be positive")
+        try:
+            with open(options["file"], encoding="utf-8") as recorded:
+                requests = load_requests(recorded)
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError("Cannot read recorded requests: {}".format(e))
+
+        if options["url"] is None:
+            make_transport = InProcessTransport
+        else:
+            def make_transport():
+                return HttpTransport(options["url"], options["timeout"])
+
+        results, elapsed = replay(requests, make_transport, options["concurrency"], options["repeat"])
+        summary = summarize(results, elapsed)
+        if options["json"]:
+            self.stdout.write(json.dumps({"elapsed": elapsed, "routes": summary}, indent=2))
+            return
+        rows = [[str(row[column]) for column in COLUMNS] for row in summary]
+        widths = [max(len(line[column]) for line in [COLUMNS] + rows) for column in range(len(COLUMNS))]
+        for line in [COLUMNS] + rows:
+            self.stdout.write("  ".join(value.ljust(width) for value, width in zip(line, widths)).rstrip())
+        self.stdout.write("{} requests in {:.2f} s".format(len(results), elapsed))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from surveyAPI.instrumentation import METRICS, get_stats, registry
+
+import json
+
+
+class Command(BaseCommand):
+    help = "Prints per-endpoint request stats (wall time, DB queries, DB time, response size, serializer time) " \
+           "collected by InstrumentationMiddleware. Stats of server processes are visible only when " \
+           "SURVEY_CACHE[\"BACKEND\"] points to a cache shared with them"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--json", action="store_true", help="Print stats as JSON")
+        parser.add_argument("--reset", action="store_true", help="Remove collected stats after printing")
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        if options["json"]:
+            self.stdout.write(json.dumps(stats, indent=2))
+        elif not stats:
+            self.stdout.write("No requests were recorded")
+        else:
+            header = ["endpoint", "count"] + ["{} p50/p99/max".format(metric) for metric in METRICS]
+            rows = [[row["endpoint"], str(row["count"])] +
+                    ["{p50:g}/{p99:g}/{max:g}".format(**row[metric]) for metric in METRICS] for row in stats]
+            widths = [max(len(line[column]) for line in [header] + rows) for column in range(len(header))]
+            for line in [header] + rows:
+                self.stdout.write("  ".join(value.ljust(width) for value, width in zip(line, widths)).rstrip())
+        if options["reset"]:
+            registry.reset()
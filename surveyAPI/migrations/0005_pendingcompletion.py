@@ -0,0 +1,38 @@
+# Generated by Django 2.2.10 on 2026-10-18 18:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveyAPI', '0004_useranswer_useranswersholder'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='useranswer',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='surveyAPI.Question'),
+        ),
+        migrations.CreateModel(
+            name='PendingCompletion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('receipt', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('user_ID', models.PositiveIntegerField()),
+                ('answers', models.TextField()),
+                ('status', models.CharField(choices=[('QUEUED', 'Queued'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='QUEUED', max_length=6)),
+                ('error', models.CharField(blank=True, default='', max_length=256)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('survey', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='surveyAPI.Survey')),
+                ('user_answers_holder', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='surveyAPI.UserAnswersHolder')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pendingcompletion',
+            index=models.Index(fields=['status', 'id'], name='surveyAPI_p_status_9301e9_idx'),
+        ),
+    ]
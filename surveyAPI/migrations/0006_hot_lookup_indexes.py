@@ -0,0 +1,25 @@
+# Generated by Django 2.2.10 on 2026-10-18 18:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveyAPI', '0005_pendingcompletion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='survey',
+            index=models.Index(fields=['end_date'], name='surveyAPI_s_end_dat_56c0e5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useranswer',
+            index=models.Index(fields=['user_answers_holder', 'question'], name='surveyAPI_u_user_an_e9e733_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useranswersholder',
+            index=models.Index(fields=['user_ID', 'survey'], name='surveyAPI_u_user_ID_da8f2f_idx'),
+        ),
+    ]
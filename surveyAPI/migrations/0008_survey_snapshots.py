@@ -0,0 +1,28 @@
+# Generated by Django 2.2.10 on 2026-10-18 18:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveyAPI', '0007_result_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SurveySnapshot',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('data', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('survey', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='surveyAPI.Survey')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='useranswersholder',
+            name='snapshot',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='surveyAPI.SurveySnapshot'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.10 on 2026-10-18 18:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveyAPI', '0009_survey_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pendingcompletion',
+            name='user_answers_holder',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='surveyAPI.UserAnswersHolder'),
+        ),
+        migrations.AlterField(
+            model_name='useranswer',
+            name='question',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='surveyAPI.Question'),
+        ),
+        migrations.AlterField(
+            model_name='useranswersholder',
+            name='snapshot',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='surveyAPI.SurveySnapshot'),
+        ),
+        migrations.AlterField(
+            model_name='useranswersholder',
+            name='survey',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='surveyAPI.Survey'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.10 on 2026-10-18 18:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveyAPI', '0010_sharded_completions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['text'], name='surveyAPI_q_text_17ca07_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='questionanswer',
+            index=models.Index(fields=['text'], name='surveyAPI_q_text_c6b9f0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='survey',
+            index=models.Index(fields=['start_date'], name='surveyAPI_s_start_d_9f5507_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='survey',
+            index=models.Index(fields=['title'], name='surveyAPI_s_title_6c81ab_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.10 on 2026-10-18 19:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveyAPI', '0011_admin_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='useranswer',
+            name='choice',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='surveyAPI.QuestionAnswer'),
+        ),
+        migrations.AlterField(
+            model_name='useranswer',
+            name='answer',
+            field=models.CharField(blank=True, default='', max_length=1024),
+        ),
+    ]
@@ -0,0 +1,122 @@
+from django.db import DEFAULT_DB_ALIAS, migrations, transaction
+
+import json
+
+CHUNK_SIZE = 1000
+
+
+def load_choices(Question, question_ids, questions):
+    """
+    Дополняет questions вариантами ответа вопросов из question_ids (id вопроса -> словарь текст -> id варианта,
+    при одинаковых текстах - меньший id, как в SurveyValidationIndex). Вопросы хранятся в основной базе данных
+    """
+    missing = [question_id for question_id in question_ids if question_id not in questions]
+    rows = Question.objects.using(DEFAULT_DB_ALIAS).filter(id__in=missing, question_type__in=("SC", "MC"))\
+        .order_by("id", "question_answers__id").values_list("id", "question_answers__id", "question_answers__text")
+    for question_id in missing:
+        questions[question_id] = {}
+    for question_id, choice_id, text in rows:
+        if choice_id is not None:
+            questions[question_id].setdefault(text, choice_id)
+
+
+def load_snapshots(SurveySnapshot, snapshot_hashes, snapshots):
+    """
+    Дополняет snapshots вариантами ответа из снимков snapshot_hashes: hash -> пара словарей
+    ((id вопроса, текст) -> id варианта, при одинаковых текстах - меньший id; id варианта -> текст).
+    Отсутствующие снимки сохраняются пустыми. Снимки хранятся в основной базе данных
+    """
+    missing = [snapshot_hash for snapshot_hash in snapshot_hashes if snapshot_hash not in snapshots]
+    for snapshot_hash in missing:
+        snapshots[snapshot_hash] = ({}, {})
+    for snapshot_hash, data in SurveySnapshot.objects.using(DEFAULT_DB_ALIAS).filter(hash__in=missing)\
+            .values_list("hash", "data"):
+        choices, texts = snapshots[snapshot_hash]
+        for question in json.loads(data)["questions"]:
+            for choice in sorted(question["question_answers"], key=lambda choice: choice["id"]):
+                choices.setdefault((question["id"], choice["text"]), choice["id"])
+                texts[choice["id"]] = choice["text"]
+
+
+def backfill_choices(apps, schema_editor):
+    """
+    Заполняет choice у ответов на вопросы с выбором, порциями по CHUNK_SIZE, каждая порция в своей транзакции.
+    Ответы прохождений со снимком сопоставляются с вариантами ответа снимка (тексты могли измениться после
+    прохождения), и только у них удаляется текст: он восстанавливается из снимка по id варианта.
+    Остальные ответы сопоставляются с текущими вариантами ответа и сохраняют текст.
+    Ответы, не совпадающие ни с одним вариантом (вариант изменен или удален), остаются без choice
+    """
+    Question = apps.get_model("surveyAPI", "Question")
+    SurveySnapshot = apps.get_model("surveyAPI", "SurveySnapshot")
+    UserAnswer = apps.get_model("surveyAPI", "UserAnswer")
+    alias = schema_editor.connection.alias
+    questions = {}
+    snapshots = {}
+    last_id = 0
+    while True:
+        rows = list(UserAnswer.objects.using(alias).filter(id__gt=last_id, choice__isnull=True).order_by("id")
+                    .values_list("id", "question_id", "answer", "user_answers_holder__snapshot_id")[:CHUNK_SIZE])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        load_choices(Question, {question_id for _, question_id, _, _ in rows}, questions)
+        load_snapshots(SurveySnapshot, {snapshot_id for _, _, _, snapshot_id in rows if snapshot_id is not None},
+                       snapshots)
+        answers = []
+        for pk, question_id, answer, snapshot_id in rows:
+            choice_id = None
+            if snapshot_id is not None:
+                choice_id = snapshots[snapshot_id][0].get((question_id, answer))
+            if choice_id is not None:
+                answers.append(UserAnswer(id=pk, choice_id=choice_id, answer=""))
+                continue
+            choice_id = questions[question_id].get(answer)
+            if choice_id is not None:
+                answers.append(UserAnswer(id=pk, choice_id=choice_id, answer=answer))
+        with transaction.atomic(using=alias):
+            UserAnswer.objects.using(alias).bulk_update(answers, ["choice", "answer"])
+
+
+def restore_texts(apps, schema_editor):
+    """
+    Возвращает текст в ответы на вопросы с выбором: из снимка прохождения, а если варианта в нем нет -
+    текущий текст варианта ответа
+    """
+    QuestionAnswer = apps.get_model("surveyAPI", "QuestionAnswer")
+    SurveySnapshot = apps.get_model("surveyAPI", "SurveySnapshot")
+    UserAnswer = apps.get_model("surveyAPI", "UserAnswer")
+    alias = schema_editor.connection.alias
+    snapshots = {}
+    last_id = 0
+    while True:
+        rows = list(UserAnswer.objects.using(alias).filter(id__gt=last_id, choice__isnull=False, answer="")
+                    .order_by("id").values_list("id", "choice_id", "user_answers_holder__snapshot_id")[:CHUNK_SIZE])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        load_snapshots(SurveySnapshot, {snapshot_id for _, _, snapshot_id in rows if snapshot_id is not None},
+                       snapshots)
+        texts = dict(QuestionAnswer.objects.using(DEFAULT_DB_ALIAS)
+                     .filter(id__in={choice_id for _, choice_id, _ in rows}).values_list("id", "text"))
+        answers = []
+        for pk, choice_id, snapshot_id in rows:
+            text = snapshots[snapshot_id][1].get(choice_id) if snapshot_id is not None else None
+            if text is None:
+                text = texts.get(choice_id)
+            if text is not None:
+                answers.append(UserAnswer(id=pk, answer=text))
+        with transaction.atomic(using=alias):
+            UserAnswer.objects.using(alias).bulk_update(answers, ["answer"])
+
+
+class Migration(migrations.Migration):
+    # Каждая порция фиксируется отдельно, чтобы не держать всю таблицу ответов в одной транзакции
+    atomic = False
+
+    dependencies = [
+        ('surveyAPI', '0012_user_answer_choice'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_choices, restore_texts),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 
+import uuid
+
 
 class Survey(models.Model):
     objects = models.Manager()
@@ -7,6 +9,12 @@ class Survey(models.Model):
     start_date = models.DateField(auto_now_add=True)
     end_date = models.DateField()
     description = models.CharField(max_length=2048, default="No description")
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["end_date"]), models.Index(fields=["start_date"]),
+                   models.Index(fields=["title"])]
 
 
 class Question(models.Model):
@@ -22,21 +30,112 @@ class Question(models.Model):
 
     question_type = models.CharField(max_length=2, choices=QUESTION_TYPE_CHOICES)
 
+    class Meta:
+        indexes = [models.Index(fields=["text"])]
+
 
 class QuestionAnswer(models.Model):
     objects = models.Manager()
     question = models.ForeignKey(Question, related_name="question_answers", on_delete=models.CASCADE)
     text = models.CharField(max_length=128)
 
+    class Meta:
+        indexes = [models.Index(fields=["text"])]
+
+
+class SurveySnapshot(models.Model):
+    """
+    Неизменяемая сериализованная версия опроса, на которую ссылаются его прохождения.
+    Первичный ключ - SHA-256 от data, поэтому одинаковые версии хранятся один раз
+    """
+    objects = models.Manager()
+    hash = models.CharField(max_length=64, primary_key=True)
+    survey = models.ForeignKey(Survey, related_name="snapshots", on_delete=models.CASCADE)
+    data = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
 
 class UserAnswersHolder(models.Model):
+    """
+    Прохождение опроса. Вместе с ответами может храниться в шарде пользователя (см. surveyAPI/sharding.py),
+    поэтому внешние ключи на таблицы основной базы данных не создают ограничений в базе данных
+    """
     objects = models.Manager()
-    survey = models.ForeignKey(Survey, on_delete=models.CASCADE)
+    survey = models.ForeignKey(Survey, on_delete=models.CASCADE, db_constraint=False)
     user_ID = models.PositiveIntegerField()
+    snapshot = models.ForeignKey(SurveySnapshot, null=True, on_delete=models.CASCADE, db_constraint=False)
+
+    class Meta:
+        indexes = [models.Index(fields=["user_ID", "survey"])]
 
 
 class UserAnswer(models.Model):
+    """
+    Ответ на вопрос. Для вопросов с выбором хранится id выбранного варианта (choice), а его текст берется
+    из снимка опроса, на который ссылается прохождение (см. snapshots.resolve_answer_texts), поэтому answer
+    содержит текст только ответов на вопросы типа PT и ответов прохождений без снимка.
+    Удаление варианта ответа не затрагивает ответы: текст остается в снимке
+    """
     objects = models.Manager()
     user_answers_holder = models.ForeignKey(UserAnswersHolder, related_name="answers", on_delete=models.CASCADE)
-    question = models.ForeignKey(Question, on_delete=models.CASCADE)
-    answer = models.CharField(max_length=1024)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, db_constraint=False)
+    choice = models.ForeignKey(QuestionAnswer, null=True, related_name="+", on_delete=models.DO_NOTHING,
+                               db_constraint=False)
+    answer = models.CharField(max_length=1024, blank=True, default="")
+
+    class Meta:
+        indexes = [models.Index(fields=["user_answers_holder", "question"])]
+
+
+class PendingCompletion(models.Model):
+    """
+    Прохождение опроса, принятое в асинхронном режиме и ожидающее записи воркером process_completions
+    """
+    objects = models.Manager()
+    receipt = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    survey = models.ForeignKey(Survey, on_delete=models.CASCADE)
+    user_ID = models.PositiveIntegerField()
+    answers = models.TextField()
+
+    STATUS_CHOICES = [
+        ("QUEUED", "Queued"),
+        ("DONE", "Done"),
+        ("FAILED", "Failed"),
+    ]
+
+    status = models.CharField(max_length=6, choices=STATUS_CHOICES, default="QUEUED")
+    user_answers_holder = models.ForeignKey(UserAnswersHolder, null=True, on_delete=models.SET_NULL,
+                                            db_constraint=False)
+    error = models.CharField(max_length=256, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "id"])]
+
+
+class SurveyCounter(models.Model):
+    """
+    Количество прохождений опроса. Обновляется в транзакции прохождения (см. surveyAPI/results.py)
+    """
+    objects = models.Manager()
+    survey = models.OneToOneField(Survey, primary_key=True, related_name="counter", on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(default=0)
+
+
+class QuestionCounter(models.Model):
+    """
+    Количество прохождений, в которых дан ответ на вопрос
+    """
+    objects = models.Manager()
+    question = models.OneToOneField(Question, primary_key=True, related_name="counter", on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(default=0)
+
+
+class QuestionAnswerCounter(models.Model):
+    """
+    Количество прохождений, в которых выбран вариант ответа
+    """
+    objects = models.Manager()
+    question_answer = models.OneToOneField(QuestionAnswer, primary_key=True, related_name="counter",
+                                           on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(default=0)
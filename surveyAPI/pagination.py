@@ -0,0 +1,114 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+import binascii
+import json
+
+
+def encode_cursor(position):
+    """
+    :param position: id последнего объекта страницы или пара [значение поля сортировки, id]
+    :return: непрозрачная строка (для id совпадает с прежним форматом курсора)
+    """
+    return urlsafe_b64encode(json.dumps(position, separators=(",", ":")).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValidationError("Incorrect cursor!")
+
+
+def is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def get_page_params(request):
+    """
+    Разбирает параметры страницы из запроса: cursor (непрозрачная строка из поля next предыдущей страницы)
+    и limit (размер страницы, по умолчанию SURVEY_PAGE_SIZE, не больше SURVEY_MAX_PAGE_SIZE)
+    :raises: ValidationError (HTTP 400), если параметры некорректны
+    :param request: запрос
+    :return: пара (позиция, после которой начинается страница (см. encode_cursor), или None; размер страницы)
+    """
+    cursor = request.query_params.get("cursor", None)
+    after = decode_cursor(cursor) if cursor else None
+    limit = request.query_params.get("limit", None)
+    if limit is None:
+        return after, settings.SURVEY_PAGE_SIZE
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValidationError("Incorrect limit!")
+    if limit < 1:
+        raise ValidationError("Incorrect limit!")
+    return after, min(limit, settings.SURVEY_MAX_PAGE_SIZE)
+
+
+def paginate_queryset(queryset, request, ordering="id"):
+    """
+    Возвращает страницу объектов, упорядоченных по полю ordering, а при равенстве - по id
+    (keyset-пагинация: запрос страницы использует индекс и не зависит от количества предыдущих страниц)
+    :raises: ValidationError (HTTP 400), если курсор не подходит к сортировке
+    :param queryset: QuerySet
+    :param request: запрос
+    :param ordering: имя поля модели, с префиксом "-" для сортировки по убыванию
+    :return: пара (список объектов страницы, курсор следующей страницы или None)
+    """
+    after, limit = get_page_params(request)
+    descending = ordering.startswith("-")
+    field = queryset.model._meta.get_field(ordering.lstrip("-"))
+    column = field.attname
+    operator = "lt" if descending else "gt"
+    if column == "id":
+        queryset = queryset.order_by(ordering)
+        if after is not None:
+            if not is_id(after):
+                raise ValidationError("Incorrect cursor!")
+            queryset = queryset.filter(**{"id__" + operator: after})
+    else:
+        queryset = queryset.order_by(("-" if descending else "") + column, "-id" if descending else "id")
+        if after is not None:
+            if not isinstance(after, list) or len(after) != 2 or not is_id(after[1]):
+                raise ValidationError("Incorrect cursor!")
+            try:
+                value = field.to_python(after[0])
+            except DjangoValidationError:
+                raise ValidationError("Incorrect cursor!")
+            queryset = queryset.filter(Q(**{column + "__" + operator: value}) |
+                                       Q(**{column: value, "id__" + operator: after[1]}))
+    objects = list(queryset[:limit + 1])
+    if len(objects) > limit:
+        last = objects[limit - 1]
+        position = last.id if column == "id" else [field.value_to_string(last), last.id]
+        return objects[:limit], encode_cursor(position)
+    return objects, None
+
+
+def paginate_payloads(payloads, request):
+    """
+    Возвращает страницу уже сериализованных объектов, упорядоченных по id
+    :param payloads: список сериализованных объектов, упорядоченный по id
+    :param request: запрос
+    :return: пара (список объектов страницы, курсор следующей страницы или None)
+    """
+    after, limit = get_page_params(request)
+    if after is not None and not is_id(after):
+        raise ValidationError("Incorrect cursor!")
+    start = 0
+    if after is not None:
+        end = len(payloads)
+        while start < end:
+            middle = (start + end) // 2
+            if payloads[middle]["id"] <= after:
+                start = middle + 1
+            else:
+                end = middle
+    page = payloads[start:start + limit]
+    if start + limit < len(payloads):
+        return page, encode_cursor(page[-1]["id"])
+    return page, None
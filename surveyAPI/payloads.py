@@ -0,0 +1,112 @@
+from . import cache
+from .models import Survey
+from .queries import readable_active_surveys, with_questions
+from .representations import represent_surveys
+from .versions import combine_versions, get_list_version, get_survey_versions
+
+from datetime import datetime
+
+
+def today():
+    return datetime.now().date()
+
+
+def survey_key(survey_id, version):
+    return "survey:{}:{}".format(survey_id, version)
+
+
+def render_surveys(survey_ids):
+    surveys = list(with_questions(Survey.objects.all().filter(pk__in=survey_ids)))
+    return {survey.id: (survey.end_date, payload, survey.version, survey.updated_at)
+            for survey, payload in zip(surveys, represent_surveys(surveys))}
+
+
+def render_active_surveys():
+    surveys = sorted(readable_active_surveys(), key=lambda survey: survey.id)
+    return represent_surveys(surveys), combine_versions([(survey.id, survey.version) for survey in surveys])
+
+
+def get_survey_entries(survey_ids, active_only=True):
+    """
+    Возвращает сериализованные опросы вместе с их версиями, используя кэш. Версии читаются из базы данных
+    одним запросом (см. versions.get_survey_versions) и входят в ключи кэша, поэтому изменение опроса в любом
+    процессе сразу становится видно во всех. Отсутствующие в кэше опросы сериализуются вместе фиксированным
+    числом запросов и кэшируются, только если сериализованы в той же версии, что прочитана.
+    version и updated_at закэшированных опросов берутся из базы данных, а не из кэша (по ним строятся ETag
+    и Last-Modified, см. views.SurveyView.retrieve)
+    :param survey_ids: список id опросов
+    :param active_only: если True, опросы с истекшим сроком не возвращаются
+    :return: словарь id опроса -> (end_date, сериализованный опрос, version, updated_at) (без не найденных опросов)
+    """
+    versions = get_survey_versions(set(survey_ids))
+    keys = {survey_id: survey_key(survey_id, version) for survey_id, (version, _) in versions.items()}
+    entries = {}
+    for survey_id, key in keys.items():
+        entry = cache.get(key)
+        if entry is not None:
+            entries[survey_id] = entry[:2] + versions[survey_id]
+    missing = [survey_id for survey_id in keys if survey_id not in entries]
+    if missing:
+        for survey_id, entry in render_surveys(missing).items():
+            if entry[2:] == versions[survey_id]:
+                cache.set(keys[survey_id], entry)
+            entries[survey_id] = entry
+
+    current_date = today()
+    return {survey_id: entry for survey_id, entry in entries.items() if not active_only or entry[0] >= current_date}
+
+
+def get_survey_payloads(survey_ids, active_only=True):
+    """
+    Возвращает сериализованные опросы, используя кэш (см. get_survey_entries)
+    :param survey_ids: список id опросов
+    :param active_only: если True, опросы с истекшим сроком не возвращаются
+    :return: словарь id опроса -> сериализованный опрос (без не найденных опросов)
+    """
+    return {survey_id: entry[1] for survey_id, entry in get_survey_entries(survey_ids, active_only).items()}
+
+
+def get_survey_entry(survey_id, active_only=True):
+    """
+    Возвращает сериализованный опрос вместе с его версией, используя кэш
+    :param survey_id: id опроса
+    :param active_only: если True, опрос с истекшим сроком не возвращается
+    :return: (end_date, сериализованный опрос, version, updated_at) или None, если опрос не найден или его срок истек
+    """
+    return get_survey_entries([survey_id], active_only).get(survey_id)
+
+
+def get_survey_payload(survey_id, active_only=True):
+    """
+    Возвращает сериализованный опрос, используя кэш
+    :param survey_id: id опроса
+    :param active_only: если True, опрос с истекшим сроком не возвращается
+    :return: сериализованный опрос или None, если опрос не найден или его срок истек
+    """
+    return get_survey_payloads([survey_id], active_only).get(survey_id)
+
+
+def get_active_surveys_entry():
+    """
+    Возвращает сериализованный список актуальных опросов, упорядоченный по id, и версию этого набора, используя кэш.
+    Ключ включает версию набора, прочитанную из базы данных (см. versions.get_list_version), и текущую дату,
+    поэтому истекшие опросы пропадают из списка без изменений в базе
+    :return: пара (список сериализованных опросов, версия набора (см. combine_versions))
+    """
+    list_version = get_list_version()
+    key = "surveys:{}:{}".format(list_version, today().isoformat())
+    payloads = cache.get(key)
+    if payloads is not None:
+        return payloads, list_version
+    payloads, rendered_version = render_active_surveys()
+    if rendered_version == list_version:
+        cache.set(key, payloads)
+    return payloads, rendered_version
+
+
+def get_active_surveys_payload():
+    """
+    Возвращает сериализованный список актуальных опросов, упорядоченный по id, используя кэш
+    :return: список сериализованных опросов
+    """
+    return get_active_surveys_entry()[0]
@@ -0,0 +1,66 @@
+from .models import Survey, UserAnswersHolder
+from .sharding import shard_for
+
+from datetime import datetime
+
+
+def with_questions(surveys):
+    """
+    Подгружает вопросы и варианты ответов для набора опросов фиксированным числом запросов
+    :param surveys: QuerySet объектов типа Survey
+    :return: QuerySet, готовый к сериализации через SurveySerializer
+    """
+    return surveys.prefetch_related("questions__question_answers")
+
+
+def with_question_answers(questions):
+    """
+    Подгружает варианты ответов для набора вопросов одним дополнительным запросом
+    :param questions: QuerySet объектов типа Question
+    :return: QuerySet, готовый к сериализации через QuestionSerializer
+    """
+    return questions.prefetch_related("question_answers")
+
+
+def active_surveys():
+    """
+    Возвращает все опросы, срок действия которых еще не истек
+    :return: QuerySet объектов типа Survey
+    """
+    return Survey.objects.all().filter(end_date__gte=datetime.now().date())
+
+
+def readable_active_surveys():
+    """
+    Возвращает актуальные опросы, подготовленные к сериализации
+    :return: QuerySet объектов типа Survey
+    """
+    return with_questions(active_surveys())
+
+
+def completed_surveys(user_id):
+    """
+    Возвращает пройденные пользователем опросы с ответами, но без вложенных опросов, из шарда пользователя
+    :param user_id: id пользователя
+    :return: QuerySet объектов типа UserAnswersHolder
+    """
+    return UserAnswersHolder.objects.using(shard_for(user_id)).filter(user_ID=user_id).prefetch_related("answers")
+
+
+def iter_completed_survey_chunks(survey_id, chunk_size=1000, using=None):
+    """
+    Перебирает прохождения опроса порциями, упорядоченными по id. Каждая порция читается
+    отдельным запросом по индексу, поэтому память не зависит от общего количества прохождений
+    :param survey_id: id опроса
+    :param chunk_size: количество прохождений в порции
+    :param using: alias базы данных (шарда), из которой читаются прохождения (см. sharding.shard_aliases)
+    :return: генератор списков троек (id прохождения, id пользователя, hash снимка или None)
+    """
+    last_id = 0
+    while True:
+        chunk = list(UserAnswersHolder.objects.using(using).filter(survey_id=survey_id, id__gt=last_id)
+                     .order_by("id").values_list("id", "user_ID", "snapshot_id")[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1][0]
@@ -0,0 +1,154 @@
+from django.db import connections, router
+from rest_framework.exceptions import ValidationError
+
+from .models import Question, QuestionAnswer
+
+
+def can_return_ids(model):
+    """
+    :param model: модель
+    :return: True, если база данных, в которую записываются объекты модели (с учетом DATABASE_ROUTERS),
+    возвращает id строк, вставленных bulk insert
+    """
+    return connections[router.db_for_write(model)].features.can_return_ids_from_bulk_insert
+
+
+def create_all(objects):
+    """
+    Сохраняет новые объекты одной моделью так, чтобы у них появились id: одним bulk insert,
+    если база данных, в которую записывается модель (см. can_return_ids), возвращает id вставленных строк,
+    иначе по одному INSERT на объект
+    :param objects: список несохраненных объектов одной модели
+    """
+    if not objects:
+        return
+    if can_return_ids(type(objects[0])):
+        type(objects[0]).objects.bulk_create(objects)
+        return
+    for obj in objects:
+        obj.save()
+
+
+def empty_changes():
+    """
+    :return: словарь изменений, в котором ничего не изменено
+    """
+    return {
+        "fields": [],
+        "questions": {"created": 0, "updated": 0, "deleted": 0},
+        "question_answers": {"created": 0, "updated": 0, "deleted": 0},
+    }
+
+
+def has_changes(changes):
+    """
+    :param changes: словарь изменений (см. empty_changes)
+    :return: True, если хоть что-то изменено
+    """
+    return bool(changes["fields"]) or any(count for kind in ("questions", "question_answers")
+                                          for count in changes[kind].values())
+
+
+def set_fields(instance, data, fields):
+    """
+    Присваивает объекту значения из data, отличающиеся от текущих
+    :param instance: объект модели
+    :param data: словарь новых значений (отсутствующие ключи не меняются)
+    :param fields: список изменяемых полей
+    :return: список измененных полей
+    """
+    changed = []
+    for field in fields:
+        if field in data and getattr(instance, field) != data[field]:
+            setattr(instance, field, data[field])
+            changed.append(field)
+    return changed
+
+
+def reconcile_question_answers(questions, changes):
+    """
+    Приводит варианты ответа вопросов к присланным: варианты с id обновляются, если изменились,
+    варианты без id создаются, отсутствующие удаляются. У вопросов типа PT удаляются все варианты.
+    Выполняет не больше трех запросов на изменение для всех вопросов вместе
+    :raises: ValidationError, если id варианта не относится к вопросу
+    :param questions: список троек (сохраненный вопрос, список его текущих вариантов,
+        список присланных вариантов или None, если варианты не меняются)
+    :param changes: словарь изменений (см. empty_changes), дополняется
+    """
+    to_create, to_update, to_delete = [], [], []
+    for question, current_choices, choices_data in questions:
+        if question.question_type == "PT":
+            to_delete.extend(choice.id for choice in current_choices)
+            continue
+        if choices_data is None:
+            continue
+        current_choices = {choice.id: choice for choice in current_choices}
+        kept = set()
+        for choice_data in choices_data:
+            choice_id = choice_data.get("id", None)
+            if choice_id is None:
+                if "text" not in choice_data:
+                    raise ValidationError("New question answer should have text!")
+                to_create.append(QuestionAnswer(question=question, text=choice_data["text"]))
+                continue
+            if choice_id not in current_choices:
+                raise ValidationError("Question answer ({}) does not belong to question ({})"
+                                      .format(choice_id, question.id))
+            kept.add(choice_id)
+            if set_fields(current_choices[choice_id], choice_data, ["text"]):
+                to_update.append(current_choices[choice_id])
+        to_delete.extend(choice_id for choice_id in current_choices if choice_id not in kept)
+
+    if to_update:
+        QuestionAnswer.objects.bulk_update(to_update, ["text"])
+    if to_create:
+        QuestionAnswer.objects.bulk_create(to_create)
+    if to_delete:
+        QuestionAnswer.objects.all().filter(pk__in=to_delete).delete()
+    changes["question_answers"]["created"] += len(to_create)
+    changes["question_answers"]["updated"] += len(to_update)
+    changes["question_answers"]["deleted"] += len(to_delete)
+
+
+def reconcile_questions(survey, questions_data, changes):
+    """
+    Приводит вопросы опроса (и их варианты ответа) к присланным: вопросы с id обновляются,
+    если изменились, вопросы без id создаются, отсутствующие удаляются вместе с ответами на них
+    :raises: ValidationError, если id вопроса или варианта не относится к опросу
+    :param survey: сохраненный опрос
+    :param questions_data: список присланных вопросов
+    :param changes: словарь изменений (см. empty_changes), дополняется
+    """
+    current_questions = {question.id: question
+                         for question in Question.objects.all().filter(survey=survey).prefetch_related("question_answers")}
+    to_create, to_update, kept = [], [], set()
+    reconciled = []
+    for question_data in questions_data:
+        question_id = question_data.get("id", None)
+        choices_data = question_data.get("question_answers", None)
+        if question_id is None:
+            if "text" not in question_data or "question_type" not in question_data:
+                raise ValidationError("New question should have text and question_type!")
+            question = Question(survey=survey, text=question_data["text"], question_type=question_data["question_type"])
+            to_create.append(question)
+            reconciled.append((question, [], choices_data))
+            continue
+        if question_id not in current_questions:
+            raise ValidationError("Question ({}) does not belong to survey ({})".format(question_id, survey.id))
+        question = current_questions[question_id]
+        kept.add(question_id)
+        if set_fields(question, question_data, ["text", "question_type"]):
+            to_update.append(question)
+        reconciled.append((question, list(question.question_answers.all()), choices_data))
+    to_delete = [question_id for question_id in current_questions if question_id not in kept]
+
+    if to_update:
+        Question.objects.bulk_update(to_update, ["text", "question_type"])
+    create_all(to_create)
+    if to_delete:
+        Question.objects.all().filter(pk__in=to_delete).delete()
+    changes["questions"]["created"] += len(to_create)
+    changes["questions"]["updated"] += len(to_update)
+    changes["questions"]["deleted"] += len(to_delete)
+
+    reconcile_question_answers(reconciled, changes)
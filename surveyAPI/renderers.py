@@ -0,0 +1,62 @@
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+import io
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_OPTIONS = 0 if orjson is None else \
+    orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+# orjson превращает целые длиннее 64 бит в float, а json сохраняет их точно
+LONG_NUMBER = re.compile(rb"\d{19}")
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer, кодирующий компактный JSON через orjson (если он установлен).
+    Типы, которые orjson не поддерживает или кодирует иначе (даты и время, множества, Decimal, ленивые строки),
+    передаются JSONEncoder, как в JSONRenderer. Если orjson не справляется (например, слишком большое целое),
+    или нужен отступ, или отключены COMPACT_JSON, UNICODE_JSON или STRICT_JSON, используется JSONRenderer.
+    Единственное отличие: NaN и бесконечность кодируются как null, а не вызывают ValueError
+    """
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or not self.compact or self.ensure_ascii or not self.strict or \
+                self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder.default, option=ORJSON_OPTIONS)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Как и JSONRenderer, экранирует \u2028 и \u2029, чтобы ответ оставался подмножеством JavaScript
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser, разбирающий тело запроса в UTF-8 через orjson (если он установлен).
+    Тело, которое orjson не принимает или может разобрать иначе (числа из 19 и более цифр), разбирается JSONParser,
+    поэтому ошибки и допустимые значения не меняются
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace("-", "") != "utf8":
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        if LONG_NUMBER.search(body):
+            return super().parse(io.BytesIO(body), media_type, parser_context)
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,170 @@
+from django.test import Client
+from django.urls import resolve, Resolver404
+
+from .instrumentation import PERCENTILES, percentile
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import local
+from urllib.parse import urlsplit
+import http.client
+import json
+import time
+
+
+class RecordedRequest:
+    """
+    Записанный запрос: метод, путь (с query string), заголовки и тело. Тело-объект отправляется как JSON
+    """
+    def __init__(self, method, path, headers=None, body=None, expected=None):
+        self.method = method.upper()
+        self.path = path
+        self.headers = headers or {}
+        self.body = body
+        self.expected = expected
+        self.route = route_of(self.method, path)
+
+    @classmethod
+    def from_json(cls, line):
+        data = json.loads(line)
+        return cls(data["method"], data["path"], data.get("headers"), data.get("body"), data.get("expected"))
+
+    def encoded_body(self):
+        if self.body is None:
+            return None
+        if isinstance(self.body, str):
+            return self.body.encode("utf-8")
+        return json.dumps(self.body, ensure_ascii=False).encode("utf-8")
+
+    def content_type(self):
+        for name, value in self.headers.items():
+            if name.lower() == "content-type":
+                return value
+        return "application/json"
+
+
+def route_of(method, path):
+    """
+    :return: строка "метод /шаблон url", как в статистике InstrumentationMiddleware
+    """
+    try:
+        route = resolve(urlsplit(path).path).route
+    except Resolver404:
+        route = "<unresolved>"
+    return "{} /{}".format(method, route)
+
+
+def load_requests(lines):
+    """
+    :param lines: строки JSONL с ключами method, path и необязательными headers, body, expected (ожидаемый код ответа)
+    :return: список объектов типа RecordedRequest
+    """
+    return [RecordedRequest.from_json(line) for line in lines if line.strip()]
+
+
+class InProcessTransport:
+    """
+    Отправляет запросы в WSGI-обработчик Django в том же процессе, без сети
+    """
+    def __init__(self):
+        self.client = Client()
+
+    def send(self, request):
+        extra = {"HTTP_" + name.upper().replace("-", "_"): value for name, value in request.headers.items()
+                 if name.lower() != "content-type"}
+        body = request.encoded_body()
+        if body is None:
+            response = self.client.generic(request.method, request.path, **extra)
+        else:
+            response = self.client.generic(request.method, request.path, body, request.content_type(), **extra)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response.status_code
+
+
+class HttpTransport:
+    """
+    Отправляет запросы по HTTP, переиспользуя одно соединение (keep-alive)
+    """
+    def __init__(self, base_url, timeout=30):
+        url = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        self.connection = connection_class(url.netloc, timeout=timeout)
+        self.prefix = url.path.rstrip("/")
+
+    def send(self, request):
+        headers = dict(request.headers)
+        body = request.encoded_body()
+        if body is not None:
+            headers.setdefault("Content-Type", request.content_type())
+        try:
+            self.connection.request(request.method, self.prefix + request.path, body, headers)
+            response = self.connection.getresponse()
+            response.read()
+        except (http.client.HTTPException, OSError):
+            self.connection.close()
+            raise
+        return response.status
+
+
+def replay(requests, make_transport, concurrency=1, repeat=1):
+    """
+    Воспроизводит запросы по порядку заданное число раз. При concurrency > 1 запросы распределяются
+    между потоками, у каждого потока свой транспорт (и свое соединение с базой данных)
+    :param requests: список объектов типа RecordedRequest
+    :param make_transport: функция без аргументов, создающая транспорт (объект с методом send(request) -> код ответа)
+    :param concurrency: количество потоков
+    :param repeat: количество проходов по списку запросов
+    :return: пара (список троек (маршрут, время в мс, ошибка или None), общее время в секундах)
+    """
+    transports = local()
+
+    def send(request):
+        if not hasattr(transports, "transport"):
+            transports.transport = make_transport()
+        start = time.perf_counter()
+        try:
+            status = transports.transport.send(request)
+            error = None
+            if request.expected is not None and status != request.expected:
+                error = "status {} != {}".format(status, request.expected)
+            elif request.expected is None and status >= 400:
+                error = "status {}".format(status)
+        except Exception as e:
+            error = type(e).__name__
+        return request.route, (time.perf_counter() - start) * 1000, error
+
+    schedule = requests * repeat
+    start = time.perf_counter()
+    if concurrency == 1:
+        results = [send(request) for request in schedule]
+    else:
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(send, schedule))
+    return results, time.perf_counter() - start
+
+
+def summarize(results, elapsed):
+    """
+    Считает пропускную способность, перцентили задержки и долю ошибок по маршрутам и в целом
+    :param results: результат replay
+    :param elapsed: общее время в секундах
+    :return: список словарей (первым - итог по всем маршрутам "TOTAL")
+    """
+    routes = {}
+    for route, latency, error in results:
+        routes.setdefault(route, []).append((latency, error))
+    routes = [("TOTAL", [(latency, error) for _, latency, error in results])] + sorted(routes.items())
+
+    summary = []
+    for route, samples in routes:
+        latencies = sorted(latency for latency, _ in samples)
+        errors = [error for _, error in samples if error is not None]
+        row = {"route": route, "count": len(samples), "rps": round(len(samples) / elapsed, 2) if elapsed else 0}
+        for rank in PERCENTILES:
+            row["p{}_ms".format(rank)] = round(percentile(latencies, rank), 2)
+        row["max_ms"] = round(latencies[-1], 2) if latencies else 0
+        row["errors"] = len(errors)
+        row["error_rate"] = round(len(errors) / len(samples), 4) if samples else 0
+        summary.append(row)
+    return summary
@@ -0,0 +1,78 @@
+from django.conf import settings
+from rest_framework import serializers
+
+from .instrumentation import serializer_timer
+from .serializers import SurveySerializer, CompactUserAnswersHolderSerializer
+
+DATE_FIELD = serializers.DateField()
+
+
+def question_answer_representation(question_answer):
+    return {"id": question_answer.id, "text": question_answer.text}
+
+
+def question_representation(question):
+    return {
+        "id": question.id,
+        "text": question.text,
+        "question_type": question.question_type,
+        "question_answers": [question_answer_representation(question_answer)
+                             for question_answer in question.question_answers.all()],
+    }
+
+
+def survey_representation(survey):
+    """
+    То же, что SurveySerializer(instance=survey).data, но без механизма полей DRF.
+    Вопросы и варианты ответа должны быть загружены заранее (см. queries.with_questions)
+    :param survey: объект типа Survey
+    :return: словарь с теми же ключами и значениями в том же порядке
+    """
+    return {
+        "id": survey.id,
+        "title": survey.title,
+        "start_date": DATE_FIELD.to_representation(survey.start_date),
+        "end_date": DATE_FIELD.to_representation(survey.end_date),
+        "description": survey.description,
+        "questions": [question_representation(question) for question in survey.questions.all()],
+    }
+
+
+def completed_survey_representation(user_answers_holder):
+    """
+    То же, что CompactUserAnswersHolderSerializer(instance=user_answers_holder).data, но без механизма полей DRF
+    :param user_answers_holder: объект типа UserAnswersHolder с загруженными ответами
+    :return: словарь с теми же ключами и значениями в том же порядке
+    """
+    return {
+        "id": user_answers_holder.id,
+        "user_ID": user_answers_holder.user_ID,
+        "survey": user_answers_holder.survey_id,
+        "answers": [{"question": answer.question_id, "answer": answer.answer}
+                    for answer in user_answers_holder.answers.all()],
+    }
+
+
+def represent_surveys(surveys):
+    """
+    Сериализует опросы функцией survey_representation, если settings.SURVEY_FAST_SERIALIZERS, иначе SurveySerializer
+    :param surveys: список объектов типа Survey
+    :return: список словарей
+    """
+    with serializer_timer():
+        if settings.SURVEY_FAST_SERIALIZERS:
+            return [survey_representation(survey) for survey in surveys]
+        return [dict(data) for data in SurveySerializer(surveys, many=True).data]
+
+
+def represent_completed_surveys(user_answers_holders):
+    """
+    Сериализует прохождения функцией completed_survey_representation, если settings.SURVEY_FAST_SERIALIZERS,
+    иначе CompactUserAnswersHolderSerializer
+    :param user_answers_holders: список объектов типа UserAnswersHolder
+    :return: список словарей
+    """
+    with serializer_timer():
+        if settings.SURVEY_FAST_SERIALIZERS:
+            return [completed_survey_representation(holder) for holder in user_answers_holders]
+        return [dict(data) for data in CompactUserAnswersHolderSerializer(user_answers_holders, many=True).data]
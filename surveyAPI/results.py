@@ -0,0 +1,135 @@
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import Question, QuestionAnswer, UserAnswer, SurveyCounter, QuestionCounter, QuestionAnswerCounter
+from .queries import with_question_answers, iter_completed_survey_chunks
+from .sharding import fan_out
+
+from collections import Counter, defaultdict
+
+
+def increment(model, counts):
+    """
+    Увеличивает счетчики, создавая недостающие строки. Выполняет один INSERT и по одному UPDATE
+    на каждую различную величину приращения, независимо от количества счетчиков
+    :param model: модель счетчика (первичный ключ - id объекта, к которому относится счетчик)
+    :param counts: словарь id объекта -> приращение
+    """
+    if not counts:
+        return
+    model.objects.bulk_create([model(pk=pk) for pk in counts], ignore_conflicts=True)
+    amounts = defaultdict(list)
+    for pk, amount in counts.items():
+        amounts[amount].append(pk)
+    for amount, pks in amounts.items():
+        model.objects.all().filter(pk__in=pks).update(count=F("count") + amount)
+
+
+def increment_counters(completions):
+    """
+    Обновляет счетчики результатов для сохраняемых прохождений опросов.
+    Должна вызываться в транзакции, сохраняющей прохождения
+    :param completions: список объектов типа surveyAPI.storage.Completion
+    """
+    survey_counts = Counter()
+    question_counts = Counter()
+    choice_counts = Counter()
+    for completion in completions:
+        survey_counts[completion.user_answers_holder.survey_id] += 1
+        question_counts.update({answer.question_id for answer in completion.answers})
+        choice_counts.update(completion.choice_ids)
+    increment(SurveyCounter, survey_counts)
+    increment(QuestionCounter, question_counts)
+    increment(QuestionAnswerCounter, choice_counts)
+
+
+def get_survey_results(survey):
+    """
+    Собирает результаты опроса из счетчиков. Время работы зависит только от количества вопросов
+    и вариантов ответа, но не от количества прохождений
+    :param survey: объект типа Survey
+    :return: словарь с количеством прохождений и количеством ответов на каждый вопрос и вариант ответа
+    """
+    questions = list(with_question_answers(Question.objects.all().filter(survey=survey).order_by("id")))
+    question_ids = [question.id for question in questions]
+    choice_ids = [choice.id for question in questions for choice in question.question_answers.all()]
+
+    respondents = SurveyCounter.objects.all().filter(pk=survey.id).values_list("count", flat=True).first() or 0
+    question_counts = dict(QuestionCounter.objects.all().filter(pk__in=question_ids).values_list("pk", "count"))
+    choice_counts = dict(QuestionAnswerCounter.objects.all().filter(pk__in=choice_ids).values_list("pk", "count"))
+
+    def percentage(count):
+        return round(count * 100 / respondents, 2) if respondents else 0
+
+    results = []
+    for question in questions:
+        choices = []
+        if question.question_type != "PT":
+            for choice in sorted(question.question_answers.all(), key=lambda choice: choice.id):
+                count = choice_counts.get(choice.id, 0)
+                choices.append({"id": choice.id, "text": choice.text, "count": count, "percentage": percentage(count)})
+        results.append({
+            "id": question.id,
+            "text": question.text,
+            "question_type": question.question_type,
+            "count": question_counts.get(question.id, 0),
+            "choices": choices,
+        })
+    return {"survey": survey.id, "respondents": respondents, "questions": results}
+
+
+def count_survey_answers(survey_id, chunk_size=1000):
+    """
+    Подсчитывает результаты опроса по сохраненным ответам, читая прохождения порциями. Ответы группируются
+    в базе данных по id вопросов и выбранных вариантов, учитываются только текущие варианты вопросов с выбором.
+    Шарды (см. sharding.fan_out) обрабатываются параллельно, их результаты складываются
+    :param survey_id: id опроса
+    :param chunk_size: количество прохождений в порции
+    :return: тройка (количество прохождений, Counter по id вопросов, Counter по id вариантов ответа)
+    """
+    choice_ids = set(QuestionAnswer.objects.all().filter(question__survey_id=survey_id)
+                     .exclude(question__question_type="PT").values_list("id", flat=True))
+
+    def count_shard(alias):
+        respondents = 0
+        question_counts = Counter()
+        choice_counts = Counter()
+        for chunk in iter_completed_survey_chunks(survey_id, chunk_size, alias):
+            holder_ids = [holder_id for holder_id, _, _ in chunk]
+            respondents += len(holder_ids)
+
+            answers = UserAnswer.objects.using(alias).filter(user_answers_holder_id__in=holder_ids).order_by()
+            question_counts.update(dict(answers.values_list("question_id").annotate(
+                count=Count("user_answers_holder_id", distinct=True))))
+            choice_counts.update({choice_id: count for choice_id, count in answers.filter(choice_id__in=choice_ids)
+                                 .values_list("choice_id").annotate(count=Count("id"))})
+        return respondents, question_counts, choice_counts
+
+    respondents = 0
+    question_counts = Counter()
+    choice_counts = Counter()
+    for shard_respondents, shard_question_counts, shard_choice_counts in fan_out(count_shard):
+        respondents += shard_respondents
+        question_counts.update(shard_question_counts)
+        choice_counts.update(shard_choice_counts)
+    return respondents, question_counts, choice_counts
+
+
+def rebuild_counters(survey_id, chunk_size=1000):
+    """
+    Пересчитывает счетчики результатов опроса по сохраненным ответам.
+    Прохождения, сохраненные во время пересчета, могут быть не учтены
+    :param survey_id: id опроса
+    :param chunk_size: количество прохождений, читаемых за один запрос
+    """
+    respondents, question_counts, choice_counts = count_survey_answers(survey_id, chunk_size)
+    question_ids = Question.objects.all().filter(survey_id=survey_id).values_list("id", flat=True)
+    with transaction.atomic():
+        SurveyCounter.objects.all().filter(pk=survey_id).delete()
+        QuestionCounter.objects.all().filter(pk__in=list(question_ids)).delete()
+        QuestionAnswerCounter.objects.all().filter(question_answer__question__survey_id=survey_id).delete()
+        SurveyCounter.objects.create(pk=survey_id, count=respondents)
+        QuestionCounter.objects.bulk_create([QuestionCounter(pk=pk, count=count)
+                                             for pk, count in question_counts.items()])
+        QuestionAnswerCounter.objects.bulk_create([QuestionAnswerCounter(pk=pk, count=count)
+                                                   for pk, count in choice_counts.items()])
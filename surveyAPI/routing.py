@@ -0,0 +1,144 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import cache
+
+from contextlib import contextmanager
+from itertools import count
+from threading import local
+import time
+
+DEFAULT_SURVEY_DATABASE_ROUTING = {
+    "REPLICAS": [],
+    "READ_YOUR_WRITES": 5,
+}
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+SURVEYS_PIN = "surveys"
+
+state = local()
+local_pins = cache.LRUCache(10000)
+
+
+def get_setting(name):
+    return getattr(settings, "SURVEY_DATABASE_ROUTING", {}).get(name, DEFAULT_SURVEY_DATABASE_ROUTING[name])
+
+
+def user_pin(user_id):
+    return "user:{}".format(user_id)
+
+
+def pin(key):
+    """
+    Направляет чтения, зависящие от key, в основную базу данных на READ_YOUR_WRITES секунд,
+    пока реплики не получат записанные изменения. Метки хранятся в общем кэше, если он настроен
+    :param key: ключ метки (SURVEYS_PIN или user_pin(user_ID))
+    """
+    window = get_setting("READ_YOUR_WRITES")
+    if not get_setting("REPLICAS") or not window:
+        return
+    backend = cache.shared_cache()
+    if backend is not None:
+        backend.set("routing:" + key, True, window)
+    else:
+        local_pins.set(key, time.monotonic() + window)
+
+
+def is_pinned(key):
+    """
+    :param key: ключ метки
+    :return: True, если данные по ключу были изменены не ранее READ_YOUR_WRITES секунд назад
+    """
+    backend = cache.shared_cache()
+    if backend is not None:
+        return backend.get("routing:" + key, False)
+    return local_pins.get(key, 0) > time.monotonic()
+
+
+@contextmanager
+def read_from_replicas():
+    """
+    Разрешает читать из реплик внутри блока (кроме случаев, когда опросы недавно изменялись, см. SURVEYS_PIN)
+    """
+    previous = getattr(state, "replicas", False), getattr(state, "pinned", None)
+    state.replicas, state.pinned = True, None
+    try:
+        yield
+    finally:
+        state.replicas, state.pinned = previous
+
+
+@contextmanager
+def read_from_primary():
+    """
+    Направляет все чтения внутри блока в основную базу данных
+    """
+    previous = getattr(state, "replicas", False)
+    state.replicas = False
+    try:
+        yield
+    finally:
+        state.replicas = previous
+
+
+@contextmanager
+def read_your_writes(key):
+    """
+    Направляет чтения внутри блока в основную базу данных, если данные по key изменялись
+    не ранее READ_YOUR_WRITES секунд назад (см. pin)
+    :param key: ключ метки
+    """
+    if get_setting("REPLICAS") and getattr(state, "replicas", False) and is_pinned(key):
+        with read_from_primary():
+            yield
+    else:
+        yield
+
+
+class ReplicaRouter:
+    """
+    Роутер, распределяющий чтения внутри read_from_replicas по репликам из REPLICAS по очереди.
+    Остальные чтения и все записи идут в основную базу данных (default), в том числе записи объектов,
+    прочитанных из реплики
+    """
+    def __init__(self):
+        self.counter = count()
+
+    def db_for_read(self, model, **hints):
+        replicas = get_setting("REPLICAS")
+        if not replicas or not getattr(state, "replicas", False):
+            return None
+        if state.pinned is None:
+            state.pinned = is_pinned(SURVEYS_PIN)
+        if state.pinned:
+            return None
+        return replicas[next(self.counter) % len(replicas)]
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db in get_setting("REPLICAS"):
+            return "default"
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {"default", *get_setting("REPLICAS")}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    Обрабатывает запросы безопасными методами (GET, HEAD, OPTIONS) внутри read_from_replicas.
+    Если реплики не настроены, удаляет себя при запуске
+    """
+    def __init__(self, get_response):
+        if not get_setting("REPLICAS"):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in SAFE_METHODS:
+            return self.get_response(request)
+        with read_from_replicas():
+            return self.get_response(request)
@@ -1,16 +1,23 @@
+from django.db import transaction
 from rest_framework import serializers
-from .models import Survey, Question, QuestionAnswer, UserAnswersHolder, UserAnswer
+from .versions import touch_survey
+from .models import Survey, Question, QuestionAnswer, UserAnswersHolder, UserAnswer, PendingCompletion
+from .reconciliation import empty_changes, has_changes, set_fields, reconcile_questions, reconcile_question_answers
+from .storage import prepare_completion, save_completions
+from .validation import get_validation_index
 
 
 class QuestionAnswerSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+
     class Meta:
         model = QuestionAnswer
         fields = ['id', 'text']
 
     def update(self, instance, validated_data):
-        instance.text = validated_data.get("text", instance.text)
-
-        instance.save()
+        if set_fields(instance, validated_data, ["text"]):
+            instance.save(update_fields=["text"])
+            touch_survey(instance.question.survey_id)
         return instance
 
 
@@ -19,8 +26,18 @@ class QuestionAnswerSerializerWithSpecifiedQuestion(serializers.ModelSerializer)
         model = QuestionAnswer
         fields = ['question', 'text']
 
+    def create(self, validated_data):
+        question_answer = super().create(validated_data)
+        touch_survey(question_answer.question.survey_id)
+        return question_answer
+
 
 class QuestionSerializer(serializers.ModelSerializer):
+    """
+    При обновлении варианты ответа сопоставляются с текущими по id: изменяются только отличающиеся,
+    варианты без id создаются, отсутствующие удаляются. Сделанные изменения сохраняются в changes
+    """
+    id = serializers.IntegerField(required=False)
     question_answers = QuestionAnswerSerializer(many=True)
 
     class Meta:
@@ -28,22 +45,15 @@ class QuestionSerializer(serializers.ModelSerializer):
         fields = ['id', 'text', 'question_type', 'question_answers']
 
     def update(self, instance, validated_data):
-        instance.text = validated_data.get("text", instance.text)
-        instance.question_type = validated_data.get("question_type", instance.question_type)
-
-        question_answers_data = validated_data.get("question_answers", None)
-        if question_answers_data is not None and instance.question_type != "PT":
-            for question_answer in QuestionAnswer.objects.all().filter(question=instance):
-                question_answer.delete()
-
-            for question_answer_data in question_answers_data:
-                QuestionAnswer.objects.create(question=instance, **question_answer_data)
-
-        if instance.question_type == "PT":
-            for question_answer in QuestionAnswer.objects.all().filter(question=instance):
-                question_answer.delete()
-
-        instance.save()
+        self.changes = empty_changes()
+        with transaction.atomic():
+            self.changes["fields"] = set_fields(instance, validated_data, ["text", "question_type"])
+            if self.changes["fields"]:
+                instance.save(update_fields=self.changes["fields"])
+            reconcile_question_answers([(instance, list(instance.question_answers.all()),
+                                         validated_data.get("question_answers", None))], self.changes)
+        if has_changes(self.changes):
+            touch_survey(instance.survey_id)
         return instance
 
 
@@ -59,11 +69,16 @@ class QuestionSerializerWithSpecifiedSurvey(serializers.ModelSerializer):
         question = Question.objects.create(**validated_data)
         if question.question_type != "PT":
             for question_answer_data in question_answers_data:
-                QuestionAnswer.objects.create(question=question, **question_answer_data)
+                QuestionAnswer.objects.create(question=question, text=question_answer_data["text"])
+        touch_survey(question.survey_id)
         return question
 
 
 class SurveySerializer(serializers.ModelSerializer):
+    """
+    При обновлении вопросы и варианты ответа сопоставляются с текущими по id: изменяются только отличающиеся,
+    вопросы и варианты без id создаются, отсутствующие удаляются. Сделанные изменения сохраняются в changes
+    """
     questions = QuestionSerializer(many=True)
 
     class Meta:
@@ -74,100 +89,68 @@ class SurveySerializer(serializers.ModelSerializer):
         questions_data = validated_data.pop("questions")
         survey = Survey.objects.create(**validated_data)
         for question_data in questions_data:
-            question_answers_data = question_data.pop("question_answers")
-            question = Question.objects.create(survey=survey, **question_data)
+            question = Question.objects.create(survey=survey, text=question_data["text"],
+                                               question_type=question_data["question_type"])
             if question_data["question_type"] != "PT":
-                for question_answer_data in question_answers_data:
-                    QuestionAnswer.objects.create(question=question, **question_answer_data)
+                for question_answer_data in question_data["question_answers"]:
+                    QuestionAnswer.objects.create(question=question, text=question_answer_data["text"])
+        touch_survey(survey.id)
         return survey
 
     def update(self, instance, validated_data):
-        instance.title = validated_data.get("title", instance.title)
-        instance.end_date = validated_data.get("end_date", instance.end_date)
-        instance.description = validated_data.get("description", instance.description)
-
-        questions_data = validated_data.get("questions", None)
-        if questions_data is not None:
-            current_questions = Question.objects.all().filter(survey=instance)
-            for question in current_questions:
-                question.delete()
-
-            for question_data in questions_data:
-                question_answers_data = question_data.pop("question_answers")
-                question = Question.objects.create(survey=instance, **question_data)
-                if question_data["question_type"] != "PT":
-                    for question_answer_data in question_answers_data:
-                        QuestionAnswer.objects.create(question=question, **question_answer_data)
-        instance.save()
+        self.changes = empty_changes()
+        with transaction.atomic():
+            self.changes["fields"] = set_fields(instance, validated_data, ["title", "end_date", "description"])
+            if self.changes["fields"]:
+                instance.save(update_fields=self.changes["fields"])
+            questions_data = validated_data.get("questions", None)
+            if questions_data is not None:
+                reconcile_questions(instance, questions_data, self.changes)
+        if has_changes(self.changes):
+            touch_survey(instance.id)
         return instance
 
 
 class UserAnswerCreationSerializer(serializers.ModelSerializer):
-    question = serializers.PrimaryKeyRelatedField(queryset=Question.objects.all(), many=False, read_only=False)
+    question = serializers.IntegerField()
+    # Поле модели необязательно (у ответов на вопросы с выбором хранится только choice), а в запросе ответ обязателен
+    answer = serializers.CharField(max_length=1024)
 
     class Meta:
         model = UserAnswer
         fields = ['question', 'answer']
 
 
+class CompletionSerializer(serializers.Serializer):
+    """
+    Проверяет формат одного прохождения опроса в пакетном запросе.
+    В отличие от UserAnswersHolderCreationSerializer, не обращается к базе данных
+    """
+    user_ID = serializers.IntegerField(min_value=0)
+    survey = serializers.IntegerField()
+    answers = UserAnswerCreationSerializer(many=True)
+
+
 class UserAnswersHolderCreationSerializer(serializers.ModelSerializer):
+    """
+    Индекс проверки и hash снимка передаются в save вместе (см. snapshots.get_completion_context),
+    без них ответы проверяются по текущему индексу опроса, а прохождение сохраняется без снимка
+    """
     answers = UserAnswerCreationSerializer(many=True, read_only=False)
 
     class Meta:
         model = UserAnswersHolder
         fields = ['user_ID', 'survey', 'answers']
 
-    @staticmethod
-    def check_answers(questions, given_answers):
-        all_questions_completed = True
-        for question in questions:
-            question_completed = False
-            for given_answer in given_answers:
-                if given_answer["question"] == question:
-                    question_completed = True
-                    break
-            if not question_completed:
-                all_questions_completed = False
-                break
-
-        if not all_questions_completed:
-            raise AttributeError("All questions should be completed!")
-
-        all_choice_questions_correct = True
-        for given_answer in given_answers:
-            if given_answer["question"].question_type != "PT":
-                available_answers = QuestionAnswer.objects.all().filter(question=given_answer["question"])
-                choice_question_correct = False
-                for available_answer in available_answers:
-                    if available_answer.text == given_answer["answer"]:
-                        choice_question_correct = True
-                if not choice_question_correct:
-                    all_choice_questions_correct = False
-                    break
-
-        if not all_choice_questions_correct:
-            raise ValueError("Choice questions should be chosen correctly!")
-
     def create(self, validated_data):
-        survey = Survey.objects.all().get(pk=validated_data.get("survey").id)
-        questions = Question.objects.all().filter(survey=survey)
-        given_answers = validated_data.pop("answers")
-
-        self.check_answers(questions, given_answers)
-
-        user_answers_holder = UserAnswersHolder.objects.create(**validated_data)
-
-        for question in questions:
-            multiply_choices_answers = []
-            for given_answer in given_answers:
-                if given_answer["question"] == question:
-                    if question.question_type == "MC" and given_answer["answer"] in multiply_choices_answers:
-                        continue
-                    UserAnswer.objects.create(user_answers_holder=user_answers_holder, **given_answer)
-                    multiply_choices_answers.append(given_answer["answer"])
-                    if question.question_type != "MC":
-                        break
-        return user_answers_holder
+        survey_id = validated_data["survey"].id
+        validation_index = validated_data.get("validation_index", None)
+        if validation_index is None:
+            validation_index = get_validation_index(survey_id)
+        completion = prepare_completion(validation_index, survey_id, validated_data["user_ID"],
+                                        validated_data["answers"], validated_data.get("snapshot_hash", None))
+        save_completions([completion])
+        return completion.user_answers_holder
 
 
 class UserAnswerSerializer(serializers.ModelSerializer):
@@ -178,6 +161,14 @@ class UserAnswerSerializer(serializers.ModelSerializer):
         fields = ['question', 'answer']
 
 
+class CompactUserAnswersHolderSerializer(serializers.ModelSerializer):
+    answers = UserAnswerSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = UserAnswersHolder
+        fields = ['id', 'user_ID', 'survey', 'answers']
+
+
 class UserAnswersHolderSerializer(serializers.ModelSerializer):
     answers = UserAnswerSerializer(many=True, read_only=True)
     survey = SurveySerializer(many=False, read_only=True)
@@ -185,3 +176,11 @@ class UserAnswersHolderSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserAnswersHolder
         fields = ['id', 'user_ID', 'survey', 'answers']
+
+
+class PendingCompletionSerializer(serializers.ModelSerializer):
+    status = serializers.CharField(source="get_status_display")
+
+    class Meta:
+        model = PendingCompletion
+        fields = ['receipt', 'status', 'user_answers_holder', 'error']
@@ -0,0 +1,105 @@
+from django.conf import settings
+from django.db import connections
+
+from concurrent.futures import ThreadPoolExecutor
+import zlib
+
+DEFAULT_SURVEY_SHARDING = {
+    "SHARDS": [],
+    "WORKERS": None,
+}
+
+SHARDED_MODELS = ("surveyAPI.UserAnswersHolder", "surveyAPI.UserAnswer")
+
+
+def get_setting(name):
+    return getattr(settings, "SURVEY_SHARDING", {}).get(name, DEFAULT_SURVEY_SHARDING[name])
+
+
+def shard_aliases():
+    """
+    :return: список alias баз данных, в которых хранятся прохождения опросов. Если шардинг отключен, [None]:
+    запросы с using(None) направляются роутерами, как и без шардинга (например, в реплики)
+    """
+    return list(get_setting("SHARDS")) or [None]
+
+
+def shard_for(user_id):
+    """
+    :param user_id: id пользователя
+    :return: alias базы данных, в которой хранятся прохождения опросов пользователя, или None, если шардинг отключен
+    """
+    aliases = shard_aliases()
+    if len(aliases) == 1:
+        return aliases[0]
+    return aliases[zlib.crc32(str(user_id).encode()) % len(aliases)]
+
+
+def fan_out(func, aliases=None):
+    """
+    Выполняет func для каждого шарда параллельно, каждый поток со своими соединениями с базами данных.
+    Если шард один, func выполняется в текущем потоке
+    :param func: функция, принимающая alias базы данных
+    :param aliases: список alias. Если None, все шарды
+    :return: список результатов в порядке aliases
+    """
+    aliases = aliases or shard_aliases()
+    if len(aliases) == 1:
+        return [func(aliases[0])]
+
+    def run(alias):
+        try:
+            return func(alias)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(get_setting("WORKERS") or len(aliases)) as executor:
+        return list(executor.map(run, aliases))
+
+
+def delete_completions(sender, instance, **kwargs):
+    """
+    Обработчик post_delete для Survey и Question: удаляет прохождения удаленного опроса
+    или ответы на удаленный вопрос в остальных шардах (в базе данных объекта их удаляет каскад)
+    """
+    from .models import Survey, UserAnswersHolder, UserAnswer
+
+    for alias in get_setting("SHARDS"):
+        if alias == instance._state.db:
+            continue
+        if sender is Survey:
+            UserAnswersHolder.objects.using(alias).filter(survey_id=instance.id).delete()
+        else:
+            UserAnswer.objects.using(alias).filter(question_id=instance.id).delete()
+
+
+def is_sharded(model):
+    return model._meta.label in SHARDED_MODELS
+
+
+class ShardRouter:
+    """
+    Роутер, направляющий запросы к прохождениям опросов в шард пользователя. Код, читающий прохождения,
+    указывает шард явно (using(shard_for(user_id))), роутер обрабатывает связанные объекты и запись
+    прохождения, шард которого определяется по user_ID. Должен стоять в DATABASE_ROUTERS раньше ReplicaRouter
+    """
+    @staticmethod
+    def db_for_instance(model, instance):
+        if not get_setting("SHARDS") or not is_sharded(model) or instance is None or not is_sharded(type(instance)):
+            return None
+        if instance._state.db is not None:
+            return instance._state.db
+        if hasattr(instance, "user_ID"):
+            return shard_for(instance.user_ID)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self.db_for_instance(model, hints.get("instance"))
+
+    def db_for_write(self, model, **hints):
+        return self.db_for_instance(model, hints.get("instance"))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if get_setting("SHARDS") and (is_sharded(type(obj1)) or is_sharded(type(obj2))):
+            return True
+        return None
@@ -0,0 +1,199 @@
+from . import cache
+from .models import QuestionAnswer, SurveySnapshot, UserAnswersHolder, UserAnswer
+from .payloads import get_survey_entries, get_survey_payloads
+from .sharding import shard_for
+from .validation import SurveyValidationIndex
+from .versions import get_survey_versions
+
+import hashlib
+import json
+
+
+def snapshot_key(snapshot_hash):
+    return "snapshot:{}".format(snapshot_hash)
+
+
+def dump_snapshot(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def create_snapshot(survey_id, payload):
+    """
+    Сохраняет версию опроса как снимок. Если такой снимок уже есть, новый не создается
+    :param survey_id: id опроса
+    :param payload: сериализованный опрос
+    :return: hash снимка
+    """
+    data = dump_snapshot(payload)
+    snapshot_hash = hashlib.sha256(data.encode("utf-8")).hexdigest()
+    SurveySnapshot.objects.bulk_create([SurveySnapshot(hash=snapshot_hash, survey_id=survey_id, data=data)],
+                                       ignore_conflicts=True)
+    cache.set(snapshot_key(snapshot_hash), json.loads(data))
+    return snapshot_hash
+
+
+def get_completion_context(survey_id):
+    """
+    Возвращает индекс для проверки ответов и hash снимка текущей версии опроса, создавая снимок при первом
+    обращении к версии. Оба строятся из одного сериализованного опроса, поэтому выбранные варианты ответа,
+    прошедшие проверку, всегда есть в снимке, на который ссылается прохождение. Ключ включает version опроса
+    из базы данных, поэтому после изменения опроса в любом процессе используется новая версия
+    :param survey_id: id опроса
+    :return: пара (объект типа SurveyValidationIndex, hash снимка или None, если опрос не найден)
+    """
+    versions = get_survey_versions([survey_id])
+    if survey_id not in versions:
+        return SurveyValidationIndex({}), None
+    key = "survey:{}:{}:completion".format(survey_id, versions[survey_id][0])
+    context = cache.get(key)
+    if context is not None:
+        return context
+    entry = get_survey_entries([survey_id], active_only=False).get(survey_id)
+    if entry is None:
+        return SurveyValidationIndex({}), None
+    _, payload, version, _ = entry
+    context = SurveyValidationIndex.from_payload(payload), create_snapshot(survey_id, payload)
+    if version == versions[survey_id][0]:
+        cache.set(key, context)
+    return context
+
+
+def get_snapshot_hash(survey_id):
+    """
+    Возвращает hash снимка текущей версии опроса (см. get_completion_context)
+    :param survey_id: id опроса
+    :return: hash снимка или None, если опрос не найден
+    """
+    return get_completion_context(survey_id)[1]
+
+
+def get_snapshot_payloads(snapshot_hashes):
+    """
+    Возвращает содержимое снимков, используя кэш. Снимки неизменяемы, поэтому ключ не содержит версии.
+    Отсутствующие в кэше снимки читаются одним запросом по первичному ключу
+    :param snapshot_hashes: список hash снимков
+    :return: словарь hash -> сериализованный опрос
+    """
+    payloads = {}
+    for snapshot_hash in set(snapshot_hashes):
+        payload = cache.get(snapshot_key(snapshot_hash))
+        if payload is not None:
+            payloads[snapshot_hash] = payload
+    missing = [snapshot_hash for snapshot_hash in set(snapshot_hashes) if snapshot_hash not in payloads]
+    if missing:
+        for snapshot_hash, data in SurveySnapshot.objects.all().filter(pk__in=missing).values_list("hash", "data"):
+            payloads[snapshot_hash] = json.loads(data)
+            cache.set(snapshot_key(snapshot_hash), payloads[snapshot_hash])
+    return payloads
+
+
+def get_choice_texts(snapshot_hashes):
+    """
+    :param snapshot_hashes: список hash снимков
+    :return: словарь hash -> словарь id варианта ответа -> текст варианта в снимке
+    """
+    return {snapshot_hash: {choice["id"]: choice["text"] for question in payload["questions"]
+                            for choice in question["question_answers"]}
+            for snapshot_hash, payload in get_snapshot_payloads(snapshot_hashes).items()}
+
+
+class AnswerTexts:
+    """
+    Восстанавливает тексты ответов на вопросы с выбором, которые хранятся как id варианта (см. models.UserAnswer),
+    из снимков прохождений. Варианты, которых нет в снимке, берутся из текущих вариантов ответа
+    """
+    def __init__(self, snapshot_hashes):
+        """
+        :param snapshot_hashes: hash снимков прохождений, ответы которых восстанавливаются
+        """
+        self.choices = get_choice_texts({snapshot_hash for snapshot_hash in snapshot_hashes if snapshot_hash is not None})
+        self.current = {}
+
+    def load_current(self, choice_ids):
+        """
+        Читает одним запросом текущие тексты вариантов ответа, которые еще не загружены
+        :param choice_ids: id вариантов ответа
+        """
+        missing = set(choice_ids) - set(self.current)
+        if missing:
+            texts = dict(QuestionAnswer.objects.all().filter(pk__in=missing).values_list("id", "text"))
+            self.current.update({choice_id: texts.get(choice_id, "") for choice_id in missing})
+
+    def get(self, snapshot_hash, choice_id, text):
+        """
+        :param snapshot_hash: hash снимка прохождения или None
+        :param choice_id: id выбранного варианта или None
+        :param text: сохраненный текст ответа
+        :return: текст ответа в том виде, в котором он был дан
+        """
+        if choice_id is None or text:
+            return text
+        choices = self.choices.get(snapshot_hash, {})
+        if choice_id in choices:
+            return choices[choice_id]
+        self.load_current([choice_id])
+        return self.current[choice_id]
+
+
+def resolve_answer_texts(answers):
+    """
+    Восстанавливает тексты ответов (см. AnswerTexts), читая недостающие в снимках варианты одним запросом
+    :param answers: список троек (hash снимка прохождения или None, id выбранного варианта или None, сохраненный текст)
+    :return: список текстов ответов в порядке answers
+    """
+    if all(choice_id is None or text for _, choice_id, text in answers):
+        return [text for _, _, text in answers]
+    texts = AnswerTexts([snapshot_hash for snapshot_hash, _, _ in answers])
+    texts.load_current([choice_id for snapshot_hash, choice_id, text in answers if choice_id is not None and not text
+                        and choice_id not in texts.choices.get(snapshot_hash, {})])
+    return [texts.get(*answer) for answer in answers]
+
+
+def resolve_holders(holders):
+    """
+    Подставляет тексты ответов на вопросы с выбором в загруженные ответы прохождений (см. resolve_answer_texts),
+    чтобы прохождения сериализовались так же, как до хранения вариантов по id. В базу данных ничего не записывается
+    :param holders: список объектов типа UserAnswersHolder с загруженными ответами
+    """
+    answers = [(holder.snapshot_id, answer) for holder in holders for answer in holder.answers.all()]
+    texts = resolve_answer_texts([(snapshot_hash, answer.choice_id, answer.answer) for snapshot_hash, answer in answers])
+    for (_, answer), text in zip(answers, texts):
+        answer.answer = text
+
+
+def get_completed_survey_payloads(holders):
+    """
+    Возвращает опросы в том виде, в котором они были пройдены. Для прохождений, сохраненных
+    до появления снимков, возвращается текущая версия опроса
+    :param holders: список пар (id опроса, hash снимка или None)
+    :return: список сериализованных опросов в порядке holders (None, если опрос не найден)
+    """
+    snapshots = get_snapshot_payloads([snapshot_hash for _, snapshot_hash in holders if snapshot_hash is not None])
+    surveys = get_survey_payloads([survey_id for survey_id, snapshot_hash in holders if snapshot_hash is None],
+                                  active_only=False)
+    return [snapshots.get(snapshot_hash) if snapshot_hash is not None else surveys.get(survey_id)
+            for survey_id, snapshot_hash in holders]
+
+
+def get_completed_survey(user_id, holder_id):
+    """
+    Собирает пройденный пользователем опрос: строка прохождения и ответы читаются из шарда пользователя
+    без соединений таблиц, опрос берется из снимка
+    :param user_id: id пользователя
+    :param holder_id: id прохождения
+    :return: словарь в формате UserAnswersHolderSerializer или None, если прохождение не найдено
+    """
+    shard = shard_for(user_id)
+    holder = UserAnswersHolder.objects.using(shard).filter(pk=holder_id, user_ID=user_id)\
+        .values_list("survey_id", "snapshot_id").first()
+    if holder is None:
+        return None
+    answers = list(UserAnswer.objects.using(shard).filter(user_answers_holder_id=holder_id).order_by("id")
+                   .values_list("question_id", "choice_id", "answer"))
+    texts = resolve_answer_texts([(holder[1], choice_id, answer) for _, choice_id, answer in answers])
+    return {
+        "id": holder_id,
+        "user_ID": user_id,
+        "survey": get_completed_survey_payloads([holder])[0],
+        "answers": [{"question": question_id, "answer": text} for (question_id, _, _), text in zip(answers, texts)],
+    }
@@ -0,0 +1,72 @@
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .models import UserAnswersHolder, UserAnswer
+from .results import increment_counters
+from .routing import pin, user_pin
+from .sharding import shard_for
+
+from collections import defaultdict
+from contextlib import ExitStack
+
+
+class Completion:
+    """
+    Несохраненное прохождение опроса: объект типа UserAnswersHolder, его ответы
+    и id выбранных вариантов ответа (для счетчиков результатов)
+    """
+    def __init__(self, user_answers_holder, answers, choice_ids):
+        self.user_answers_holder = user_answers_holder
+        self.answers = answers
+        self.choice_ids = choice_ids
+
+
+def prepare_completion(validation_index, survey_id, user_id, given_answers, snapshot_hash=None):
+    """
+    Проверяет ответы и формирует несохраненное прохождение опроса. Ответы на вопросы с выбором хранят id варианта,
+    а их текст сохраняется, только если у прохождения нет снимка, из которого его можно восстановить
+    :raises: AttributeError, ValueError, если ответы некорректны (см. SurveyValidationIndex.check_answers)
+    :param validation_index: индекс опроса
+    :param survey_id: id опроса
+    :param user_id: id пользователя
+    :param given_answers: список словарей с ключами question и answer
+    :param snapshot_hash: hash снимка опроса, на который ссылается прохождение
+    :return: объект типа Completion
+    """
+    validation_index.check_answers(given_answers)
+    user_answers_holder = UserAnswersHolder(survey_id=survey_id, user_ID=user_id, snapshot_id=snapshot_hash)
+    answers = []
+    choice_ids = []
+    for question_id, answer, choice_id in validation_index.build_answers(given_answers):
+        answers.append(UserAnswer(question_id=question_id, choice_id=choice_id,
+                                  answer=answer if choice_id is None or snapshot_hash is None else ""))
+        if choice_id is not None:
+            choice_ids.append(choice_id)
+    return Completion(user_answers_holder, answers, choice_ids)
+
+
+def save_completions(completions):
+    """
+    Сохраняет прохождения опросов: по одному INSERT на прохождение, один bulk insert ответов на шард
+    (см. sharding.shard_for) и обновление счетчиков результатов. Транзакции всех затронутых баз данных
+    фиксируются вместе после всех записей, поэтому ошибка записи отменяет все.
+    Пройденные опросы пользователей затем читаются из основной базы данных (см. routing.pin)
+    :param completions: список объектов типа Completion
+    """
+    by_shard = defaultdict(list)
+    for completion in completions:
+        by_shard[shard_for(completion.user_answers_holder.user_ID)].append(completion)
+
+    with ExitStack() as transactions:
+        for alias in {DEFAULT_DB_ALIAS, *(alias or DEFAULT_DB_ALIAS for alias in by_shard)}:
+            transactions.enter_context(transaction.atomic(using=alias))
+        for alias, shard_completions in by_shard.items():
+            shard_answers = []
+            for completion in shard_completions:
+                completion.user_answers_holder.save(using=alias)
+                for answer in completion.answers:
+                    answer.user_answers_holder_id = completion.user_answers_holder.id
+                shard_answers.extend(completion.answers)
+            UserAnswer.objects.db_manager(alias).bulk_create(shard_answers)
+        increment_counters(completions)
+    for user_id in {completion.user_answers_holder.user_ID for completion in completions}:
+        pin(user_pin(user_id))
@@ -0,0 +1,149 @@
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max
+
+from .models import Survey, Question, QuestionAnswer, UserAnswersHolder, UserAnswer, SurveyCounter,\
+    QuestionCounter, QuestionAnswerCounter
+from .results import increment
+from .sharding import shard_aliases, shard_for
+from .snapshots import get_snapshot_hash
+from .versions import touch_survey
+
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+import random
+
+QUESTION_TYPES = ("PT", "SC", "MC")
+
+
+def next_id(model, aliases=(DEFAULT_DB_ALIAS,)):
+    return max(model.objects.using(alias).aggregate(Max("id"))["id__max"] or 0 for alias in aliases) + 1
+
+
+def reset_sequences(models, using=DEFAULT_DB_ALIAS):
+    """
+    Приводит счетчики автоинкремента в соответствие с явно заданными id (нужно, например, для PostgreSQL)
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+
+
+def generate_surveys(rng, surveys_count, questions_count, choices_count, expired=0.0):
+    """
+    Создает опросы с вопросами всех типов по очереди (PT, SC, MC). Все строки вставляются bulk insert'ом
+    с явно заданными id, поэтому количество запросов не зависит от размера опросов
+    :param rng: объект типа random.Random
+    :param surveys_count: количество опросов
+    :param questions_count: количество вопросов в опросе
+    :param choices_count: количество вариантов ответа у вопросов с выбором
+    :param expired: доля опросов с истекшим сроком
+    :return: словарь id опроса -> список пар (id вопроса, тип, список пар (id варианта, текст))
+    """
+    today = datetime.now().date()
+    survey_id, question_id, choice_id = next_id(Survey), next_id(Question), next_id(QuestionAnswer)
+    expired_count = int(surveys_count * expired)
+    surveys, questions, choices = [], [], []
+    structure = {}
+    for i in range(surveys_count):
+        end_date = today - timedelta(days=1) if i < expired_count else today + timedelta(days=rng.randint(1, 365))
+        surveys.append(Survey(id=survey_id, title="Survey {}".format(survey_id), end_date=end_date,
+                              description="Synthetic survey"))
+        structure[survey_id] = []
+        for j in range(questions_count):
+            question_type = QUESTION_TYPES[j % len(QUESTION_TYPES)]
+            questions.append(Question(id=question_id, survey_id=survey_id, text="Question {}".format(j),
+                                      question_type=question_type))
+            question_choices = []
+            if question_type != "PT":
+                for k in range(choices_count):
+                    choices.append(QuestionAnswer(id=choice_id, question_id=question_id, text="Choice {}".format(k)))
+                    question_choices.append((choice_id, "Choice {}".format(k)))
+                    choice_id += 1
+            structure[survey_id].append((question_id, question_type, question_choices))
+            question_id += 1
+        survey_id += 1
+
+    with transaction.atomic():
+        Survey.objects.bulk_create(surveys)
+        Question.objects.bulk_create(questions)
+        QuestionAnswer.objects.bulk_create(choices)
+    reset_sequences([Survey, Question, QuestionAnswer])
+    touch_survey(None)
+    return structure
+
+
+def generate_completions(rng, structure, completions_count, users_count, chunk_size=1000, progress=None):
+    """
+    Создает прохождения опросов со случайными корректными ответами и обновляет счетчики результатов.
+    Прохождения записываются порциями, каждая порция - одна транзакция из двух bulk insert'ов на шард
+    (см. sharding.shard_for) и обновления счетчиков. id прохождений уникальны во всех шардах
+    :param rng: объект типа random.Random
+    :param structure: результат generate_surveys
+    :param completions_count: количество прохождений (опросы выбираются случайно)
+    :param users_count: количество различных пользователей
+    :param chunk_size: количество прохождений в порции
+    :param progress: функция, вызываемая с количеством записанных прохождений после каждой порции
+    """
+    survey_ids = sorted(structure)
+    snapshots = {survey_id: get_snapshot_hash(survey_id) for survey_id in survey_ids}
+    aliases = [alias or DEFAULT_DB_ALIAS for alias in shard_aliases()]
+    holder_id = next_id(UserAnswersHolder, aliases)
+    written = 0
+    while written < completions_count:
+        holders, answers = defaultdict(list), defaultdict(list)
+        survey_counts, question_counts, choice_counts = Counter(), Counter(), Counter()
+        for _ in range(min(chunk_size, completions_count - written)):
+            survey_id = rng.choice(survey_ids)
+            user_id = rng.randint(1, users_count)
+            shard = shard_for(user_id) or DEFAULT_DB_ALIAS
+            holders[shard].append(UserAnswersHolder(id=holder_id, survey_id=survey_id, user_ID=user_id,
+                                                    snapshot_id=snapshots[survey_id]))
+            survey_counts[survey_id] += 1
+            for question_id, question_type, choices in structure[survey_id]:
+                if question_type == "PT":
+                    selected = [(None, "Answer {}".format(rng.randrange(1000)))]
+                elif question_type == "SC":
+                    selected = [rng.choice(choices)]
+                else:
+                    selected = rng.sample(choices, rng.randint(1, len(choices)))
+                for choice_id, text in selected:
+                    answers[shard].append(UserAnswer(user_answers_holder_id=holder_id, question_id=question_id,
+                                                     choice_id=choice_id, answer=text if choice_id is None else ""))
+                    if choice_id is not None:
+                        choice_counts[choice_id] += 1
+                question_counts[question_id] += 1
+            holder_id += 1
+
+        with ExitStack() as transactions:
+            for alias in {DEFAULT_DB_ALIAS, *holders}:
+                transactions.enter_context(transaction.atomic(using=alias))
+            for shard in holders:
+                UserAnswersHolder.objects.using(shard).bulk_create(holders[shard])
+                UserAnswer.objects.using(shard).bulk_create(answers[shard])
+            increment(SurveyCounter, survey_counts)
+            increment(QuestionCounter, question_counts)
+            increment(QuestionAnswerCounter, choice_counts)
+        written += sum(len(shard_holders) for shard_holders in holders.values())
+        if progress is not None:
+            progress(written)
+    for alias in aliases:
+        reset_sequences([UserAnswersHolder], alias)
+
+
+def generate(surveys_count=10, questions_count=10, choices_count=4, completions_count=1000, users_count=None,
+             expired=0.0, seed=0, chunk_size=1000, progress=None):
+    """
+    Заполняет базу данных синтетическими опросами и их прохождениями. При одинаковых параметрах
+    (и пустой базе данных) результат одинаков. Остальные параметры см. generate_surveys и generate_completions
+    :param users_count: количество различных пользователей. Если None, равно completions_count
+    :param seed: начальное значение генератора случайных чисел
+    :return: словарь id опроса -> список пар (id вопроса, тип, список пар (id варианта, текст))
+    """
+    rng = random.Random(seed)
+    structure = generate_surveys(rng, surveys_count, questions_count, choices_count, expired)
+    if completions_count:
+        generate_completions(rng, structure, completions_count, users_count or completions_count, chunk_size, progress)
+    return structure
@@ -0,0 +1,1392 @@
+from django.contrib.auth.models import User
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.apps import apps as django_apps
+from django.core.wsgi import get_wsgi_application
+from django.db import IntegrityError, connection, connections
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ErrorDetail, ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.serializer_helpers import ReturnDict
+import asyncio
+import gzip
+import importlib
+import io
+import json
+import uuid
+import tempfile
+import time
+import tracemalloc
+
+from . import cache
+from .asgi import ASGIHandler, data_version
+from .models import Survey, Question, QuestionAnswer, UserAnswersHolder, UserAnswer, PendingCompletion,\
+    SurveyCounter, QuestionCounter, QuestionAnswerCounter, SurveySnapshot
+from .compression import CompressionMiddleware, negotiate
+from .export import export_responses
+from .instrumentation import InstrumentationMiddleware, get_stats, registry
+from .queries import with_questions
+from .reconciliation import can_return_ids
+from .renderers import FastJSONRenderer, FastJSONParser
+from .replay import InProcessTransport, load_requests, replay, summarize
+from .representations import survey_representation, completed_survey_representation
+from .serializers import SurveySerializer, CompactUserAnswersHolderSerializer, UserAnswersHolderSerializer
+from .results import count_survey_answers, rebuild_counters
+from . import routing
+from .sharding import fan_out, shard_for
+from .snapshots import get_completion_context
+from . import storage
+from .synthetic import generate
+from .validation import SurveyValidationIndex
+from .versions import touch_survey
+
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+
+def create_survey(questions_count=2, choices_count=3, end_date=None):
+    """
+    Создает опрос с вопросами всех типов для тестов
+    :param questions_count: количество вопросов каждого типа
+    :param choices_count: количество вариантов ответа у вопросов с выбором
+    :param end_date: дата окончания опроса. Если None, опрос актуален еще неделю
+    :return: созданный объект типа Survey
+    """
+    if end_date is None:
+        end_date = datetime.now().date() + timedelta(days=7)
+    survey = Survey.objects.create(title="Survey", end_date=end_date, description="Description")
+    for i in range(questions_count):
+        for question_type in ("PT", "SC", "MC"):
+            question = Question.objects.create(survey=survey, text="Question {}".format(i),
+                                               question_type=question_type)
+            if question_type != "PT":
+                for j in range(choices_count):
+                    QuestionAnswer.objects.create(question=question, text="Choice {}".format(j))
+    return survey
+
+
+def complete_survey(survey, user_id):
+    """
+    Сохраняет ответы пользователя на все вопросы опроса напрямую в базу данных
+    :param survey: объект типа Survey
+    :param user_id: id пользователя
+    :return: созданный объект типа UserAnswersHolder
+    """
+    holder = UserAnswersHolder.objects.create(survey=survey, user_ID=user_id)
+    for question in survey.questions.all():
+        choice = question.question_answers.first()
+        UserAnswer.objects.create(user_answers_holder=holder, question=question,
+                                  answer=choice.text if choice is not None else "text")
+    return holder
+
+
+class SurveyTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+
+class SurveyReadQueriesTest(SurveyTestCase):
+    def count_queries(self, path):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_list_query_count_does_not_depend_on_survey_size(self):
+        create_survey(questions_count=1, choices_count=1)
+        small = self.count_queries("/api/surveys/")
+        for _ in range(5):
+            create_survey(questions_count=5, choices_count=4)
+        self.assertEqual(self.count_queries("/api/surveys/"), small)
+
+    def test_retrieve_query_count_does_not_depend_on_survey_size(self):
+        small = self.count_queries("/api/surveys/{}".format(create_survey(1, 1).id))
+        large = self.count_queries("/api/surveys/{}".format(create_survey(10, 5).id))
+        self.assertEqual(small, large)
+
+    def test_completed_surveys_query_count_does_not_depend_on_history_size(self):
+        complete_survey(create_survey(1, 1), user_id=1)
+        small = self.count_queries("/api/completed-surveys/1")
+        for _ in range(5):
+            complete_survey(create_survey(4, 3), user_id=1)
+        self.assertEqual(self.count_queries("/api/completed-surveys/1"), small)
+
+    def test_expired_surveys_are_not_listed(self):
+        create_survey(end_date=datetime.now().date() - timedelta(days=1))
+        active = create_survey()
+        response = self.client.get("/api/surveys/")
+        self.assertEqual([survey["id"] for survey in response.data["surveys"]], [active.id])
+
+
+class SurveyCacheTest(SurveyTestCase):
+    def test_retrieve_is_served_from_cache(self):
+        survey = create_survey()
+        response = self.client.get("/api/surveys/{}".format(survey.id))
+        with self.assertNumQueries(1):
+            cached_response = self.client.get("/api/surveys/{}".format(survey.id))
+        self.assertEqual(cached_response.data, response.data)
+
+    def test_list_is_served_from_cache(self):
+        create_survey()
+        response = self.client.get("/api/surveys/")
+        with self.assertNumQueries(1):
+            cached_response = self.client.get("/api/surveys/")
+        self.assertEqual(cached_response.data, response.data)
+
+    def test_serializer_update_invalidates_survey(self):
+        from .serializers import SurveySerializer, QuestionSerializer, QuestionAnswerSerializer
+        survey = create_survey()
+        self.client.get("/api/surveys/{}".format(survey.id))
+        self.client.get("/api/surveys/")
+
+        serializer = SurveySerializer(instance=survey, data={"title": "New title"}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertEqual(self.client.get("/api/surveys/{}".format(survey.id)).data["survey"]["title"], "New title")
+        self.assertEqual(self.client.get("/api/surveys/").data["surveys"][0]["title"], "New title")
+
+        question = survey.questions.filter(question_type="SC").first()
+        serializer = QuestionSerializer(instance=question, data={"text": "New question"}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        questions = self.client.get("/api/surveys/{}".format(survey.id)).data["survey"]["questions"]
+        self.assertIn("New question", [question["text"] for question in questions])
+
+        question_answer = question.question_answers.first()
+        serializer = QuestionAnswerSerializer(instance=question_answer, data={"text": "New choice"}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        questions = self.client.get("/api/surveys/{}".format(survey.id)).data["survey"]["questions"]
+        choices = [choice["text"] for question in questions for choice in question["question_answers"]]
+        self.assertIn("New choice", choices)
+
+    def test_concurrent_updates_of_stale_instances_get_different_versions(self):
+        from .serializers import SurveySerializer, QuestionSerializer
+        survey = create_survey()
+        first, second = Survey.objects.get(pk=survey.id), Survey.objects.get(pk=survey.id)
+        versions = []
+        for instance, data in ((second, {"title": "B"}), (first, {"description": "A"})):
+            serializer = SurveySerializer(instance=instance, data=data, partial=True)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+            versions.append(Survey.objects.get(pk=survey.id).version)
+        self.assertEqual(versions, [survey.version + 1, survey.version + 2])
+        self.assertEqual(Survey.objects.filter(pk=survey.id).values_list("title", "description").get(), ("B", "A"))
+
+        question = survey.questions.filter(question_type="SC").first()
+        first, second = Question.objects.get(pk=question.id), Question.objects.get(pk=question.id)
+        for instance, text in ((second, "B"), (first, "A")):
+            serializer = QuestionSerializer(instance=instance, data={"text": text}, partial=True)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        self.assertEqual(Survey.objects.get(pk=survey.id).version, survey.version + 4)
+        self.assertEqual(Question.objects.get(pk=question.id).text, "A")
+
+    def test_changes_of_other_processes_are_not_served_from_cache(self):
+        survey = create_survey()
+        path = "/api/surveys/{}".format(survey.id)
+        self.client.get(path)
+        self.client.get("/api/surveys/")
+
+        # Другой процесс изменяет опрос: его кэш и версии этого процесса не затрагиваются
+        Survey.objects.filter(pk=survey.id).update(title="New title", version=F("version") + 1)
+        self.assertEqual(self.client.get(path).data["survey"]["title"], "New title")
+        self.assertEqual(self.client.get("/api/surveys/").data["surveys"][0]["title"], "New title")
+
+        Survey.objects.filter(pk=survey.id).delete()
+        self.assertEqual(self.client.get(path).status_code, 404)
+        self.assertEqual(self.client.get("/api/surveys/").data["surveys"], [])
+
+    def test_expired_survey_disappears_without_write(self):
+        survey = create_survey(end_date=datetime.now().date())
+        self.assertEqual(len(self.client.get("/api/surveys/").data["surveys"]), 1)
+        self.assertEqual(self.client.get("/api/surveys/{}".format(survey.id)).status_code, 200)
+
+        tomorrow = datetime.now().date() + timedelta(days=1)
+        with mock.patch("surveyAPI.payloads.today", return_value=tomorrow):
+            self.assertEqual(self.client.get("/api/surveys/{}".format(survey.id)).status_code, 404)
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        lru = cache.LRUCache(2)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual((lru.get("a"), lru.get("c")), (1, 3))
+
+
+def answers_payload(survey, user_id=1):
+    """
+    Формирует корректный ответ на все вопросы опроса в формате запроса на прохождение опроса
+    :param survey: объект типа Survey
+    :param user_id: id пользователя
+    :return: словарь с ключом user_answers
+    """
+    answers = []
+    for question in survey.questions.all().order_by("id"):
+        if question.question_type == "PT":
+            answers.append({"question": question.id, "answer": "text"})
+        for choice in question.question_answers.all()[:2 if question.question_type == "MC" else 1]:
+            answers.append({"question": question.id, "answer": choice.text})
+    return {"user_answers": {"user_ID": user_id, "answers": answers}}
+
+
+class SurveyCompletionTest(SurveyTestCase):
+    def complete(self, survey, payload):
+        return self.client.post("/api/surveys/{}".format(survey.id), payload, format="json")
+
+    def test_correct_answers_are_saved(self):
+        survey = create_survey(questions_count=2)
+        response = self.complete(survey, answers_payload(survey, user_id=5))
+        self.assertEqual(response.status_code, 201)
+        holder = UserAnswersHolder.objects.get(user_ID=5, survey=survey)
+        self.assertEqual(holder.answers.count(), 2 * (1 + 1 + 2))
+
+    def test_repeated_answers_are_saved_once(self):
+        survey = create_survey(questions_count=1)
+        payload = answers_payload(survey)
+        payload["user_answers"]["answers"] *= 2
+        self.assertEqual(self.complete(survey, payload).status_code, 201)
+        self.assertEqual(UserAnswer.objects.count(), 1 + 1 + 2)
+
+    def test_not_all_questions_completed(self):
+        survey = create_survey(questions_count=1)
+        payload = answers_payload(survey)
+        payload["user_answers"]["answers"].pop()
+        payload["user_answers"]["answers"] = [answer for answer in payload["user_answers"]["answers"]
+                                              if answer["answer"] != "text"]
+        self.assertEqual(self.complete(survey, payload).status_code, 400)
+        self.assertFalse(UserAnswersHolder.objects.exists())
+
+    def test_incorrect_choice(self):
+        survey = create_survey(questions_count=1)
+        payload = answers_payload(survey)
+        payload["user_answers"]["answers"].append({"question": survey.questions.filter(question_type="SC")[0].id,
+                                                   "answer": "Unknown choice"})
+        self.assertEqual(self.complete(survey, payload).status_code, 400)
+        self.assertFalse(UserAnswersHolder.objects.exists())
+
+    def test_missing_or_blank_answer(self):
+        survey = create_survey(questions_count=1)
+        for answer in ({"question": survey.questions.filter(question_type="PT")[0].id},
+                       {"question": survey.questions.filter(question_type="PT")[0].id, "answer": ""}):
+            payload = answers_payload(survey)
+            payload["user_answers"]["answers"][0] = answer
+            self.assertEqual(self.complete(survey, payload).status_code, 400)
+        self.assertFalse(UserAnswersHolder.objects.exists())
+
+    def test_answer_to_question_of_another_survey(self):
+        survey = create_survey(questions_count=1)
+        other_question = create_survey(questions_count=1).questions.filter(question_type="PT")[0]
+        payload = answers_payload(survey)
+        payload["user_answers"]["answers"].append({"question": other_question.id, "answer": "text"})
+        self.assertEqual(self.complete(survey, payload).status_code, 400)
+
+    def test_choice_changes_of_other_processes_are_validated(self):
+        survey = create_survey(questions_count=1)
+        self.assertEqual(self.complete(survey, answers_payload(survey, user_id=1)).status_code, 201)
+        question = survey.questions.get(question_type="SC")
+        payload = answers_payload(survey, user_id=2)
+
+        # Другой процесс изменяет варианты ответа: кэш и версии этого процесса не затрагиваются
+        QuestionAnswer.objects.create(question=question, text="New choice")
+        question.question_answers.filter(text="Choice 1").delete()
+        Survey.objects.filter(pk=survey.id).update(version=F("version") + 1)
+        payload["user_answers"]["answers"].append({"question": question.id, "answer": "New choice"})
+        self.assertEqual(self.complete(survey, payload).status_code, 201)
+        payload["user_answers"]["answers"][-1]["answer"] = "Choice 1"
+        self.assertEqual(self.complete(survey, payload).status_code, 400)
+
+    def test_validation_queries_do_not_depend_on_answer_count(self):
+        def count_selects(survey):
+            payload = answers_payload(survey)
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.complete(survey, payload).status_code, 201)
+            return len([query for query in context.captured_queries if query["sql"].startswith("SELECT")])
+
+        self.assertEqual(count_selects(create_survey(questions_count=1)),
+                         count_selects(create_survey(questions_count=20)))
+
+    def test_insert_statements_do_not_depend_on_answer_count(self):
+        def count_inserts(survey):
+            payload = answers_payload(survey)
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.complete(survey, payload).status_code, 201)
+            return len([query for query in context.captured_queries
+                        if query["sql"].startswith("INSERT") and "useranswer" in query["sql"]])
+
+        self.assertEqual(count_inserts(create_survey(questions_count=1)), 2)
+        self.assertEqual(count_inserts(create_survey(questions_count=30)), 2)
+
+    def test_failed_answers_insert_leaves_no_holder(self):
+        survey = create_survey(questions_count=1)
+        with mock.patch.object(UserAnswer.objects, "bulk_create", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.complete(survey, answers_payload(survey))
+        self.assertFalse(UserAnswersHolder.objects.exists())
+
+
+class BatchCompletionTest(SurveyTestCase):
+    def complete(self, items):
+        return self.client.post("/api/surveys/completions", {"user_answers": items}, format="json")
+
+    @staticmethod
+    def item(survey, user_id=1):
+        user_answers = answers_payload(survey, user_id)["user_answers"]
+        user_answers["survey"] = survey.id
+        return user_answers
+
+    def test_results_are_reported_per_item(self):
+        survey = create_survey(questions_count=1)
+        other_survey = create_survey(questions_count=2)
+        expired_survey = create_survey(end_date=datetime.now().date() - timedelta(days=1))
+        incomplete = self.item(survey, user_id=3)
+        incomplete["answers"] = incomplete["answers"][:1]
+
+        response = self.complete([
+            self.item(survey, user_id=1),
+            {"survey": survey.id, "answers": []},
+            self.item(other_survey, user_id=2),
+            incomplete,
+            self.item(expired_survey),
+        ])
+        self.assertEqual(response.status_code, 200)
+        statuses = [result["status"] for result in response.data["results"]]
+        self.assertEqual(statuses, [201, 400, 201, 400, 404])
+        holder = UserAnswersHolder.objects.get(pk=response.data["results"][2]["id"])
+        self.assertEqual((holder.user_ID, holder.survey_id), (2, other_survey.id))
+        self.assertEqual(holder.answers.count(), 2 * (1 + 1 + 2))
+        self.assertEqual(UserAnswersHolder.objects.count(), 2)
+
+    def test_missing_or_blank_answer(self):
+        survey = create_survey(questions_count=1)
+        items = [self.item(survey, user_id=1), self.item(survey, user_id=2)]
+        del items[0]["answers"][0]["answer"]
+        items[1]["answers"][0]["answer"] = ""
+        response = self.complete(items)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result["status"] for result in response.data["results"]], [400, 400])
+        self.assertFalse(UserAnswersHolder.objects.exists())
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        surveys = [create_survey(questions_count=2) for _ in range(2)]
+
+        def count_queries(size):
+            items = [self.item(surveys[i % 2], user_id=i) for i in range(size)]
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.complete(items).status_code, 200)
+            holder_inserts = [query for query in context.captured_queries
+                              if query["sql"].startswith("INSERT") and "useranswersholder" in query["sql"]]
+            return len(context.captured_queries) - len(holder_inserts)
+
+        count_queries(2)
+        self.assertEqual(count_queries(2), count_queries(20))
+
+    def test_batch_size_is_limited(self):
+        survey = create_survey(questions_count=1)
+        with self.settings(SURVEY_BATCH_MAX_SIZE=1):
+            self.assertEqual(self.complete([self.item(survey), self.item(survey)]).status_code, 400)
+        self.assertEqual(self.complete({"survey": survey.id}).status_code, 400)
+
+
+class AsyncCompletionTest(SurveyTestCase):
+    def complete(self, survey, payload):
+        with self.settings(SURVEY_ASYNC_COMPLETION=True):
+            return self.client.post("/api/surveys/{}".format(survey.id), payload, format="json")
+
+    def status(self, receipt):
+        return self.client.get("/api/completions/{}".format(receipt)).data["completion"]
+
+    @staticmethod
+    def run_worker(*args):
+        call_command("process_completions", "--once", *args, stdout=io.StringIO())
+
+    def test_completion_is_queued_and_written_by_worker(self):
+        survey = create_survey(questions_count=2)
+        response = self.complete(survey, answers_payload(survey, user_id=7))
+        self.assertEqual(response.status_code, 202)
+        receipt = response.data["receipt"]
+        self.assertFalse(UserAnswersHolder.objects.exists())
+        self.assertEqual(self.status(receipt)["status"], "Queued")
+
+        self.run_worker()
+        status = self.status(receipt)
+        self.assertEqual(status["status"], "Done")
+        holder = UserAnswersHolder.objects.get(pk=status["user_answers_holder"])
+        self.assertEqual((holder.user_ID, holder.survey_id), (7, survey.id))
+        self.assertEqual(holder.answers.count(), 2 * (1 + 1 + 2))
+
+    def test_incorrect_completion_is_rejected_before_queueing(self):
+        survey = create_survey(questions_count=1)
+        payload = answers_payload(survey)
+        payload["user_answers"]["answers"][-1]["answer"] = "Unknown choice"
+        self.assertEqual(self.complete(survey, payload).status_code, 400)
+        self.assertFalse(PendingCompletion.objects.exists())
+
+    def test_completion_invalidated_by_survey_change_fails(self):
+        survey = create_survey(questions_count=1)
+        receipt = self.complete(survey, answers_payload(survey)).data["receipt"]
+        Question.objects.create(survey=survey, text="New question", question_type="PT")
+        touch_survey(survey.id)
+
+        self.run_worker()
+        status = self.status(receipt)
+        self.assertEqual(status["status"], "Failed")
+        self.assertEqual(status["error"], "All questions should be completed!")
+        self.assertFalse(UserAnswersHolder.objects.exists())
+
+    def test_database_error_fails_only_its_completion(self):
+        survey = create_survey(questions_count=1)
+        receipts = [self.complete(survey, answers_payload(survey, user_id=user_id)).data["receipt"]
+                    for user_id in range(3)]
+
+        def save_completions(completions):
+            storage.save_completions(completions)
+            if any(completion.user_answers_holder.user_ID == 1 for completion in completions):
+                raise IntegrityError("Broken completion")
+
+        with mock.patch("surveyAPI.ingestion.save_completions", side_effect=save_completions):
+            self.run_worker()
+        statuses = [self.status(receipt) for receipt in receipts]
+        self.assertEqual([status["status"] for status in statuses], ["Done", "Failed", "Done"])
+        self.assertEqual(statuses[1]["error"], "Broken completion")
+        self.assertIsNone(statuses[1]["user_answers_holder"])
+        self.assertEqual(sorted(UserAnswersHolder.objects.values_list("user_ID", flat=True)), [0, 2])
+        self.assertEqual(UserAnswer.objects.count(), 2 * (1 + 1 + 2))
+        self.assertEqual(SurveyCounter.objects.get(survey=survey).count, 2)
+
+    def test_worker_drains_queue_in_batches(self):
+        survey = create_survey(questions_count=1)
+        for user_id in range(7):
+            self.complete(survey, answers_payload(survey, user_id=user_id))
+        self.run_worker("--batch-size", "3")
+        self.assertEqual(UserAnswersHolder.objects.count(), 7)
+        self.assertFalse(PendingCompletion.objects.filter(status="QUEUED").exists())
+
+    def test_unknown_receipt(self):
+        response = self.client.get("/api/completions/00000000-0000-0000-0000-000000000000")
+        self.assertEqual(response.status_code, 404)
+
+
+@skipUnless(connection.vendor == "sqlite", "Query plans are checked on SQLite")
+class HotQueriesPlanTest(SurveyTestCase):
+    def assert_selects_use_indexes(self, request):
+        """
+        Проверяет, что все запросы на чтение находят строки по индексу (SEARCH), а не перебирают
+        таблицу или индекс целиком (SCAN ... и SCAN ... USING INDEX)
+        """
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = request()
+        self.assertLess(response.status_code, 300)
+        selects = [query["sql"] for query in context.captured_queries if query["sql"].startswith("SELECT")]
+        self.assertTrue(selects)
+        with connection.cursor() as cursor:
+            for sql in selects:
+                cursor.execute("EXPLAIN QUERY PLAN " + sql)
+                plan = [row[-1] for row in cursor.fetchall()]
+                self.assertEqual([step for step in plan if step.startswith("SCAN")], [], sql)
+                self.assertTrue([step for step in plan if step.startswith("SEARCH")], sql)
+
+    def test_hot_queries_use_indexes(self):
+        survey = create_survey()
+        create_survey(end_date=datetime.now().date() - timedelta(days=1))
+        holder = complete_survey(survey, user_id=1)
+        complete_survey(survey, user_id=2)
+
+        self.assert_selects_use_indexes(lambda: self.client.get("/api/surveys/"))
+        self.assert_selects_use_indexes(lambda: self.client.get("/api/surveys/{}".format(survey.id)))
+        payload = answers_payload(survey)
+        self.assert_selects_use_indexes(lambda: self.client.post("/api/surveys/{}".format(survey.id),
+                                                                 payload, format="json"))
+        self.assert_selects_use_indexes(lambda: self.client.get("/api/completed-surveys/1"))
+        self.assert_selects_use_indexes(lambda: self.client.get("/api/completed-surveys/1/{}".format(holder.id)))
+
+
+class CompletionMixin:
+    def complete(self, survey, user_id=1):
+        """
+        Проходит опрос через API
+        :return: созданный объект типа UserAnswersHolder
+        """
+        response = self.client.post("/api/surveys/{}".format(survey.id), answers_payload(survey, user_id), format="json")
+        self.assertEqual(response.status_code, 201)
+        return UserAnswersHolder.objects.filter(survey=survey, user_ID=user_id).latest("id")
+
+
+class SnapshotTest(CompletionMixin, SurveyTestCase):
+
+    def test_completions_of_one_version_share_snapshot(self):
+        survey = create_survey()
+        first = self.complete(survey, user_id=1)
+        second = self.complete(survey, user_id=2)
+        self.assertIsNotNone(first.snapshot_id)
+        self.assertEqual(first.snapshot_id, second.snapshot_id)
+        self.assertEqual(SurveySnapshot.objects.count(), 1)
+
+    def test_completed_survey_is_not_affected_by_edits(self):
+        survey = create_survey(questions_count=1)
+        holder = self.complete(survey)
+        payload = self.client.get("/api/surveys/{}".format(survey.id)).data["survey"]
+
+        Question.objects.filter(survey=survey).update(text="Edited")
+        touch_survey(survey.id)
+        completed = self.client.get("/api/completed-surveys/1/{}".format(holder.id)).data["completed_survey"]
+        self.assertEqual(completed["survey"], json.loads(json.dumps(payload)))
+        self.assertEqual(len(completed["answers"]), 1 + 1 + 2)
+
+        expanded = self.client.get("/api/completed-surveys/1", {"expand": "survey"}).data["completed_surveys"][0]
+        self.assertEqual(expanded["survey"], completed["survey"])
+
+        self.complete(survey, user_id=2)
+        self.assertEqual(SurveySnapshot.objects.count(), 2)
+
+    def test_edits_of_other_processes_get_new_snapshot(self):
+        survey = create_survey(questions_count=1)
+        first = self.complete(survey, user_id=1)
+
+        # Другой процесс изменяет опрос: кэш и версии этого процесса не затрагиваются
+        Question.objects.filter(survey=survey).update(text="Edited")
+        Survey.objects.filter(pk=survey.id).update(version=F("version") + 1)
+        second = self.complete(survey, user_id=2)
+        self.assertNotEqual(second.snapshot_id, first.snapshot_id)
+        completed = self.client.get("/api/completed-surveys/2/{}".format(second.id)).data["completed_survey"]
+        self.assertEqual({question["text"] for question in completed["survey"]["questions"]}, {"Edited"})
+
+    def test_validated_choices_are_in_snapshot(self):
+        survey = create_survey(questions_count=1)
+        self.complete(survey, user_id=1)
+        question = survey.questions.get(question_type="SC")
+        choice = QuestionAnswer.objects.create(question=question, text="New choice")
+        touch_survey(survey.id)
+
+        validation_index, snapshot_hash = get_completion_context(survey.id)
+        snapshot = SurveySnapshot.objects.get(pk=snapshot_hash)
+        choice_ids = {question_answer["id"] for question in json.loads(snapshot.data)["questions"]
+                      for question_answer in question["question_answers"]}
+        self.assertEqual({choice_id for _, choices in validation_index.questions.values()
+                          for choice_id in choices.values()}, choice_ids)
+        self.assertEqual(validation_index.questions, SurveyValidationIndex.load(survey.id).questions)
+        self.assertIn(choice.id, choice_ids)
+
+    def test_completed_survey_read_does_not_join(self):
+        survey = create_survey()
+        holder = self.complete(survey)
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/api/completed-surveys/1/{}".format(holder.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(context.captured_queries), 3)
+        self.assertFalse([query for query in context.captured_queries if "JOIN" in query["sql"]])
+        with CaptureQueriesContext(connection) as context:
+            self.client.get("/api/completed-surveys/1/{}".format(holder.id))
+        self.assertEqual(len(context.captured_queries), 2)
+
+    def test_completion_without_snapshot_uses_current_survey(self):
+        survey = create_survey(questions_count=1)
+        holder = complete_survey(survey, user_id=1)
+        completed = self.client.get("/api/completed-surveys/1/{}".format(holder.id)).data["completed_survey"]
+        self.assertEqual(completed["survey"], self.client.get("/api/surveys/{}".format(survey.id)).data["survey"])
+        self.assertEqual(self.client.get("/api/completed-surveys/2/{}".format(holder.id)).status_code, 404)
+
+
+class ConditionalRequestTest(SurveyTestCase):
+    def test_survey_not_modified(self):
+        survey = create_survey()
+        path = "/api/surveys/{}".format(survey.id)
+        response = self.client.get(path)
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+
+        with mock.patch("surveyAPI.payloads.represent_surveys") as serializer:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response["ETag"], etag)
+            self.assertEqual(len(context.captured_queries), 1)
+            self.assertEqual(self.client.get(path, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+            serializer.assert_not_called()
+
+    def test_survey_changes_etag(self):
+        survey = create_survey()
+        path = "/api/surveys/{}".format(survey.id)
+        etag = self.client.get(path)["ETag"]
+        question = survey.questions.filter(question_type="SC").first()
+        self.client.force_authenticate(User.objects.create_user("admin", password="password", is_staff=True))
+        self.client.put("/api/admin/questions/{}".format(question.id), {"question": {"text": "Edited"}}, format="json")
+
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(Survey.objects.get(pk=survey.id).version, survey.version + 1)
+
+    def test_validators_follow_changes_of_other_processes(self):
+        survey = create_survey()
+        path = "/api/surveys/{}".format(survey.id)
+        response = self.client.get(path)
+        list_etag = self.client.get("/api/surveys/")["ETag"]
+
+        # Другой процесс изменяет опрос: закэшированные здесь данные и их версии не изменяются
+        updated_at = survey.updated_at + timedelta(seconds=10)
+        Survey.objects.filter(pk=survey.id).update(version=F("version") + 1, updated_at=updated_at)
+        changed = self.client.get(path, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], response["ETag"])
+        self.assertEqual(self.client.get(path, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, 200)
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=changed["ETag"]).status_code, 304)
+        self.assertEqual(self.client.get("/api/surveys/", HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+        Survey.objects.filter(pk=survey.id).update(updated_at=updated_at + timedelta(seconds=10))
+        self.assertNotEqual(self.client.get(path)["Last-Modified"], changed["Last-Modified"])
+
+    def test_list_not_modified(self):
+        first = create_survey()
+        create_survey()
+        etag = self.client.get("/api/surveys/")["ETag"]
+        self.assertEqual(self.client.get("/api/surveys/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.client.get("/api/surveys/", {"limit": 1})["ETag"], etag)
+
+        first.delete()
+        self.assertEqual(self.client.get("/api/surveys/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+INSTRUMENTATION = {"ENABLED": True, "SLOW_REQUEST_MS": 60 * 1000, "SAMPLE_SIZE": 10, "PUBLISH_INTERVAL": 0}
+
+
+@override_settings(SURVEY_INSTRUMENTATION=INSTRUMENTATION)
+class InstrumentationTest(SurveyTestCase):
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+        self.addCleanup(registry.reset)
+
+    def get_endpoint_stats(self, endpoint):
+        return {row["endpoint"]: row for row in get_stats()}[endpoint]
+
+    def test_disabled_middleware_is_not_used(self):
+        with override_settings(SURVEY_INSTRUMENTATION={"ENABLED": False}):
+            with self.assertRaises(MiddlewareNotUsed):
+                InstrumentationMiddleware(lambda request: None)
+
+    def test_requests_are_measured_per_endpoint(self):
+        survey = create_survey()
+        for _ in range(3):
+            response = self.client.get("/api/surveys/{}".format(survey.id))
+        create_survey()
+        self.client.get("/api/surveys/{}".format(survey.id + 1))
+
+        stats = self.get_endpoint_stats("GET /api/surveys/<int:pk>")
+        self.assertEqual(stats["count"], 4)
+        self.assertEqual(stats["queries"]["p50"], 1)
+        self.assertGreater(stats["queries"]["max"], 1)
+        self.assertGreater(stats["db_ms"]["max"], 0)
+        self.assertGreater(stats["serializer_ms"]["max"], 0)
+        self.assertEqual(stats["size"]["p50"], len(response.content))
+        self.assertGreaterEqual(stats["wall_ms"]["max"], stats["wall_ms"]["p99"])
+
+    def test_samples_are_bounded(self):
+        for _ in range(15):
+            self.client.get("/api/surveys/")
+        self.assertEqual(len(registry.snapshot()["GET /api/surveys/"]["samples"]), 10)
+        self.assertEqual(self.get_endpoint_stats("GET /api/surveys/")["count"], 15)
+
+    def test_slow_requests_are_logged_with_sql(self):
+        survey = create_survey()
+        with override_settings(SURVEY_INSTRUMENTATION=dict(INSTRUMENTATION, SLOW_REQUEST_MS=0)):
+            with self.assertLogs("surveyAPI.instrumentation", "WARNING") as logs:
+                self.client.get("/api/surveys/{}".format(survey.id))
+        self.assertIn("GET /api/surveys/<int:pk>", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+
+    def test_stats_of_other_processes_are_merged(self):
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+                               SURVEY_CACHE={"BACKEND": "default"}):
+            self.client.get("/api/surveys/")
+            other = {"GET /api/surveys/": {"count": 2, "samples": [(1.0, 1, 0.5, 10, 0.1)] * 2}}
+            shared = cache.shared_cache()
+            shared.set("instrumentation:other:1", other)
+            shared.set("instrumentation:processes", shared.get("instrumentation:processes") + ["instrumentation:other:1"])
+            self.assertEqual(self.get_endpoint_stats("GET /api/surveys/")["count"], 3)
+
+            out = io.StringIO()
+            call_command("request_stats", "--reset", stdout=out)
+            self.assertIn("GET /api/surveys/", out.getvalue())
+            self.assertEqual(get_stats(), [])
+
+
+class SyntheticDataTest(SurveyTestCase):
+    def test_generate_data(self):
+        call_command("generate_data", "--surveys", "3", "--questions", "4", "--choices", "3", "--completions", "50",
+                     "--users", "5", "--expired", "0.34", "--chunk-size", "20", stdout=io.StringIO())
+        self.assertEqual(Survey.objects.count(), 3)
+        self.assertEqual(Question.objects.count(), 12)
+        self.assertEqual(QuestionAnswer.objects.count(), 3 * 2 * 3)
+        self.assertEqual(UserAnswersHolder.objects.count(), 50)
+        self.assertEqual(UserAnswersHolder.objects.filter(snapshot=None).count(), 0)
+        self.assertLessEqual(UserAnswersHolder.objects.values("user_ID").distinct().count(), 5)
+        self.assertEqual(len(self.client.get("/api/surveys/").data["surveys"]), 2)
+
+        for survey in Survey.objects.all():
+            respondents, question_counts, choice_counts = count_survey_answers(survey.id)
+            self.assertEqual(SurveyCounter.objects.get(pk=survey.id).count, respondents)
+            self.assertEqual(dict(QuestionAnswerCounter.objects.filter(question_answer__question__survey=survey)
+                                  .values_list("pk", "count")), dict(choice_counts))
+
+        survey = Survey.objects.order_by("id").last()
+        self.assertEqual(self.client.post("/api/surveys/{}".format(survey.id), answers_payload(survey, user_id=99),
+                                          format="json").status_code, 201)
+
+
+class ReplayTest(SurveyTestCase):
+    def recorded(self, survey):
+        return [
+            json.dumps({"method": "GET", "path": "/api/surveys/?limit=1"}),
+            json.dumps({"method": "GET", "path": "/api/surveys/{}".format(survey.id)}),
+            json.dumps({"method": "POST", "path": "/api/surveys/{}".format(survey.id),
+                        "body": answers_payload(survey), "expected": 201}),
+            json.dumps({"method": "GET", "path": "/api/admin/surveys/", "headers": {"Authorization": "Token wrong"}}),
+            "",
+        ]
+
+    def test_replay_in_process(self):
+        survey = create_survey()
+        results, elapsed = replay(load_requests(self.recorded(survey)), InProcessTransport, repeat=3)
+        summary = {row["route"]: row for row in summarize(results, elapsed)}
+
+        self.assertEqual(summary["TOTAL"]["count"], 12)
+        self.assertEqual(summary["TOTAL"]["errors"], 3)
+        self.assertEqual(summary["GET /api/surveys/<int:pk>"]["count"], 3)
+        self.assertEqual(summary["POST /api/surveys/<int:pk>"]["errors"], 0)
+        self.assertEqual(summary["GET /api/admin/surveys/"]["error_rate"], 1)
+        self.assertEqual(UserAnswersHolder.objects.filter(survey=survey).count(), 3)
+
+    def test_replay_command(self):
+        survey = create_survey()
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl") as recorded:
+            recorded.write("\n".join(self.recorded(survey)))
+            recorded.flush()
+            out = io.StringIO()
+            call_command("replay_traffic", recorded.name, "--json", stdout=out)
+        routes = {row["route"]: row for row in json.loads(out.getvalue())["routes"]}
+        self.assertEqual(routes["GET /api/surveys/"]["count"], 1)
+
+
+class FastPathEquivalenceTest(SurveyTestCase):
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def create_surveys(self):
+        surveys = [create_survey(), create_survey(questions_count=0)]
+        survey = Survey.objects.create(title="Опрос \u2028 \"quotes\" \\ <tag>", end_date=datetime.now().date(),
+                                       description="")
+        question = Question.objects.create(survey=survey, text="Вопрос 😀", question_type="MC")
+        QuestionAnswer.objects.create(question=question, text="\u2029 ответ")
+        Question.objects.create(survey=survey, text="", question_type="PT")
+        return surveys + [survey]
+
+    def test_survey_representation(self):
+        self.create_surveys()
+        surveys = list(with_questions(Survey.objects.all()))
+        for survey in surveys:
+            self.assertEqual(self.render(survey_representation(survey)),
+                             self.render(SurveySerializer(instance=survey).data))
+
+    def test_completed_survey_representation(self):
+        for survey in self.create_surveys():
+            complete_survey(survey, user_id=1)
+        holders = list(UserAnswersHolder.objects.all().prefetch_related("answers"))
+        self.assertEqual(self.render([completed_survey_representation(holder) for holder in holders]),
+                         self.render(CompactUserAnswersHolderSerializer(holders, many=True).data))
+
+        holder = holders[0]
+        completed = self.client.get("/api/completed-surveys/1/{}".format(holder.id)).content
+        self.assertEqual(completed, self.render({"completed_survey": UserAnswersHolderSerializer(instance=holder).data}))
+
+    def test_responses_do_not_depend_on_fast_path(self):
+        for survey in self.create_surveys():
+            complete_survey(survey, user_id=1)
+        paths = ["/api/surveys/", "/api/surveys/?limit=1", "/api/surveys/{}".format(Survey.objects.last().id),
+                 "/api/completed-surveys/1", "/api/completed-surveys/1?expand=survey"]
+        fast = [self.client.get(path).content for path in paths]
+        with override_settings(SURVEY_FAST_SERIALIZERS=False, REST_FRAMEWORK={
+                "DEFAULT_RENDERER_CLASSES": ("rest_framework.renderers.JSONRenderer",),
+                "DEFAULT_PARSER_CLASSES": ("rest_framework.parsers.JSONParser",)}):
+            cache.clear()
+            self.assertEqual([self.client.get(path).content for path in paths], fast)
+
+    def test_renderer(self):
+        values = [
+            {"surveys": [{"id": 1, "title": "Опрос \u2028\u2029 😀", "start_date": datetime.now().date()}]},
+            {"Incorrect data!"},
+            {"date": datetime(2020, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc), "naive": datetime(2020, 1, 2, 3, 4)},
+            {"decimal": Decimal("1.10"), "uuid": uuid.UUID(int=1), "lazy": gettext_lazy("text")},
+            {1: "int key", "nested": ReturnDict([("b", 1), ("a", (1, 2.5, None, True))], serializer=None)},
+            {"error": [ErrorDetail("This field is required.", code="required")], "big": 2 ** 70},
+            [], "string", 3, None,
+        ]
+        for value in values:
+            self.assertEqual(FastJSONRenderer().render(value), JSONRenderer().render(value), value)
+        self.assertEqual(FastJSONRenderer().render(values[0], "application/json; indent=4"),
+                         JSONRenderer().render(values[0], "application/json; indent=4"))
+        with self.assertRaises(TypeError):
+            FastJSONRenderer().render({"object": object()})
+
+    def test_parser(self):
+        bodies = ['{"user_answers": {"user_ID": 1, "answers": [{"question": 1, "answer": "Ответ \\u2028"}]}}',
+                  '[1, 2.5, null, true, "\\ud800"]', '{"big": 123456789012345678901234567890}', '"text"']
+        for body in bodies:
+            self.assertEqual(FastJSONParser().parse(io.BytesIO(body.encode())),
+                             JSONParser().parse(io.BytesIO(body.encode())))
+        for body in ['{"a": NaN}', '{"a": 1', '', '\ufeff{}']:
+            with self.assertRaises(ParseError):
+                JSONParser().parse(io.BytesIO(body.encode()))
+            with self.assertRaises(ParseError):
+                FastJSONParser().parse(io.BytesIO(body.encode()))
+
+
+class PaginationTest(SurveyTestCase):
+    def collect_pages(self, path, key):
+        ids, cursor = [], None
+        while True:
+            response = self.client.get(path, {"limit": 2, "cursor": cursor} if cursor else {"limit": 2})
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data[key]), 2)
+            ids.extend(item["id"] for item in response.data[key])
+            cursor = response.data["next"]
+            if cursor is None:
+                return ids
+
+    def test_surveys_are_paginated(self):
+        surveys = [create_survey(questions_count=1) for _ in range(5)]
+        self.assertEqual(self.collect_pages("/api/surveys/", "surveys"), [survey.id for survey in surveys])
+
+    def test_completed_surveys_are_paginated(self):
+        survey = create_survey(questions_count=1)
+        holders = [complete_survey(survey, user_id=1) for _ in range(4)]
+        complete_survey(survey, user_id=2)
+        self.assertEqual(self.collect_pages("/api/completed-surveys/1", "completed_surveys"),
+                         [holder.id for holder in holders])
+
+    def test_completed_surveys_are_compact_unless_expanded(self):
+        survey = create_survey(questions_count=1)
+        complete_survey(survey, user_id=1)
+        compact = self.client.get("/api/completed-surveys/1").data["completed_surveys"][0]
+        self.assertEqual(compact["survey"], survey.id)
+        self.assertEqual(len(compact["answers"]), 3)
+
+        expanded = self.client.get("/api/completed-surveys/1", {"expand": "survey"}).data["completed_surveys"][0]
+        self.assertEqual(expanded["survey"], self.client.get("/api/surveys/{}".format(survey.id)).data["survey"])
+        self.assertEqual(expanded["answers"], compact["answers"])
+
+    def test_expanded_expired_survey(self):
+        survey = create_survey(questions_count=1, end_date=datetime.now().date() - timedelta(days=1))
+        complete_survey(survey, user_id=1)
+        expanded = self.client.get("/api/completed-surveys/1", {"expand": "survey"}).data["completed_surveys"][0]
+        self.assertEqual(expanded["survey"]["id"], survey.id)
+
+    def test_expanded_query_count_does_not_depend_on_page_size(self):
+        def count_queries():
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.client.get("/api/completed-surveys/1", {"expand": "survey"})
+            return len(context.captured_queries)
+
+        complete_survey(create_survey(questions_count=1), user_id=1)
+        small = count_queries()
+        for _ in range(5):
+            complete_survey(create_survey(questions_count=3), user_id=1)
+        self.assertEqual(count_queries(), small)
+
+    def test_incorrect_page_params(self):
+        self.assertEqual(self.client.get("/api/surveys/", {"cursor": "???"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/surveys/", {"limit": "0"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/completed-surveys/1", {"limit": "many"}).status_code, 400)
+
+
+class ResultCountersTest(SurveyTestCase):
+    def assert_counters_consistent(self, survey):
+        respondents, question_counts, choice_counts = count_survey_answers(survey.id, chunk_size=2)
+        self.assertEqual(SurveyCounter.objects.get(pk=survey.id).count, respondents)
+        self.assertEqual(dict(QuestionCounter.objects.filter(question__survey=survey).values_list("pk", "count")),
+                         dict(question_counts))
+        self.assertEqual(dict(QuestionAnswerCounter.objects.filter(question_answer__question__survey=survey)
+                              .values_list("pk", "count")), dict(choice_counts))
+
+    def test_counters_are_consistent_with_answers(self):
+        survey = create_survey(questions_count=2)
+        for user_id in range(3):
+            self.client.post("/api/surveys/{}".format(survey.id), answers_payload(survey, user_id), format="json")
+        item = answers_payload(survey, user_id=10)["user_answers"]
+        item["survey"] = survey.id
+        self.client.post("/api/surveys/completions", {"user_answers": [item, item]}, format="json")
+        with self.settings(SURVEY_ASYNC_COMPLETION=True):
+            self.client.post("/api/surveys/{}".format(survey.id), answers_payload(survey, 11), format="json")
+        call_command("process_completions", "--once", stdout=io.StringIO())
+
+        self.assertEqual(UserAnswersHolder.objects.filter(survey=survey).count(), 6)
+        self.assert_counters_consistent(survey)
+
+    def test_rebuild_restores_counters(self):
+        survey = create_survey(questions_count=2)
+        for user_id in range(5):
+            complete_survey(survey, user_id)
+        self.assertFalse(SurveyCounter.objects.exists())
+
+        call_command("rebuild_results", str(survey.id), "--chunk-size", "2", stdout=io.StringIO())
+        self.assertEqual(SurveyCounter.objects.get(pk=survey.id).count, 5)
+        self.assert_counters_consistent(survey)
+
+        rebuild_counters(survey.id)
+        self.assert_counters_consistent(survey)
+
+
+class ChoiceStorageTest(CompletionMixin, SurveyTestCase):
+    def answers(self, holder):
+        return [(answer.choice_id, answer.answer) for answer in holder.answers.order_by("id")]
+
+    def choices(self, survey):
+        return {(choice.question_id, choice.text): choice.id
+                for choice in QuestionAnswer.objects.filter(question__survey=survey).order_by("-id")}
+
+    def test_choice_answers_are_stored_as_ids(self):
+        survey = create_survey(questions_count=1)
+        payload = answers_payload(survey)
+        holder = self.complete(survey)
+        choices = self.choices(survey)
+        self.assertEqual(self.answers(holder), [(None, "text")] + [(choices[answer["question"], answer["answer"]], "")
+                                                                   for answer in payload["user_answers"]["answers"][1:]])
+
+        expected = [{"question": answer["question"], "answer": answer["answer"]}
+                    for answer in payload["user_answers"]["answers"]]
+        QuestionAnswer.objects.filter(question__survey=survey).update(text="Edited")
+        deleted = QuestionAnswer.objects.filter(question__survey=survey, question__question_type="SC")
+        deleted.delete()
+        touch_survey(survey.id)
+        completed = self.client.get("/api/completed-surveys/1/{}".format(holder.id)).data["completed_survey"]
+        self.assertEqual(completed["answers"], expected)
+        listed = self.client.get("/api/completed-surveys/1").data["completed_surveys"][0]
+        self.assertEqual(listed["answers"], expected)
+        exported = json.loads(next(export_responses(survey.id, "ndjson")))
+        self.assertEqual(sorted(exported["answers"].values(), key=str),
+                         sorted(["text", expected[1]["answer"], [expected[2]["answer"], expected[3]["answer"]]], key=str))
+
+    def test_counts_group_by_choice_ids(self):
+        survey = create_survey(questions_count=1)
+        for user_id in range(3):
+            self.complete(survey, user_id)
+        respondents, question_counts, choice_counts = count_survey_answers(survey.id)
+        choice_ids = [answer.choice_id for answer in UserAnswer.objects.filter(user_answers_holder__user_ID=0)
+                      if answer.choice_id is not None]
+        self.assertEqual((respondents, set(question_counts.values())), (3, {3}))
+        self.assertEqual(choice_counts, {choice_id: 3 for choice_id in choice_ids})
+
+    def test_backfill_migration(self):
+        migration = importlib.import_module("surveyAPI.migrations.0013_backfill_user_answer_choice")
+        survey = create_survey(questions_count=1)
+        legacy = complete_survey(survey, user_id=1)
+        holder = self.complete(survey, user_id=2)
+        expected = self.client.get("/api/completed-surveys/2/{}".format(holder.id)).data
+        completed = self.answers(holder)
+        texts = []
+        for answer in UserAnswer.objects.filter(user_answers_holder=holder).order_by("id"):
+            if answer.choice is not None:
+                answer.answer, answer.choice = answer.choice.text, None
+                answer.save()
+            texts.append(answer.answer)
+        renamed = UserAnswer.objects.filter(user_answers_holder=legacy, question__question_type="MC").first()
+        renamed.answer = "Renamed since"
+        renamed.save()
+        stored = [(answer.question_id, answer.answer) for answer in legacy.answers.order_by("id")]
+        # Тексты вариантов, выбранных в прохождении со снимком, поменялись местами после прохождения
+        first, second = QuestionAnswer.objects.filter(question__survey=survey, question__question_type="SC")[:2]
+        first.text, second.text = second.text, first.text
+        first.save()
+        second.save()
+
+        with mock.patch.object(migration, "CHUNK_SIZE", 3):
+            migration.backfill_choices(django_apps, SimpleNamespace(connection=connection))
+        self.assertEqual(self.answers(holder), completed)
+        choices = self.choices(survey)
+        self.assertEqual(self.answers(legacy), [(choices.get(key), key[1]) for key in stored])
+        self.assertIn((None, "Renamed since"), self.answers(legacy))
+        self.assertEqual(self.client.get("/api/completed-surveys/2/{}".format(holder.id)).data, expected)
+
+        migration.restore_texts(django_apps, SimpleNamespace(connection=connection))
+        self.assertFalse(UserAnswer.objects.filter(choice__isnull=False, answer="").exists())
+        self.assertEqual([text for _, text in self.answers(holder)], texts)
+
+
+class ExportTest(SurveyTestCase):
+    def test_export_memory_does_not_depend_on_response_count(self):
+        survey = Survey.objects.create(title="Export", end_date=datetime.now().date())
+        Question.objects.bulk_create([Question(survey=survey, text=str(i), question_type="PT") for i in range(10)])
+        questions = list(Question.objects.filter(survey=survey))
+        UserAnswersHolder.objects.bulk_create([UserAnswersHolder(survey=survey, user_ID=i) for i in range(10000)])
+        answer = "x" * 100
+        UserAnswer.objects.bulk_create([UserAnswer(user_answers_holder_id=holder_id, question=question, answer=answer)
+                                        for holder_id in UserAnswersHolder.objects.values_list("id", flat=True)
+                                        for question in questions])
+        self.assertEqual(UserAnswer.objects.count(), 100000)
+
+        for export_format in ("csv", "ndjson"):
+            size = 0
+            rows = 0
+            tracemalloc.start()
+            for line in export_responses(survey.id, export_format, chunk_size=250):
+                size += len(line)
+                rows += 1
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.assertEqual(rows, 10000 + (export_format == "csv"))
+            self.assertGreater(size, 5 * peak)
+            self.assertLess(peak, 2 * 1024 * 1024)
+
+    def test_export_command(self):
+        survey = create_survey(questions_count=1)
+        complete_survey(survey, user_id=3)
+        output = io.StringIO()
+        call_command("export_responses", str(survey.id), "--format", "ndjson", stdout=output)
+        self.assertEqual(json.loads(output.getvalue())["user_ID"], 3)
+
+
+class CompressionTest(SurveyTestCase):
+    def test_survey_is_served_precompressed(self):
+        survey = create_survey(questions_count=10)
+        path = "/api/surveys/{}".format(survey.id)
+        plain = self.client.get(path)
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertGreater(len(plain.content), 1024)
+
+        response = self.client.get(path, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertNotEqual(response["ETag"], plain["ETag"])
+
+        with mock.patch("surveyAPI.compression.compress") as compress:
+            with CaptureQueriesContext(connection) as context:
+                cached = self.client.get(path, HTTP_ACCEPT_ENCODING="gzip")
+                not_modified = self.client.get(path, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=response["ETag"])
+            compress.assert_not_called()
+        self.assertEqual(len(context.captured_queries), 2)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_small_survey_is_not_compressed(self):
+        survey = create_survey(questions_count=1, choices_count=1)
+        response = self.client.get("/api/surveys/{}".format(survey.id), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(json.loads(response.content)["survey"]["id"], survey.id)
+
+    def test_survey_list_pages_are_compressed(self):
+        for _ in range(3):
+            create_survey(questions_count=5)
+        for params in ({}, {"limit": 1}):
+            plain = self.client.get("/api/surveys/", params)
+            response = self.client.get("/api/surveys/", params, HTTP_ACCEPT_ENCODING="gzip")
+            self.assertEqual(response["Content-Encoding"], "gzip")
+            self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(self.client.get("/api/surveys/", {"limit": 0}, HTTP_ACCEPT_ENCODING="gzip").status_code, 400)
+
+    def test_middleware_compresses_large_responses(self):
+        survey = create_survey(questions_count=10)
+        for _ in range(20):
+            complete_survey(survey, user_id=1)
+        self.client.force_authenticate(User.objects.create_user("admin", password="password", is_staff=True))
+
+        response = self.client.get("/api/completed-surveys/1", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))["completed_surveys"]), 20)
+        response = self.client.get("/api/completed-surveys/1", HTTP_ACCEPT_ENCODING="gzip;q=0, identity")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+        response = self.client.get("/api/admin/surveys/{}/export".format(survey.id), {"type": "ndjson"},
+                                   HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        lines = gzip.decompress(b"".join(response.streaming_content)).splitlines()
+        self.assertEqual(len(lines), 20)
+
+    def test_negotiation(self):
+        factory = RequestFactory()
+        self.assertEqual(negotiate(factory.get("/", HTTP_ACCEPT_ENCODING="deflate, GZIP")), "gzip")
+        self.assertEqual(negotiate(factory.get("/", HTTP_ACCEPT_ENCODING="*;q=0.5")), negotiate(
+            factory.get("/", HTTP_ACCEPT_ENCODING="br, gzip")))
+        self.assertEqual(negotiate(factory.get("/", HTTP_ACCEPT_ENCODING="gzip;q=0")), "identity")
+        self.assertEqual(negotiate(factory.get("/")), "identity")
+
+    @override_settings(SURVEY_COMPRESSION={"ENABLED": False})
+    def test_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            CompressionMiddleware(lambda request: None)
+        survey = create_survey(questions_count=10)
+        response = APIClient().get("/api/surveys/{}".format(survey.id), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+
+ROUTING = {"REPLICAS": ["replica1", "replica2"], "READ_YOUR_WRITES": 5}
+
+
+@override_settings(SURVEY_DATABASE_ROUTING=ROUTING)
+class ReplicaRouterTest(SurveyTestCase):
+    def setUp(self):
+        super().setUp()
+        routing.local_pins.clear()
+        self.router = routing.ReplicaRouter()
+
+    def read(self):
+        return self.router.db_for_read(Survey)
+
+    def test_reads_are_balanced_only_inside_read_from_replicas(self):
+        self.assertIsNone(self.read())
+        with routing.read_from_replicas():
+            self.assertEqual({self.read(), self.read()}, {"replica1", "replica2"})
+            with routing.read_from_primary():
+                self.assertIsNone(self.read())
+            self.assertIn(self.read(), ROUTING["REPLICAS"])
+            self.assertIn(self.router.db_for_write(Survey), (None, "default"))
+            survey = Survey(title="Survey")
+            survey._state.db = "replica1"
+            self.assertEqual(self.router.db_for_write(Survey, instance=survey), "default")
+        self.assertIsNone(self.read())
+
+    def test_read_your_writes(self):
+        routing.pin(routing.user_pin(1))
+        with routing.read_from_replicas():
+            with routing.read_your_writes(routing.user_pin(1)):
+                self.assertIsNone(self.read())
+            with routing.read_your_writes(routing.user_pin(2)):
+                self.assertIsNotNone(self.read())
+
+        with mock.patch("surveyAPI.routing.time.monotonic", return_value=time.monotonic() + 6):
+            self.assertFalse(routing.is_pinned(routing.user_pin(1)))
+
+    def test_survey_change_pins_all_reads(self):
+        survey = create_survey(questions_count=1)
+        with routing.read_from_replicas():
+            self.assertIsNotNone(self.read())
+        self.client.force_authenticate(User.objects.create_user("admin", password="password", is_staff=True))
+        self.client.put("/api/admin/surveys/{}".format(survey.id), {"survey": {"title": "New"}}, format="json")
+        with routing.read_from_replicas():
+            self.assertIsNone(self.read())
+
+    def test_middleware(self):
+        used = []
+        middleware = routing.ReplicaMiddleware(lambda request: used.append(self.read()))
+        middleware(RequestFactory().get("/api/surveys/"))
+        middleware(RequestFactory().post("/api/surveys/1"))
+        self.assertIn(used[0], ROUTING["REPLICAS"])
+        self.assertIsNone(used[1])
+        with override_settings(SURVEY_DATABASE_ROUTING={"REPLICAS": []}):
+            with self.assertRaises(MiddlewareNotUsed):
+                routing.ReplicaMiddleware(lambda request: None)
+
+
+@override_settings(SURVEY_DATABASE_ROUTING={"REPLICAS": ["replica"], "READ_YOUR_WRITES": 5})
+@skipUnless("replica" in connections.databases, "needs a 'replica' database alias (see benchmarks/settings.py)")
+class ReplicaRoutingTest(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        cache.clear()
+        routing.local_pins.clear()
+        self.client = APIClient()
+
+    def queries(self, method, *args, **kwargs):
+        """
+        :return: пара (ответ, словарь alias базы данных -> количество запросов к ней)
+        """
+        with CaptureQueriesContext(connections["default"]) as default:
+            with CaptureQueriesContext(connections["replica"]) as replica:
+                response = getattr(self.client, method)(*args, **kwargs)
+        return response, {"default": len(default.captured_queries), "replica": len(replica.captured_queries)}
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        survey = create_survey(questions_count=1)
+        response, queries = self.queries("get", "/api/surveys/{}".format(survey.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries["default"], 0)
+        self.assertGreater(queries["replica"], 0)
+
+        response, queries = self.queries("post", "/api/surveys/{}".format(survey.id),
+                                         answers_payload(survey, user_id=1), format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(queries["replica"], 0)
+
+        response, queries = self.queries("get", "/api/completed-surveys/1")
+        self.assertEqual(len(response.data["completed_surveys"]), 1)
+        self.assertEqual(queries["replica"], 0)
+        response, queries = self.queries("get", "/api/completed-surveys/2")
+        self.assertEqual(queries["default"], 0)
+
+
+SHARDS = ["shard1", "shard2"]
+
+
+@override_settings(SURVEY_SHARDING={"SHARDS": SHARDS, "WORKERS": None})
+@skipUnless(set(SHARDS) <= set(connections.databases), "needs shard database aliases (see benchmarks/settings.py)")
+class ShardingTest(TransactionTestCase):
+    databases = {"default", *SHARDS}
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.survey = create_survey(questions_count=1)
+        self.user_ids = [user_id for user_id in range(1, 20)]
+        for user_id in self.user_ids:
+            response = self.client.post("/api/surveys/{}".format(self.survey.id),
+                                        answers_payload(self.survey, user_id=user_id), format="json")
+            self.assertEqual(response.status_code, 201)
+
+    def holders(self, alias):
+        return set(UserAnswersHolder.objects.using(alias).values_list("user_ID", flat=True))
+
+    def test_completions_are_stored_in_the_shard_of_their_user(self):
+        self.assertEqual({shard_for(user_id) for user_id in self.user_ids}, set(SHARDS))
+        self.assertEqual(shard_for(self.user_ids[0]), shard_for(self.user_ids[0]))
+        for alias in SHARDS:
+            self.assertEqual(self.holders(alias), {user_id for user_id in self.user_ids if shard_for(user_id) == alias})
+            self.assertEqual(UserAnswer.objects.using(alias).count(), 4 * len(self.holders(alias)))
+        self.assertFalse(UserAnswersHolder.objects.using("default").exists())
+
+    def test_completed_surveys_are_read_from_one_shard(self):
+        user_id = self.user_ids[0]
+        other = [alias for alias in SHARDS if alias != shard_for(user_id)][0]
+        with CaptureQueriesContext(connections[other]) as context:
+            completed = self.client.get("/api/completed-surveys/{}".format(user_id)).data["completed_surveys"]
+            self.assertEqual(len(completed), 1)
+            self.assertEqual(len(completed[0]["answers"]), 4)
+            response = self.client.get("/api/completed-surveys/{}/{}".format(user_id, completed[0]["id"]))
+            self.assertEqual(response.data["completed_survey"]["user_ID"], user_id)
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_aggregations_fan_out_across_shards(self):
+        respondents, question_counts, _ = count_survey_answers(self.survey.id)
+        self.assertEqual(respondents, len(self.user_ids))
+        self.assertEqual(set(question_counts.values()), {len(self.user_ids)})
+        rebuild_counters(self.survey.id)
+        self.assertEqual(SurveyCounter.objects.get(pk=self.survey.id).count, len(self.user_ids))
+
+        lines = list(export_responses(self.survey.id, "ndjson"))
+        self.assertEqual(sorted(json.loads(line)["user_ID"] for line in lines), self.user_ids)
+        self.assertEqual(fan_out(lambda alias: alias), SHARDS)
+
+    def test_deleted_survey_completions_are_removed_from_all_shards(self):
+        question = self.survey.questions.filter(question_type="PT").first()
+        question.delete()
+        for alias in SHARDS:
+            self.assertFalse(UserAnswer.objects.using(alias).filter(question_id=question.id).exists())
+        self.survey.delete()
+        for alias in SHARDS:
+            self.assertFalse(UserAnswersHolder.objects.using(alias).exists())
+            self.assertFalse(UserAnswer.objects.using(alias).exists())
+
+    def test_bulk_insert_ids_are_checked_on_write_database(self):
+        with mock.patch("surveyAPI.reconciliation.router.db_for_write", return_value=SHARDS[0]) as db_for_write, \
+                mock.patch.object(connections[SHARDS[0]].features, "can_return_ids_from_bulk_insert", True), \
+                mock.patch.object(connections["default"].features, "can_return_ids_from_bulk_insert", False):
+            self.assertTrue(can_return_ids(UserAnswersHolder))
+        db_for_write.assert_called_once_with(UserAnswersHolder)
+
+    def test_generated_completions_are_sharded(self):
+        structure = generate(surveys_count=2, questions_count=3, choices_count=2, completions_count=50, users_count=10)
+        holders = [UserAnswersHolder.objects.using(alias).filter(survey_id__in=structure) for alias in SHARDS]
+        self.assertEqual(sum(len(shard_holders) for shard_holders in holders), 50)
+        for alias, shard_holders in zip(SHARDS, holders):
+            self.assertTrue(all(shard_for(holder.user_ID) == alias for holder in shard_holders))
+
+
+class ASGIHandlerTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.survey = create_survey(questions_count=1)
+        self.wsgi = mock.Mock(wraps=get_wsgi_application())
+        self.application = ASGIHandler(self.wsgi, workers=2)
+        self.addCleanup(self.application.executor.shutdown)
+
+    def request(self, method, path, body=b"", **headers):
+        """
+        :return: тройка (статус, словарь заголовков, тело), тело собирается из всех сообщений ответа
+        """
+        path, _, query = path.partition("?")
+        scope = {"type": "http", "method": method, "path": path, "query_string": query.encode(),
+                 "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]}
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": body}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(self.application(scope, receive, send))
+        headers = {name.decode(): value.decode() for name, value in messages[0]["headers"]}
+        return messages[0]["status"], headers, b"".join(message.get("body", b"") for message in messages[1:])
+
+    def test_cached_responses_are_served_without_wsgi(self):
+        path = "/api/surveys/{}".format(self.survey.id)
+        for current in (path, "/api/surveys/?limit=1"):
+            first = self.request("GET", current, accept_encoding="gzip")
+            self.assertEqual(first[0], 200)
+            calls = self.wsgi.call_count
+            self.assertEqual(self.request("GET", current, accept_encoding="gzip"), first)
+            self.assertEqual(self.wsgi.call_count, calls)
+
+        status, headers, body = self.request("GET", path, if_none_match=first[1]["etag"])
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)["survey"]["id"], self.survey.id)
+        calls = self.wsgi.call_count
+        status, headers, body = self.request("GET", path, if_none_match=headers["etag"])
+        self.assertEqual((status, body, self.wsgi.call_count), (304, b"", calls))
+        status, _, body = self.request("HEAD", path)
+        self.assertEqual((status, body, self.wsgi.call_count), (200, b"", calls))
+
+        touch_survey(self.survey.id)
+        with override_settings(SURVEY_ASGI={"VERSION_TTL": 0}):
+            self.request("GET", path)
+        self.assertEqual(self.wsgi.call_count, calls + 1)
+        self.request("GET", path + "?format=api", accept="text/html")
+        self.request("GET", path, authorization="Token unknown")
+        self.assertEqual(self.wsgi.call_count, calls + 3)
+
+    def test_versions_are_checked_once_per_ttl(self):
+        path = "/api/surveys/{}".format(self.survey.id)
+        with mock.patch("surveyAPI.asgi.data_version", wraps=data_version) as checked:
+            with override_settings(SURVEY_ASGI={"VERSION_TTL": 60}):
+                first = self.request("GET", path)
+                checks, calls = checked.call_count, self.wsgi.call_count
+                touch_survey(self.survey.id)
+                for _ in range(3):
+                    self.assertEqual(self.request("GET", path), first)
+                self.assertEqual((checked.call_count, self.wsgi.call_count), (checks, calls))
+
+            with override_settings(SURVEY_ASGI={"VERSION_TTL": 0}):
+                self.assertEqual(self.request("GET", path)[0], 200)
+                self.assertEqual((checked.call_count, self.wsgi.call_count), (checks + 1, calls + 1))
+
+    def test_other_requests_run_in_wsgi_application(self):
+        status, _, body = self.request("POST", "/api/surveys/{}".format(self.survey.id),
+                                       json.dumps(answers_payload(self.survey, user_id=7)).encode(),
+                                       content_type="application/json")
+        self.assertEqual(status, 201, body)
+        status, _, body = self.request("GET", "/api/completed-surveys/7")
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)["completed_surveys"][0]["survey"], self.survey.id)
+
+        user = User.objects.create_user("admin", password="password", is_staff=True)
+        token = Token.objects.create(user=user)
+        status, headers, body = self.request("GET", "/api/admin/surveys/{}/export?type=ndjson".format(self.survey.id),
+                                             authorization="Token " + token.key)
+        self.assertEqual((status, headers["content-type"]), (200, "application/x-ndjson"))
+        self.assertEqual(json.loads(body)["user_ID"], 7)
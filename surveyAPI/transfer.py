@@ -0,0 +1,167 @@
+from django.db import transaction
+
+from .models import Survey, Question, QuestionAnswer
+from .queries import with_questions
+from .reconciliation import can_return_ids, create_all
+from .serializers import SurveySerializer
+from .versions import touch_survey
+
+from itertools import islice
+import json
+import time
+
+EXPORTED_SURVEY_FIELDS = ("title", "end_date", "description")
+
+
+def parse_lines(lines):
+    """
+    Разбирает JSONL: строка на опрос в формате Examples/create_survey.json ({"survey": {...}}).
+    Пустые строки пропускаются
+    :param lines: итерируемый объект строк (str или bytes)
+    :return: генератор пар (номер строки, данные опроса или None, если строка не является JSON-объектом)
+    """
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            data = None
+        yield number, data if data is None else data.get("survey", None)
+
+
+def create_children(objects, parent):
+    """
+    Сохраняет новые объекты одной модели, ссылающиеся на только что созданные родительские объекты, так,
+    чтобы у них появились id. Если база данных не возвращает id вставленных строк (см. create_all),
+    объекты вставляются одним bulk insert, а id читаются одним запросом: у объектов одного родителя
+    они возрастают в порядке вставки
+    :param objects: список несохраненных объектов одной модели, сгруппированный по родителям
+    :param parent: имя внешнего ключа на родителя
+    """
+    if not objects or can_return_ids(type(objects[0])):
+        create_all(objects)
+        return
+    model = type(objects[0])
+    model.objects.bulk_create(objects)
+    column = model._meta.get_field(parent).attname
+    ids = model.objects.all().filter(**{column + "__in": {getattr(obj, column) for obj in objects}})\
+        .order_by(column, "id").values_list("id", flat=True)
+    for obj, pk in zip(sorted(objects, key=lambda obj: getattr(obj, column)), ids):
+        obj.id = pk
+
+
+def create_surveys(surveys_data):
+    """
+    Создает опросы вместе с вопросами и вариантами ответа: вопросы и варианты ответа вставляются
+    одним запросом на модель (см. create_children), а не по одному, как в SurveySerializer.create.
+    Id вариантов ответа не нужны, поэтому они вставляются без чтения id
+    :param surveys_data: список проверенных SurveySerializer данных опросов
+    :return: список созданных объектов типа Survey
+    """
+    surveys = [Survey(**{field: data[field] for field in EXPORTED_SURVEY_FIELDS if field in data})
+               for data in surveys_data]
+    create_all(surveys)
+    questions = []
+    questions_data = []
+    for survey, data in zip(surveys, surveys_data):
+        for question_data in data["questions"]:
+            questions.append(Question(survey=survey, text=question_data["text"],
+                                      question_type=question_data["question_type"]))
+            questions_data.append(question_data)
+    create_children(questions, "survey")
+    question_answers = []
+    for question, question_data in zip(questions, questions_data):
+        if question.question_type != "PT":
+            for question_answer_data in question_data["question_answers"]:
+                question_answers.append(QuestionAnswer(question=question, text=question_answer_data["text"]))
+    QuestionAnswer.objects.bulk_create(question_answers)
+    return surveys
+
+
+def import_chunk(chunk):
+    """
+    Проверяет порцию опросов и сохраняет корректные одной транзакцией
+    :param chunk: список пар (номер строки, данные опроса)
+    :return: пара (количество созданных опросов, список ошибок {"line", "errors"})
+    """
+    valid = []
+    failed = []
+    for number, data in chunk:
+        if data is None:
+            failed.append({"line": number, "errors": ["Incorrect data!"]})
+            continue
+        serializer = SurveySerializer(data=data)
+        if serializer.is_valid():
+            valid.append(serializer.validated_data)
+        else:
+            failed.append({"line": number, "errors": serializer.errors})
+    if valid:
+        with transaction.atomic():
+            create_surveys(valid)
+        touch_survey(None)
+    return len(valid), failed
+
+
+def import_surveys(lines, chunk_size=100, progress=None):
+    """
+    Импортирует опросы из JSONL, читая его потоком: опросы проверяются и сохраняются порциями по chunk_size,
+    каждая порция в своей транзакции. Некорректные строки пропускаются и перечисляются в отчете
+    :param lines: итерируемый объект строк (например, открытый файл)
+    :param chunk_size: количество опросов в порции
+    :param progress: функция, вызываемая после каждой порции с количеством созданных опросов, или None
+    :return: отчет {"imported", "failed", "elapsed", "surveys_per_second"}
+    """
+    start = time.perf_counter()
+    imported = 0
+    failed = []
+    items = parse_lines(lines)
+    while True:
+        chunk = list(islice(items, chunk_size))
+        if not chunk:
+            break
+        created, errors = import_chunk(chunk)
+        imported += created
+        failed += errors
+        if progress is not None:
+            progress(imported)
+    elapsed = time.perf_counter() - start
+    return {"imported": imported, "failed": failed, "elapsed": round(elapsed, 3),
+            "surveys_per_second": round(imported / elapsed, 1) if elapsed else 0}
+
+
+def survey_line(survey):
+    """
+    :param survey: объект типа Survey с загруженными вопросами и вариантами ответа
+    :return: строка JSONL в формате Examples/create_survey.json, которую принимает import_surveys
+    """
+    data = {field: getattr(survey, field) for field in EXPORTED_SURVEY_FIELDS}
+    data["end_date"] = data["end_date"].isoformat()
+    data["questions"] = [{"text": question.text, "question_type": question.question_type,
+                          "question_answers": [{"text": question_answer.text}
+                                               for question_answer in question.question_answers.all()]}
+                         for question in survey.questions.all()]
+    return json.dumps({"survey": data}, ensure_ascii=False) + "\n"
+
+
+def export_surveys(surveys=None, chunk_size=100):
+    """
+    Выгружает опросы в JSONL потоком: опросы читаются порциями по id, память не зависит от количества опросов
+    :param surveys: QuerySet объектов типа Survey. Если None, все опросы
+    :param chunk_size: количество опросов, читаемых за раз (вместе с вопросами и вариантами ответа)
+    :return: генератор строк JSONL
+    """
+    if surveys is None:
+        surveys = Survey.objects.all()
+    last_id = 0
+    while True:
+        chunk = list(with_questions(surveys.filter(id__gt=last_id).order_by("id"))[:chunk_size])
+        for survey in chunk:
+            yield survey_line(survey)
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1].id
@@ -1,10 +1,12 @@
 from django.urls import path
 
-from .views import SurveyView, CompletedSurveyView
+from .views import SurveyView, CompletedSurveyView, PendingCompletionView
 
 urlpatterns = [
     path("surveys/", SurveyView.as_view({"get": "list"})),
+    path("surveys/completions", SurveyView.as_view({"post": "complete_surveys"})),
     path("surveys/<int:pk>", SurveyView.as_view({"get": "retrieve", "post": "complete_survey"})),
     path("completed-surveys/<int:user_id>",  CompletedSurveyView.as_view({"get": "list"})),
     path("completed-surveys/<int:user_id>/<int:pk>",  CompletedSurveyView.as_view({"get": "retrieve"})),
+    path("completions/<uuid:receipt>", PendingCompletionView.as_view({"get": "retrieve"})),
 ]
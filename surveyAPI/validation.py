@@ -0,0 +1,109 @@
+from . import cache
+from .models import Question
+from .versions import get_survey_versions
+
+
+class SurveyValidationIndex:
+    """
+    Индекс для проверки ответов на опрос без обращений к базе данных.
+    Хранит для каждого вопроса его тип и допустимые варианты ответа (текст -> id варианта)
+    """
+    def __init__(self, questions):
+        """
+        :param questions: словарь id вопроса -> (тип вопроса, словарь текст варианта -> id варианта),
+            упорядоченный так же, как вопросы в опросе
+        """
+        self.questions = questions
+        self.positions = {question_id: position for position, question_id in enumerate(questions)}
+
+    @classmethod
+    def load(cls, survey_id):
+        """
+        Строит индекс одним запросом к базе данных
+        :param survey_id: id опроса
+        :return: объект типа SurveyValidationIndex
+        """
+        rows = Question.objects.all().filter(survey_id=survey_id).order_by("id", "question_answers__id")\
+            .values_list("id", "question_type", "question_answers__id", "question_answers__text")
+        questions = {}
+        for question_id, question_type, choice_id, choice_text in rows:
+            question_type, choices = questions.setdefault(question_id, (question_type, {}))
+            if choice_id is not None and question_type != "PT":
+                choices.setdefault(choice_text, choice_id)
+        return cls(questions)
+
+    @classmethod
+    def from_payload(cls, payload):
+        """
+        Строит индекс по сериализованному опросу без обращений к базе данных
+        :param payload: сериализованный опрос (см. representations.survey_representation)
+        :return: объект типа SurveyValidationIndex
+        """
+        questions = {}
+        for question in sorted(payload["questions"], key=lambda question: question["id"]):
+            choices = {}
+            if question["question_type"] != "PT":
+                for choice in sorted(question["question_answers"], key=lambda choice: choice["id"]):
+                    choices.setdefault(choice["text"], choice["id"])
+            questions[question["id"]] = (question["question_type"], choices)
+        return cls(questions)
+
+    def check_answers(self, given_answers):
+        """
+        Проверяет, что даны ответы на все вопросы опроса и что ответы на вопросы с выбором
+        совпадают с одним из вариантов ответа
+        :raises: AttributeError, если не на все вопросы даны ответы
+        :raises: ValueError, если ответ на вопрос с выбором некорректен или вопрос не относится к опросу
+        :param given_answers: список словарей с ключами question (id вопроса) и answer
+        """
+        answered = set()
+        for given_answer in given_answers:
+            answered.add(given_answer["question"])
+        if any(question_id not in answered for question_id in self.questions):
+            raise AttributeError("All questions should be completed!")
+
+        for given_answer in given_answers:
+            question = self.questions.get(given_answer["question"])
+            if question is None:
+                raise ValueError("Answers should be given only to questions of this survey!")
+            question_type, choices = question
+            if question_type != "PT" and given_answer["answer"] not in choices:
+                raise ValueError("Choice questions should be chosen correctly!")
+
+    def build_answers(self, given_answers):
+        """
+        Отбирает ответы для сохранения: по одному на вопросы типов PT и SC
+        и по одному на каждый различный вариант для вопросов типа MC.
+        Ответы упорядочиваются по вопросам опроса
+        :param given_answers: проверенный через check_answers список ответов
+        :return: список троек (id вопроса, ответ, id выбранного варианта или None для вопросов типа PT)
+        """
+        seen = set()
+        answers = []
+        for given_answer in given_answers:
+            question_id = given_answer["question"]
+            question_type, choices = self.questions[question_id]
+            if question_type == "MC":
+                key = (question_id, given_answer["answer"])
+            else:
+                key = question_id
+            if key in seen:
+                continue
+            seen.add(key)
+            answers.append((question_id, given_answer["answer"], choices.get(given_answer["answer"])))
+        answers.sort(key=lambda answer: self.positions[answer[0]])
+        return answers
+
+
+def get_validation_index(survey_id):
+    """
+    Возвращает индекс для проверки ответов на опрос, используя кэш. Ключ включает version опроса
+    из базы данных, поэтому изменения вариантов ответа в любом процессе сразу учитываются при проверке
+    :param survey_id: id опроса
+    :return: объект типа SurveyValidationIndex
+    """
+    versions = get_survey_versions([survey_id])
+    if survey_id not in versions:
+        return SurveyValidationIndex.load(survey_id)
+    key = "survey:{}:{}:validation".format(survey_id, versions[survey_id][0])
+    return cache.get_or_render(key, lambda: SurveyValidationIndex.load(survey_id))
@@ -0,0 +1,80 @@
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .models import Survey
+from .queries import active_surveys
+from .routing import SURVEYS_PIN, pin
+
+import hashlib
+
+
+def touch_survey(survey_id):
+    """
+    Отмечает изменение опроса: увеличивает его version и обновляет updated_at. Ключи кэша строятся по version
+    из базы данных (см. get_survey_versions), поэтому закэшированные данные устаревают во всех процессах.
+    На время READ_YOUR_WRITES чтения опросов идут в основную базу данных, чтобы в кэш не попали данные реплики
+    Должна вызываться после любого изменения опроса, его вопросов или вариантов ответа
+    :param survey_id: id измененного опроса или None, если изменился только набор опросов
+    """
+    if survey_id is not None:
+        Survey.objects.all().filter(pk=survey_id).update(version=F("version") + 1, updated_at=timezone.now())
+    pin(SURVEYS_PIN)
+
+
+def get_survey_versions(survey_ids):
+    """
+    Читает версии опросов одним запросом по первичному ключу
+    :param survey_ids: список id опросов
+    :return: словарь id опроса -> (version, updated_at) (без не найденных опросов)
+    """
+    return {survey_id: (version, updated_at) for survey_id, version, updated_at
+            in Survey.objects.all().filter(pk__in=survey_ids).values_list("id", "version", "updated_at")}
+
+
+def get_list_version():
+    """
+    :return: версия набора актуальных опросов (см. combine_versions), прочитанная из базы данных одним запросом
+    """
+    return combine_versions(list(active_surveys().values_list("id", "version")))
+
+
+def combine_versions(versions):
+    """
+    :param versions: список пар (id опроса, version)
+    :return: версия набора опросов, меняющаяся при изменении, добавлении или удалении любого из них
+    """
+    return hashlib.sha1(",".join("{}:{}".format(*pair) for pair in sorted(versions)).encode()).hexdigest()
+
+
+def survey_etag(request, survey_id, version):
+    return '"survey-{}-{}-{}"'.format(survey_id, version, request.accepted_renderer.format)
+
+
+def surveys_page_etag(request, list_version):
+    page = "{}:{}:{}".format(list_version, request.query_params.get("limit", ""),
+                             request.query_params.get("cursor", ""))
+    return '"surveys-{}-{}"'.format(hashlib.sha1(page.encode()).hexdigest(), request.accepted_renderer.format)
+
+
+def conditional_response(request, etag, last_modified=None):
+    """
+    Проверяет условные заголовки запроса (If-None-Match, If-Modified-Since)
+    :param request: запрос
+    :param etag: ETag текущей версии ресурса
+    :param last_modified: время последнего изменения ресурса или None
+    :return: ответ 304 с заголовками ETag и Last-Modified или None, если ресурс нужно отдать
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    return response
@@ -2,11 +2,21 @@ from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework.generics import get_object_or_404
 from rest_framework.status import HTTP_400_BAD_REQUEST
+from django.conf import settings
+from django.http import Http404
 
-from .models import Survey, UserAnswersHolder
-from .serializers import SurveySerializer, UserAnswersHolderCreationSerializer, UserAnswersHolderSerializer
-
-from datetime import datetime
+from .completion import complete_surveys
+from .compression import cached_response
+from .ingestion import enqueue_completion
+from .models import PendingCompletion
+from .pagination import paginate_queryset, paginate_payloads
+from .payloads import get_survey_entry, get_active_surveys_entry
+from .queries import active_surveys, completed_surveys
+from .representations import represent_completed_surveys
+from .routing import read_from_primary, read_your_writes, user_pin
+from .serializers import UserAnswersHolderCreationSerializer, PendingCompletionSerializer
+from .snapshots import get_completion_context, get_completed_survey_payloads, get_completed_survey, resolve_holders
+from .versions import survey_etag, surveys_page_etag, conditional_response, set_validators
 
 
 class SurveyView(ViewSet):
@@ -16,43 +26,74 @@ class SurveyView(ViewSet):
     @staticmethod
     def list(request):
         """
-        Сериализует список всех объектов типа Survey
+        Сериализует страницу списка актуальных объектов типа Survey, упорядоченного по id.
+        Параметры запроса: limit - размер страницы, cursor - значение next из предыдущей страницы.
+        ETag страницы строится по версиям всех актуальных опросов, поэтому на запрос с совпадающим
+        If-None-Match отвечает 304. Last-Modified не отдается: удаление или истечение опроса его бы не изменили.
+        Клиенту, принимающему сжатие, страница отдается уже сжатой из кэша (см. compression.cached_response)
         :param request: запрос
-        :return: ответ на запрос, содержащий сериализованный список объектов
+        :return: ответ на запрос, содержащий сериализованный список объектов и курсор следующей страницы
         """
-        surveys = Survey.objects.all().filter(end_date__gte=datetime.now().date())
-        serializer = SurveySerializer(surveys, many=True)
-        return Response({"surveys": serializer.data})
+        payloads, list_version = get_active_surveys_entry()
+        etag = surveys_page_etag(request, list_version)
+
+        def render():
+            surveys, next_cursor = paginate_payloads(payloads, request)
+            return {"surveys": surveys, "next": next_cursor}
+
+        response = cached_response(request, etag, render)
+        if response is not None:
+            return response
+        not_modified = conditional_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+        return set_validators(Response(render()), etag)
 
     @staticmethod
     def retrieve(request, pk):
         """
-        Сериализует объект типа Survey с id равным pk.
+        Сериализует объект типа Survey с id равным pk. ETag и Last-Modified строятся по version
+        и updated_at опроса, на условный запрос с неизменившимся опросом отвечает 304.
+        Клиенту, принимающему сжатие, опрос отдается уже сжатым из кэша (см. compression.cached_response)
+        :raises: HTTP 404 error, если не найден актуальный опрос
         :param request: запрос
         :param pk: id необходимого объекта
         :return: ответ на запрос, содержащий сериализованный объект
         """
-        surveys = Survey.objects.all().filter(end_date__gte=datetime.now().date())
-        survey = get_object_or_404(surveys, pk=pk)
-        serializer = SurveySerializer(instance=survey)
-        return Response({"survey": serializer.data})
+        entry = get_survey_entry(pk)
+        if entry is None:
+            raise Http404
+        _, survey, version, updated_at = entry
+        etag = survey_etag(request, pk, version)
+        response = cached_response(request, etag, lambda: {"survey": survey}, updated_at)
+        if response is not None:
+            return response
+        not_modified = conditional_response(request, etag, updated_at)
+        if not_modified is not None:
+            return not_modified
+        return set_validators(Response({"survey": survey}), etag, updated_at)
 
     @staticmethod
     def complete_survey(request, pk):
         """
-        Метод прохождения опроса
+        Метод прохождения опроса. Если включен асинхронный режим (SURVEY_ASYNC_COMPLETION),
+        проверенные ответы ставятся в очередь на запись, а в ответе возвращается квитанция
+        для проверки статуса записи
         :param request: запрос
         :param pk: id необходимого опроса
         :return: ответ на запрос, содержащий информацию о ходе выполнения действия
         """
-        surveys = Survey.objects.all().filter(end_date__gte=datetime.now().date())
-        survey = get_object_or_404(surveys, pk=pk)
+        survey = get_object_or_404(active_surveys(), pk=pk)
         data = request.data.get("user_answers", {})
         data["survey"] = survey.id
         serializer = UserAnswersHolderCreationSerializer(data=data)
         if serializer.is_valid(raise_exception=True):
             try:
-                serializer.save()
+                if settings.SURVEY_ASYNC_COMPLETION:
+                    pending_completion = enqueue_completion(serializer.validated_data)
+                    return Response({"receipt": str(pending_completion.receipt)}, status=202)
+                validation_index, snapshot_hash = get_completion_context(survey.id)
+                serializer.save(validation_index=validation_index, snapshot_hash=snapshot_hash)
             except AttributeError as e:
                 return Response({(str(e))}, status=HTTP_400_BAD_REQUEST)
             except ValueError as e:
@@ -60,17 +101,75 @@ class SurveyView(ViewSet):
             return Response({"Your answer was saved"}, status=201)
         return Response({"Incorrect data!"}, status=HTTP_400_BAD_REQUEST)
 
+    @staticmethod
+    def complete_surveys(request):
+        """
+        Метод пакетного прохождения опросов. Принимает список user_answers (каждый с указанием survey),
+        проверяет их и сохраняет корректные
+        :param request: запрос
+        :return: ответ на запрос, содержащий результат для каждого элемента пакета в порядке их следования
+        """
+        items = request.data.get("user_answers", None)
+        if not isinstance(items, list):
+            return Response({"Incorrect data!"}, status=HTTP_400_BAD_REQUEST)
+        if len(items) > settings.SURVEY_BATCH_MAX_SIZE:
+            return Response({"Batch should contain at most {} items!".format(settings.SURVEY_BATCH_MAX_SIZE)},
+                            status=HTTP_400_BAD_REQUEST)
+        return Response({"results": complete_surveys(items)})
+
 
 class CompletedSurveyView(ViewSet):
     @staticmethod
     def list(request, user_id):
-        completed_surveys = UserAnswersHolder.objects.all().filter(user_ID=user_id)
-        serializer = UserAnswersHolderSerializer(completed_surveys, many=True)
-        return Response({"completed_surveys": serializer.data})
+        """
+        Сериализует страницу списка пройденных пользователем опросов, упорядоченного по id.
+        Опросы представлены своими id, параметр expand=survey заменяет их опросами в том виде,
+        в котором они были пройдены (см. get_completed_survey_payloads).
+        Параметры запроса: limit - размер страницы, cursor - значение next из предыдущей страницы.
+        Недавно проходивший опросы пользователь читает их из основной базы данных (см. routing.read_your_writes)
+        :param request: запрос
+        :param user_id: id пользователя
+        :return: ответ на запрос, содержащий сериализованный список объектов и курсор следующей страницы
+        """
+        with read_your_writes(user_pin(user_id)):
+            holders, next_cursor = paginate_queryset(completed_surveys(user_id), request)
+            resolve_holders(holders)
+            data = represent_completed_surveys(holders)
+            if "survey" in request.query_params.get("expand", "").split(","):
+                surveys = get_completed_survey_payloads([(holder.survey_id, holder.snapshot_id) for holder in holders])
+                for completed_survey, survey in zip(data, surveys):
+                    completed_survey["survey"] = survey
+        return Response({"completed_surveys": data, "next": next_cursor})
 
     @staticmethod
     def retrieve(request, user_id, pk):
-        completed_surveys = UserAnswersHolder.objects.all().filter(user_ID=user_id)
-        completed_survey = get_object_or_404(completed_surveys, pk=pk)
-        serializer = UserAnswersHolderSerializer(instance=completed_survey)
-        return Response({"completed_survey": serializer.data})
+        """
+        Сериализует пройденный пользователем опрос вместе с ответами. Опрос берется из снимка,
+        сохраненного при прохождении, поэтому последующие изменения опроса не влияют на ответ
+        :raises: HTTP 404 error, если прохождение не найдено
+        :param request: запрос
+        :param user_id: id пользователя
+        :param pk: id прохождения
+        :return: ответ на запрос, содержащий сериализованный объект
+        """
+        with read_your_writes(user_pin(user_id)):
+            completed_survey = get_completed_survey(user_id, pk)
+        if completed_survey is None:
+            raise Http404
+        return Response({"completed_survey": completed_survey})
+
+
+class PendingCompletionView(ViewSet):
+    @staticmethod
+    def retrieve(request, receipt):
+        """
+        Возвращает статус записи прохождения опроса, принятого в асинхронном режиме.
+        Статус читается из основной базы данных, так как реплика может еще не знать о квитанции
+        :param request: запрос
+        :param receipt: квитанция, выданная при прохождении опроса
+        :return: ответ на запрос, содержащий статус и id сохраненного прохождения
+        """
+        with read_from_primary():
+            pending_completion = get_object_or_404(PendingCompletion.objects.all(), receipt=receipt)
+        serializer = PendingCompletionSerializer(instance=pending_completion)
+        return Response({"completion": serializer.data})